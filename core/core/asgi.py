@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# Look up the scanner binaries once, before the first request
+from scanner.registry import get_registry  # noqa: E402
+
+get_registry()
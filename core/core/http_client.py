@@ -0,0 +1,198 @@
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+# The one HTTP client for outbound calls (geo lookups, email checks, SIEM collectors...).
+# One pooled session keeps connections to each host alive, at most HTTP_CLIENT_POOL_SIZE per
+# host. Idempotent requests are retried with exponential backoff and jitter on connection
+# errors and 429/5xx answers. A per-host circuit breaker fails fast while a dependency is down,
+# and per-host latency is recorded for http_stats().
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+LATENCY_SAMPLES = 200
+
+
+class CircuitOpen(requests.ConnectionError):
+    """
+    Raised without a request while the host's circuit is open. A RequestException, so callers
+    that handle network errors handle this too.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` failures in a row and rejects calls for `cooldown` seconds; then
+    one trial call is let through, which closes the circuit again or reopens it.
+    """
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'open' if time.monotonic() - self.opened_at < self.cooldown else 'half-open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def release(self):
+        # A call that ended without reaching the host (e.g. an invalid URL) proves nothing
+        with self.lock:
+            self.trial_running = False
+
+    def record(self, ok):
+        with self.lock:
+            self.trial_running = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.total_sec = 0.0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def as_dict(self):
+        recent = sorted(self.latencies)
+        def percentile(p):
+            return round(recent[min(len(recent) - 1, int(len(recent) * p))], 4) if recent else None
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "avg_sec": round(self.total_sec / self.requests, 4) if self.requests else None,
+            "p50_sec": percentile(0.5),
+            "p95_sec": percentile(0.95),
+            "max_sec": round(recent[-1], 4) if recent else None,
+        }
+
+
+class HttpClient:
+    def __init__(self, timeout, retries, backoff, pool_size, breaker_threshold, breaker_cooldown):
+        self.timeout = timeout
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        retry = Retry(
+            total=retries, connect=retries, read=retries, status=retries,
+            backoff_factor=backoff, backoff_jitter=backoff,
+            status_forcelist=RETRY_STATUSES, raise_on_status=False, respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.breakers = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def host_state(self, host):
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+                self.stats[host] = HostStats()
+            return self.breakers[host], self.stats[host]
+
+    def request(self, method, url, **kwargs):
+        """
+        requests.request() through the pool. A 5xx answer (after the retries) counts as a
+        failure for the circuit breaker, 4xx answers do not. Raises CircuitOpen while open.
+        """
+        host = urlsplit(url).netloc
+        breaker, stats = self.host_state(host)
+        if not breaker.allow():
+            with self.lock:
+                stats.rejected += 1
+            raise CircuitOpen(f"{host} is unavailable, not calling it for up to {self.breaker_cooldown} s")
+
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.finish(breaker, stats, start, ok=False)
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        self.finish(breaker, stats, start, ok=response.status_code < 500)
+        return response
+
+    def finish(self, breaker, stats, start, ok):
+        elapsed = time.monotonic() - start
+        breaker.record(ok)
+        with self.lock:
+            stats.requests += 1
+            stats.total_sec += elapsed
+            stats.latencies.append(elapsed)
+            if not ok:
+                stats.errors += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def host_stats(self):
+        with self.lock:
+            return {
+                host: {**stats.as_dict(), "circuit": self.breakers[host].state}
+                for host, stats in self.stats.items()
+            }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_http_client():
+    """
+    The client shared by every outbound call of this process.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient(
+                    timeout=(settings.HTTP_CLIENT_CONNECT_TIMEOUT, settings.HTTP_CLIENT_READ_TIMEOUT),
+                    retries=settings.HTTP_CLIENT_RETRIES,
+                    backoff=settings.HTTP_CLIENT_BACKOFF,
+                    pool_size=settings.HTTP_CLIENT_POOL_SIZE,
+                    breaker_threshold=settings.HTTP_CLIENT_BREAKER_THRESHOLD,
+                    breaker_cooldown=settings.HTTP_CLIENT_BREAKER_COOLDOWN,
+                )
+    return _client
+
+def http_get(url, **kwargs):
+    return get_http_client().get(url, **kwargs)
+
+def http_post(url, **kwargs):
+    return get_http_client().post(url, **kwargs)
+
+def http_stats():
+    return get_http_client().host_stats() if _client is not None else {}
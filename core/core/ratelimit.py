@@ -0,0 +1,243 @@
+import hashlib
+import math
+import threading
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+# Request rate limits and the guest scan quota, kept out of the session and the database.
+# A scope in RATELIMIT_RATES (e.g. 'contact': '5/h') is checked per client, keyed by IP
+# address or by a fingerprint of IP and browser headers, with one of two counters:
+#   sliding_window  at most N requests in any period, estimated from the counts of the
+#                   current and the previous fixed window (two numbers per client)
+#   token_bucket    a bucket of N tokens refilled evenly over the period: short bursts up to
+#                   N are fine, the sustained rate is N per period
+# RATELIMIT_BACKEND 'local' keeps the counters in this process under a lock, so every check
+# is atomic; each worker process then counts on its own. 'cache' keeps them in the Django
+# cache (RATELIMIT_CACHE), shared between processes with a shared cache backend: the sliding
+# window uses the cache's atomic incr, the token bucket is read and written without a lock.
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class RateError(ValueError):
+    pass
+
+
+def parse_rate(rate):
+    """
+    '5/m', '100/h', '3/d' or '10/15m' -> (limit, period in seconds).
+    """
+    try:
+        count, _, period = rate.partition('/')
+        unit = period[-1]
+        multiplier = int(period[:-1]) if period[:-1] else 1
+        return int(count), multiplier * UNITS[unit]
+    except (ValueError, KeyError, IndexError):
+        raise RateError(f"Invalid rate {rate!r}, expected e.g. 5/m, 100/h or 10/15m")
+
+def window_estimate(previous, current, period, now):
+    # The previous window's count weighted by how much of it the sliding period still covers
+    elapsed = now % period
+    return previous * (1 - elapsed / period) + current, elapsed
+
+def window_retry_after(previous, current, limit, period, elapsed, cost):
+    if current + cost > limit:
+        # Once this window is the previous one, its weight has to fall far enough
+        return period - elapsed + period * (1 - (limit - cost) / current)
+    excess = previous * (1 - elapsed / period) + current + cost - limit
+    return excess * period / previous
+
+
+class LocalBackend:
+    """
+    Counters in a dict of this process. Each check is one critical section.
+    """
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        # key -> [expires, state]; dicts keep insertion order, so the oldest keys come first
+        self.entries = {}
+
+    def prune(self, now):
+        expired = [key for key, (expires, _) in self.entries.items() if expires <= now]
+        for key in expired:
+            del self.entries[key]
+        while len(self.entries) >= self.max_keys:
+            del self.entries[next(iter(self.entries))]
+
+    def store(self, key, state, expires, now):
+        if key not in self.entries and len(self.entries) >= self.max_keys:
+            self.prune(now)
+        self.entries.pop(key, None)
+        self.entries[key] = [expires, state]
+
+    def sliding_window(self, key, limit, period, cost=1):
+        now = time.time()
+        index = int(now // period)
+        with self.lock:
+            entry = self.entries.get(key)
+            start, previous, current = entry[1] if entry and entry[0] > now else (index, 0, 0)
+            if start != index:
+                previous, current = (current if start == index - 1 else 0), 0
+            estimate, elapsed = window_estimate(previous, current, period, now)
+            allowed = estimate + cost <= limit
+            if allowed:
+                current += cost
+            self.store(key, (index, previous, current), (index + 2) * period, now)
+        remaining = max(0, int(limit - estimate - (cost if allowed else 0)))
+        retry_after = 0 if allowed else window_retry_after(previous, current, limit, period, elapsed, cost)
+        return allowed, remaining, retry_after
+
+    def token_bucket(self, key, capacity, period, cost=1):
+        now = time.time()
+        refill = capacity / period
+        with self.lock:
+            entry = self.entries.get(key)
+            tokens, updated = entry[1] if entry else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.store(key, (tokens, now), now + (capacity - tokens) / refill + 1, now)
+        retry_after = 0 if allowed else (cost - tokens) / refill
+        return allowed, int(tokens), retry_after
+
+
+class CacheBackend:
+    """
+    Counters in a Django cache, shared by every process using the same cache.
+    """
+    prefix = 'ratelimit'
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def sliding_window(self, key, limit, period, cost=1):
+        now = time.time()
+        index = int(now // period)
+        current_key = f"{self.prefix}:w:{key}:{index}"
+        self.cache.add(current_key, 0, 2 * period)
+        current = self.cache.incr(current_key, cost)
+        previous = self.cache.get(f"{self.prefix}:w:{key}:{index - 1}", 0)
+        estimate, elapsed = window_estimate(previous, current, period, now)
+        if estimate <= limit:
+            return True, max(0, int(limit - estimate)), 0
+        # Over the limit: this request does not count
+        current = self.cache.decr(current_key, cost)
+        return False, 0, window_retry_after(previous, current, limit, period, elapsed, cost)
+
+    def token_bucket(self, key, capacity, period, cost=1):
+        now = time.time()
+        refill = capacity / period
+        cache_key = f"{self.prefix}:b:{key}"
+        tokens, updated = self.cache.get(cache_key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.cache.set(cache_key, (tokens, now), math.ceil((capacity - tokens) / refill) + 1)
+        return allowed, int(tokens), 0 if allowed else (cost - tokens) / refill
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if settings.RATELIMIT_BACKEND == 'cache':
+                    _backend = CacheBackend(settings.RATELIMIT_CACHE)
+                else:
+                    _backend = LocalBackend(settings.RATELIMIT_MAX_KEYS)
+    return _backend
+
+
+def client_ip(request):
+    """
+    The address limits are keyed on. Behind RATELIMIT_TRUSTED_PROXIES reverse proxies it is the
+    X-Forwarded-For entry the outermost of them appended, counted from the right: entries
+    further left come from the client and can be anything.
+    """
+    proxies = settings.RATELIMIT_TRUSTED_PROXIES
+    if proxies:
+        forwarded = [entry.strip() for entry in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if entry.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+def client_fingerprint(request):
+    """
+    The IP address with the browser's User-Agent and Accept-Language, hashed: clients behind
+    one address (an office NAT) are told apart, at the price of being easier to reset.
+    """
+    raw = '|'.join((client_ip(request), request.META.get('HTTP_USER_AGENT', ''),
+                    request.META.get('HTTP_ACCEPT_LANGUAGE', '')))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+def user_or_ip(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return client_ip(request)
+
+KEY_FUNCTIONS = {
+    'ip': client_ip,
+    'fingerprint': client_fingerprint,
+    'user_or_ip': user_or_ip,
+}
+
+
+def hit(request, scope, key='ip', algorithm='sliding_window', cost=1):
+    """
+    Counts one request against the scope's rate. Returns (allowed, remaining, retry_after
+    seconds); always allowed when the scope has no rate.
+    """
+    rate = settings.RATELIMIT_RATES.get(scope)
+    if not rate:
+        return True, None, 0
+    limit, period = parse_rate(rate)
+    client = KEY_FUNCTIONS[key](request)
+    counter = getattr(get_backend(), algorithm)
+    return counter(f"{scope}:{client}", limit, period, cost)
+
+def limited_response(message, retry_after):
+    response = Response({"error": message}, status=429)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def check_rate(request, scope, key='ip', algorithm='sliding_window'):
+    """
+    A 429 Response when the client went over the scope's rate, otherwise None.
+    """
+    allowed, _, retry_after = hit(request, scope, key, algorithm)
+    if allowed:
+        return None
+    return limited_response("Too many requests, try again later.", retry_after)
+
+def ratelimit(scope, key='ip', algorithm='sliding_window'):
+    """
+    Decorator for APIView handler methods: answers 429 instead of calling the handler when
+    the client went over RATELIMIT_RATES[scope].
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            error = check_rate(request, scope, key, algorithm)
+            if error is not None:
+                return error
+            return handler(self, request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def use_guest_scan(request):
+    """
+    Takes one scan from an anonymous client's quota (RATELIMIT_RATES['guest_scan'], per
+    GUEST_SCAN_KEY). Returns (allowed, scans left, retry_after seconds).
+    """
+    return hit(request, 'guest_scan', settings.GUEST_SCAN_KEY)
@@ -138,10 +138,183 @@ REST_FRAMEWORK = {
     ],
 }
 
+# How scanner processes are started (scanner.executors): LocalExecutor on Linux scan hosts,
+# WSLExecutor from Windows, StubExecutor to never run real scanners.
+SCAN_EXECUTOR = {
+    'BACKEND': config('SCAN_EXECUTOR_BACKEND', default='scanner.executors.WSLExecutor'),
+    'OPTIONS': {},
+}
+# Directory of the tools that are not installed system-wide, and per scanner binary overrides
+# (scanner name -> path), see scanner.registry
+SCAN_TOOLS_DIR = config('SCAN_TOOLS_DIR', default='/home/armen/tools')
+SCAN_SCANNER_BINARIES = {}
+# testssl.sh, and the schemathesis CLI that the schemathesis scanner runs through bash -c
+SCAN_TESTSSL_PATH = config('SCAN_TESTSSL_PATH', default='/home/armen/testssl.sh/testssl.sh')
+SCAN_SCHEMATHESIS_PATH = config('SCAN_SCHEMATHESIS_PATH', default='/root/.local/bin/schemathesis')
+
+# Scan scheduler: at most SCAN_MAX_CONCURRENT scanner processes per server process,
+# with optional lower limits per scanner. Scans wait up to SCAN_QUEUE_TIMEOUT seconds for a slot.
+SCAN_MAX_CONCURRENT = config('SCAN_MAX_CONCURRENT', default=16, cast=int)
+SCAN_SCANNER_CONCURRENCY = {
+    'zmap': 2,
+    'nmap': 8,
+    'sqlmap': 4,
+    'nikto': 4,
+    'nuclei': 4,
+}
+SCAN_QUEUE_TIMEOUT = config('SCAN_QUEUE_TIMEOUT', default=300, cast=int)
+# Threads a multi-scanner request (MultiScanView) runs its scanners in; the others wait for a thread
+SCAN_MULTI_MAX_WORKERS = config('SCAN_MULTI_MAX_WORKERS', default=4, cast=int)
+# Times a queued job is started: a job still left "running" by a dead worker after that many is failed
+SCAN_JOB_MAX_ATTEMPTS = config('SCAN_JOB_MAX_ATTEMPTS', default=3, cast=int)
+
+# Sharded scans ("shard": true): targets are split into chunks of at most SCAN_SHARD_SIZE addresses
+# (per scanner), at most SCAN_MAX_SHARDS chunks per scan. A failed chunk runs up to SCAN_SHARD_ATTEMPTS times.
+SCAN_SHARD_SIZE = {
+    'nmap': 256,
+    'zmap': 65536,
+}
+SCAN_MAX_SHARDS = config('SCAN_MAX_SHARDS', default=1024, cast=int)
+SCAN_SHARD_ATTEMPTS = config('SCAN_SHARD_ATTEMPTS', default=3, cast=int)
+
+# Bulk scans (POST /api/scan/bulk/): targets per request, targets run at the same time by one job,
+# results inserted per batch, and the timeout of each target
+SCAN_BULK_MAX_TARGETS = config('SCAN_BULK_MAX_TARGETS', default=10000, cast=int)
+SCAN_BULK_CONCURRENCY = config('SCAN_BULK_CONCURRENCY', default=8, cast=int)
+SCAN_BULK_BATCH_SIZE = config('SCAN_BULK_BATCH_SIZE', default=100, cast=int)
+SCAN_BULK_TIMEOUT = config('SCAN_BULK_TIMEOUT', default=180, cast=int)
+
+# Scheduled scans (run_scan_scheduler): each run starts up to SCAN_SCHEDULE_JITTER seconds after its
+# cron time; runs missed while the scheduler was down are spread over SCAN_SCHEDULE_CATCHUP_WINDOW seconds.
+SCAN_SCHEDULE_JITTER = config('SCAN_SCHEDULE_JITTER', default=300, cast=int)
+SCAN_SCHEDULE_CATCHUP_WINDOW = config('SCAN_SCHEDULE_CATCHUP_WINDOW', default=600, cast=int)
+SCAN_SCHEDULE_MAX_PER_USER = config('SCAN_SCHEDULE_MAX_PER_USER', default=20, cast=int)
+
+# Limits of every scanner process: "default" applies to all scanners, a scanner's own entry
+# overrides single keys and None removes a limit. cpu_seconds, address_space_mb and open_files
+# are rlimits (applied with prlimit), nice and ionice_class ('idle', 'best-effort', 'realtime')
+# with ionice_level set the scheduling priority. Python pool workers run under their tool's limits.
+SCAN_RESOURCE_LIMITS = {
+    'default': {
+        'cpu_seconds': 900,
+        'address_space_mb': 4096,
+        'open_files': 1024,
+        'nice': 10,
+        'ionice_class': 'best-effort',
+        'ionice_level': 7,
+    },
+    # Many sockets at once
+    'zmap': {'open_files': 65536, 'nice': 5},
+    'nmap': {'open_files': 8192},
+    'sqlmap': {'cpu_seconds': 1800},
+    # Go reserves far more address space than it uses
+    'nuclei': {'address_space_mb': None, 'open_files': 8192},
+}
+
+# Seconds an identical scan (same scanner and arguments) is answered from cache.
+# Scanners not listed here always run.
+SCAN_CACHE_TTL = {
+    'ping': 60,
+    'traceroute': 300,
+    'whatweb': 300,
+    'dnsrecon': 600,
+}
+
+# Codec for ScanResult.output: 'zlib' or 'zstd' (needs the zstandard package)
+SCAN_OUTPUT_CODEC = config('SCAN_OUTPUT_CODEC', default='zlib')
+# Outputs above this many bytes go to a content-addressed file store instead of the table.
+# Keep SCAN_BLOB_ROOT outside MEDIA_ROOT, it must not be served publicly.
+SCAN_BLOB_THRESHOLD = config('SCAN_BLOB_THRESHOLD', default=64 * 1024, cast=int)
+SCAN_BLOB_ROOT = config('SCAN_BLOB_ROOT', default=str(BASE_DIR / 'scan_blobs'))
+# Repeated scans (same user, scanner and command) are stored as line deltas against the previous
+# one, with a full snapshot every SCAN_DELTA_SNAPSHOT_EVERY scans; 0 stores every output in full.
+SCAN_DELTA_SNAPSHOT_EVERY = config('SCAN_DELTA_SNAPSHOT_EVERY', default=10, cast=int)
+# Full-text index over scan outputs (scanner.search: FTS5 on SQLite, tsvector on Postgres).
+# Only the first SCAN_SEARCH_MAX_CHARS characters of an output are indexed.
+SCAN_SEARCH_ENABLED = config('SCAN_SEARCH_ENABLED', default=True, cast=bool)
+SCAN_SEARCH_MAX_CHARS = config('SCAN_SEARCH_MAX_CHARS', default=1_000_000, cast=int)
+# Scan history export (scanner.export): rows read per database round trip, and the characters
+# of output carried in each record's message.
+SCAN_EXPORT_CHUNK_SIZE = config('SCAN_EXPORT_CHUNK_SIZE', default=500, cast=int)
+SCAN_EXPORT_MESSAGE_LENGTH = config('SCAN_EXPORT_MESSAGE_LENGTH', default=1000, cast=int)
+# The server's egress IP and its geo data, stored with every scan (scanner.enrichment), are
+# looked up again after this many seconds, in the background.
+SCAN_EGRESS_TTL = config('SCAN_EGRESS_TTL', default=6 * 3600, cast=int)
+# Air-gapped deployments: a fixed egress IP instead of asking api.ipify.org, and an offline
+# geolocation database (scanner.geoip: a CSV range file, or .mmdb with the maxminddb package)
+# used instead of ipwho.is, with an LRU cache of SCAN_GEOIP_CACHE_SIZE addresses.
+SCAN_EGRESS_IP = config('SCAN_EGRESS_IP', default='')
+SCAN_GEOIP_DB = config('SCAN_GEOIP_DB', default='')
+SCAN_GEOIP_CACHE_SIZE = config('SCAN_GEOIP_CACHE_SIZE', default=4096, cast=int)
+# SIEM forwarding (`run_siem_forwarder`): the collector as tcp://host:514, udp://host:514 or an
+# http(s):// URL, the record format, events per batch, events buffered in memory, seconds to wait
+# for a batch to fill, the longest retry delay and the send timeout. SCAN_SIEM_AUTH_HEADER is
+# sent with HTTP batches, e.g. "Authorization: Bearer <token>".
+SCAN_SIEM_URL = config('SCAN_SIEM_URL', default='')
+SCAN_SIEM_FORMAT = config('SCAN_SIEM_FORMAT', default='syslog')
+SCAN_SIEM_BATCH_SIZE = config('SCAN_SIEM_BATCH_SIZE', default=200, cast=int)
+SCAN_SIEM_QUEUE_SIZE = config('SCAN_SIEM_QUEUE_SIZE', default=2000, cast=int)
+SCAN_SIEM_FLUSH_INTERVAL = config('SCAN_SIEM_FLUSH_INTERVAL', default=2.0, cast=float)
+SCAN_SIEM_BACKOFF_MAX = config('SCAN_SIEM_BACKOFF_MAX', default=300, cast=int)
+SCAN_SIEM_TIMEOUT = config('SCAN_SIEM_TIMEOUT', default=10, cast=int)
+SCAN_SIEM_AUTH_HEADER = config('SCAN_SIEM_AUTH_HEADER', default='')
+
+# Rate limits (core.ratelimit) as count/period (s, m, h, d, e.g. 10/15m), empty to switch one
+# off. 'scan' is a burst limit per user or IP on the scan endpoints, 'guest_scan' the quota
+# of anonymous scans per GUEST_SCAN_KEY ('ip' or 'fingerprint'). The 'local' backend counts
+# in each process, 'cache' in the RATELIMIT_CACHE cache (shared when that cache is).
+RATELIMIT_BACKEND = config('RATELIMIT_BACKEND', default='local')
+RATELIMIT_CACHE = config('RATELIMIT_CACHE', default='default')
+RATELIMIT_MAX_KEYS = config('RATELIMIT_MAX_KEYS', default=100000, cast=int)
+# Reverse proxies in front of the app that append to X-Forwarded-For; 0 keys clients on REMOTE_ADDR
+RATELIMIT_TRUSTED_PROXIES = config('RATELIMIT_TRUSTED_PROXIES', default=0, cast=int)
+RATELIMIT_RATES = {
+    'scan': config('RATELIMIT_SCAN', default='30/m'),
+    'guest_scan': config('RATELIMIT_GUEST_SCAN', default='3/d'),
+    'contact': config('RATELIMIT_CONTACT', default='5/h'),
+    'subscribe': config('RATELIMIT_SUBSCRIBE', default='10/h'),
+}
+GUEST_SCAN_KEY = config('GUEST_SCAN_KEY', default='ip')
+
+# Disposable email domains refused at registration (users.disposable): a list file checked
+# for changes every DISPOSABLE_EMAIL_RELOAD_INTERVAL seconds, held in a Bloom filter above
+# DISPOSABLE_EMAIL_BLOOM_THRESHOLD domains. DISPOSABLE_EMAIL_REMOTE_CHECK also asks
+# open.kickbox.com about unlisted domains in the background, caching answers for REMOTE_TTL seconds.
+DISPOSABLE_EMAIL_DOMAINS_FILE = config('DISPOSABLE_EMAIL_DOMAINS_FILE', default=str(BASE_DIR / 'users' / 'disposable_domains.txt'))
+DISPOSABLE_EMAIL_RELOAD_INTERVAL = config('DISPOSABLE_EMAIL_RELOAD_INTERVAL', default=300, cast=int)
+DISPOSABLE_EMAIL_BLOOM_THRESHOLD = config('DISPOSABLE_EMAIL_BLOOM_THRESHOLD', default=500000, cast=int)
+DISPOSABLE_EMAIL_REMOTE_CHECK = config('DISPOSABLE_EMAIL_REMOTE_CHECK', default=False, cast=bool)
+DISPOSABLE_EMAIL_REMOTE_TTL = config('DISPOSABLE_EMAIL_REMOTE_TTL', default=7 * 24 * 3600, cast=int)
+
+# Outbound HTTP (core.http_client): connect/read timeouts in seconds, retries of idempotent
+# requests (backoff factor in seconds, with as much jitter), connections kept per host, and
+# the circuit breaker: failures in a row before a host is skipped, and for how many seconds.
+HTTP_CLIENT_CONNECT_TIMEOUT = config('HTTP_CLIENT_CONNECT_TIMEOUT', default=3.05, cast=float)
+HTTP_CLIENT_READ_TIMEOUT = config('HTTP_CLIENT_READ_TIMEOUT', default=10, cast=float)
+HTTP_CLIENT_RETRIES = config('HTTP_CLIENT_RETRIES', default=2, cast=int)
+HTTP_CLIENT_BACKOFF = config('HTTP_CLIENT_BACKOFF', default=0.3, cast=float)
+HTTP_CLIENT_POOL_SIZE = config('HTTP_CLIENT_POOL_SIZE', default=10, cast=int)
+HTTP_CLIENT_BREAKER_THRESHOLD = config('HTTP_CLIENT_BREAKER_THRESHOLD', default=5, cast=int)
+HTTP_CLIENT_BREAKER_COOLDOWN = config('HTTP_CLIENT_BREAKER_COOLDOWN', default=30, cast=int)
+
+# Python tools run by pre-started interpreters (scanner.python_pool): scanner name -> modules
+# imported once per worker. Workers are replaced after SCAN_PYTHON_POOL_MAX_JOBS jobs; a size of 0 disables the pool.
+SCAN_PYTHON_POOL = {
+    "xssstrike": ["requests", "urllib3", "core.config", "core.utils", "core.requester"],
+    "dnsscan": ["dns.resolver", "dns.query", "dns.zone"],
+    "gitdumper": ["requests", "dulwich.index", "bs4", "socks"],
+}
+SCAN_PYTHON_POOL_SIZE = config('SCAN_PYTHON_POOL_SIZE', default=2, cast=int)
+SCAN_PYTHON_POOL_MAX_JOBS = config('SCAN_PYTHON_POOL_MAX_JOBS', default=25, cast=int)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Workers and background threads (e.g. scanner.enrichment) write concurrently; taking the
+        # write lock when a transaction starts makes them wait for each other instead of failing
+        # with "database is locked"
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
     }
 }
 
@@ -232,3 +405,13 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 DEFAULT_TO_EMAIL = EMAIL_HOST_USER
 CONTACT_EMAIL = EMAIL_HOST_USER
+
+# Outbox of transactional email (main.outbox), sent by the run_email_sender worker: messages
+# per claimed batch, per second, attempts before a message is marked failed, longest retry
+# delay and how long a claimed batch stays with one worker (all in seconds).
+EMAIL_OUTBOX_BATCH_SIZE = config('EMAIL_OUTBOX_BATCH_SIZE', default=50, cast=int)
+EMAIL_OUTBOX_RATE = config('EMAIL_OUTBOX_RATE', default=5, cast=float)
+EMAIL_OUTBOX_MAX_ATTEMPTS = config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=8, cast=int)
+EMAIL_OUTBOX_BACKOFF_MAX = config('EMAIL_OUTBOX_BACKOFF_MAX', default=3600, cast=int)
+EMAIL_OUTBOX_CLAIM_TIMEOUT = config('EMAIL_OUTBOX_CLAIM_TIMEOUT', default=600, cast=int)
+EMAIL_OUTBOX_POLL_INTERVAL = config('EMAIL_OUTBOX_POLL_INTERVAL', default=2.0, cast=float)
@@ -136,3 +136,11 @@ class LandingSliderAdmin(admin.ModelAdmin):
     list_display = ['__str__', 'is_published', 'time_create', 'time_update']
     readonly_fields = ['time_create', 'time_update']
     list_filter = ['is_published', 'time_create']
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'recipients')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    ordering = ('-created_at',)
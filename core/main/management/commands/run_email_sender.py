@@ -0,0 +1,29 @@
+import signal
+from django.core.management.base import BaseCommand
+from main.models import OutboundEmail
+from main.outbox import EmailSender
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends the queued transactional email (OutboundEmail) in batches over one SMTP "
+        "connection, retrying failed messages with backoff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Messages per batch (default: EMAIL_OUTBOX_BATCH_SIZE)")
+        parser.add_argument('--rate', type=float, help="Messages per second, 0 for no limit (default: EMAIL_OUTBOX_RATE)")
+        parser.add_argument('--poll-interval', type=float, help="Seconds between checks for new messages")
+        parser.add_argument('--once', action='store_true', help="Send what is due now and exit")
+
+    def handle(self, *args, **options):
+        sender = EmailSender(batch_size=options['batch_size'], rate=options['rate'], poll_interval=options['poll_interval'])
+        signal.signal(signal.SIGTERM, lambda signum, frame: sender.stop())
+        pending = OutboundEmail.objects.filter(status=OutboundEmail.STATUS_PENDING).count()
+        self.stdout.write(f"Sending queued email, {pending} pending")
+        try:
+            sent = sender.run(once=options['once'])
+        except KeyboardInterrupt:
+            sender.stop()
+            sent = None
+        self.stdout.write("Stopped" + (f", {sent} message(s) sent" if sent is not None else ""))
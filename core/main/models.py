@@ -1,5 +1,6 @@
 # models.py
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
 from ckeditor.fields import RichTextField
 from django.contrib.auth import get_user_model
@@ -378,4 +379,41 @@ class Subscriber(models.Model):
     subscribed_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return self.email
\ No newline at end of file
+        return self.email
+
+class OutboundEmail(models.Model):
+    """
+    A message waiting for main.outbox.EmailSender. Requests only insert rows here, the SMTP
+    conversation happens in the run_email_sender worker.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # When a pending message may be sent (again), or when a claim of a sending one runs out
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Outbound Email"
+        verbose_name_plural = "Outbound Emails"
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='main_outbox_due_idx')]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)}"
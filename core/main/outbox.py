@@ -0,0 +1,185 @@
+import logging
+import random
+import smtplib
+import threading
+import time
+from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.template.loader import get_template
+from django.utils import timezone
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# Transactional email goes through the OutboundEmail table: a view calls queue_email() inside
+# its transaction, so the message is stored together with the user or subscriber it is about
+# and the response does not wait for SMTP. EmailSender (the run_email_sender command) sends
+# the due messages in batches over one SMTP connection that stays open while there is work,
+# at most EMAIL_OUTBOX_RATE messages per second, and retries failed ones with exponential
+# backoff up to EMAIL_OUTBOX_MAX_ATTEMPTS times.
+# A batch is claimed by marking it sending until now + EMAIL_OUTBOX_CLAIM_TIMEOUT; a claim
+# left behind by a stopped worker runs out and the messages are sent again.
+
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+@lru_cache(maxsize=64)
+def email_template(name):
+    # Compiled once per process, also when DEBUG turns off Django's cached template loader
+    return get_template(name)
+
+def render_email(name, context):
+    return email_template(name).render(context)
+
+def queue_email(subject, body, recipients, from_email=None, html_body=''):
+    """
+    Stores a message for the sender worker and returns it.
+    """
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+
+def backoff_delay(attempts, maximum):
+    # 30 s, 1 min, 2 min, ... up to `maximum`, with jitter
+    return min(maximum, 30 * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+def build_message(email, smtp_connection):
+    message = EmailMultiAlternatives(
+        email.subject, email.body, email.from_email, email.recipients, connection=smtp_connection
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, "text/html")
+    return message
+
+
+class EmailSender:
+    def __init__(self, batch_size=None, rate=None, poll_interval=None):
+        self.batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+        rate = settings.EMAIL_OUTBOX_RATE if rate is None else rate
+        self.min_interval = 1.0 / rate if rate else 0
+        self.poll_interval = settings.EMAIL_OUTBOX_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.stopping = threading.Event()
+        self.smtp = None
+        self.last_send = 0.0
+
+    def claim(self):
+        """
+        Marks up to batch_size due messages as sending and returns them.
+        """
+        now = timezone.now()
+        due = Q(status=OutboundEmail.STATUS_PENDING) | Q(status=OutboundEmail.STATUS_SENDING)
+        with transaction.atomic():
+            rows = OutboundEmail.objects.filter(due, next_attempt_at__lte=now).order_by('next_attempt_at', 'pk')
+            if connection.features.has_select_for_update_skip_locked:
+                rows = rows.select_for_update(skip_locked=True)
+            batch = list(rows[:self.batch_size])
+            OutboundEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+                status=OutboundEmail.STATUS_SENDING,
+                next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT),
+            )
+        return batch
+
+    def open(self):
+        if self.smtp is None:
+            self.smtp = get_connection(fail_silently=False)
+            self.smtp.open()
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.close()
+            except Exception:
+                logger.warning("Closing the SMTP connection failed", exc_info=True)
+            self.smtp = None
+
+    def throttle(self):
+        wait = self.last_send + self.min_interval - time.monotonic()
+        if wait > 0:
+            self.stopping.wait(wait)
+        self.last_send = time.monotonic()
+
+    def deliver(self, email):
+        """
+        Sends one message, reconnecting once if the server dropped the connection.
+        """
+        for reconnect in (False, True):
+            self.open()
+            try:
+                build_message(email, self.smtp).send()
+                return
+            except smtplib.SMTPServerDisconnected:
+                self.close()
+                if reconnect:
+                    raise
+
+    def send_batch(self, batch):
+        """
+        Sends a claimed batch and records the outcome of each message. Returns the number sent.
+        """
+        sent = 0
+        for index, email in enumerate(batch):
+            if self.stopping.is_set():
+                # Unsent messages go back to the queue right away
+                OutboundEmail.objects.filter(pk__in=[e.pk for e in batch[index:]]).update(
+                    status=OutboundEmail.STATUS_PENDING, next_attempt_at=timezone.now()
+                )
+                break
+            self.throttle()
+            try:
+                self.deliver(email)
+            except MESSAGE_ERRORS as e:
+                # The server refused this message, the connection is still good
+                self.failed(email, e)
+                continue
+            except Exception as e:
+                self.close()
+                self.failed(email, e)
+                continue
+            OutboundEmail.objects.filter(pk=email.pk).update(
+                status=OutboundEmail.STATUS_SENT, sent_at=timezone.now(), attempts=email.attempts + 1, last_error=''
+            )
+            sent += 1
+        return sent
+
+    def failed(self, email, error):
+        attempts = email.attempts + 1
+        if attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            logger.error("Giving up on email %s to %s after %s attempts: %s", email.pk, email.recipients, attempts, error)
+            fields = dict(status=OutboundEmail.STATUS_FAILED)
+        else:
+            delay = backoff_delay(attempts, settings.EMAIL_OUTBOX_BACKOFF_MAX)
+            logger.warning("Email %s to %s failed (%s), retrying in %.0f s", email.pk, email.recipients, error, delay)
+            fields = dict(status=OutboundEmail.STATUS_PENDING, next_attempt_at=timezone.now() + timedelta(seconds=delay))
+        OutboundEmail.objects.filter(pk=email.pk).update(attempts=attempts, last_error=str(error), **fields)
+
+    def run(self, once=False):
+        """
+        Sends due messages until stop() is called, or with once=True until none is due.
+        The SMTP connection is closed whenever the queue runs empty. Returns the number sent.
+        """
+        sent = 0
+        try:
+            while not self.stopping.is_set():
+                batch = self.claim()
+                if batch:
+                    sent += self.send_batch(batch)
+                    continue
+                self.close()
+                if once:
+                    break
+                self.stopping.wait(self.poll_interval)
+                close_old_connections()
+        finally:
+            self.close()
+        return sent
+
+    def stop(self):
+        self.stopping.set()
@@ -1,3 +1,92 @@
-from django.test import TestCase
+import smtplib
+from datetime import timedelta
+from unittest import mock
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from core import ratelimit
+from .models import OutboundEmail
+from .outbox import EmailSender, backoff_delay, queue_email
 
-# Create your tests here.
+
+class OutboxTests(TestCase):
+    def send(self):
+        return EmailSender(rate=0, poll_interval=0).run(once=True)
+
+    def refused(self):
+        return mock.patch.object(EmailSender, 'deliver', side_effect=smtplib.SMTPRecipientsRefused({}))
+
+    def make_due(self, email):
+        OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+
+    def test_queued_message_is_sent(self):
+        email = queue_email('Welcome', 'Hello', ['a@example.com'], html_body='<p>Hello</p>')
+        self.assertEqual(self.send(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['a@example.com'])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.STATUS_SENT, 1))
+        self.assertIsNotNone(email.sent_at)
+        self.assertEqual(self.send(), 0)
+
+    def test_failed_message_is_retried_after_a_backoff(self):
+        email = queue_email('Welcome', 'Hello', ['a@example.com'])
+        with self.refused(), self.assertLogs('main.outbox', 'WARNING'):
+            self.assertEqual(self.send(), 0)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.STATUS_PENDING, 1))
+        delay = (email.next_attempt_at - timezone.now()).total_seconds()
+        self.assertTrue(10 < delay <= 30)
+        # Not due yet
+        self.assertEqual(self.send(), 0)
+        self.make_due(email)
+        self.assertEqual(self.send(), 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.last_error), (OutboundEmail.STATUS_SENT, 2, ''))
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_message_fails_after_the_last_attempt(self):
+        email = queue_email('Welcome', 'Hello', ['a@example.com'])
+        with self.refused(), self.assertLogs('main.outbox', 'WARNING'):
+            self.send()
+            self.make_due(email)
+            self.send()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.STATUS_FAILED, 2))
+        self.make_due(email)
+        self.assertEqual(self.send(), 0)
+
+    def test_expired_claim_is_sent_again(self):
+        email = queue_email('Welcome', 'Hello', ['a@example.com'])
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            status=OutboundEmail.STATUS_SENDING, next_attempt_at=timezone.now() + timedelta(minutes=5)
+        )
+        self.assertEqual(self.send(), 0)
+        self.make_due(email)
+        self.assertEqual(self.send(), 1)
+
+    def test_backoff_grows_up_to_the_maximum(self):
+        for attempts, low, high in ((1, 15, 30), (3, 60, 120), (20, 1800, 3600)):
+            for _ in range(20):
+                self.assertTrue(low <= backoff_delay(attempts, 3600) <= high)
+
+
+@override_settings(RATELIMIT_RATES={'contact': '2/h'}, RATELIMIT_BACKEND='cache')
+class ContactRateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit._backend = None
+        self.addCleanup(setattr, ratelimit, '_backend', None)
+
+    def post(self, remote_addr):
+        data = {'name': 'A', 'email': 'a@example.com', 'message': 'Hi'}
+        return self.client.post('/api/contact/', data, content_type='application/json', REMOTE_ADDR=remote_addr)
+
+    def test_contact_form_is_limited_per_address(self):
+        self.assertEqual([self.post('10.0.0.1').status_code for _ in range(3)], [201, 201, 429])
+        response = self.post('10.0.0.1')
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(self.post('10.0.0.2').status_code, 201)
+        self.assertEqual(OutboundEmail.objects.count(), 3)
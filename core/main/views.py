@@ -1,10 +1,13 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework import status
 from rest_framework.generics import RetrieveAPIView
 from .models import  *
 from .serializers import *
 from django.shortcuts import get_object_or_404
-from django.core.mail import send_mail
+from django.db import transaction
+from .outbox import queue_email
+from core.ratelimit import ratelimit
 from rest_framework.permissions import AllowAny
 from django.conf import settings
 
@@ -107,10 +110,10 @@ class AboutView(APIView):
 class ContactFormAPIView(APIView):
     permission_classes = [AllowAny]
 
+    @ratelimit('contact')
     def post(self, request):
         serializer = ContactMessageSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
             name = serializer.validated_data["name"]
             email = serializer.validated_data["email"]
             message = serializer.validated_data["message"]
@@ -118,13 +121,9 @@ class ContactFormAPIView(APIView):
             subject = f"New Contact Message from {name}"
             full_message = f"From: {name} <{email}>\n\nMessage:\n{message}"
 
-            send_mail(
-                subject,
-                full_message,
-                settings.EMAIL_HOST_USER,
-                [settings.DEFAULT_TO_EMAIL],
-                fail_silently=False,
-            )
+            with transaction.atomic():
+                serializer.save()
+                queue_email(subject, full_message, [settings.DEFAULT_TO_EMAIL], from_email=settings.EMAIL_HOST_USER)
 
             return Response({"detail": "Message received successfully."}, status=201)
         return Response(serializer.errors, status=400)
@@ -136,18 +135,17 @@ class TeamServiceListAPIView(APIView):
         return Response(serializer.data)
     
 class SubscribeView(APIView):
+    @ratelimit('subscribe')
     def post(self, request):
         serializer = SubscriberSerializer(data=request.data)
         if serializer.is_valid():
-            subscriber = serializer.save()
-
-            send_mail(
-                subject="New subscriber",
-                message=f"New email subscribed: {subscriber.email}",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[settings.CONTACT_EMAIL],
-                fail_silently=True,
-            )
+            with transaction.atomic():
+                subscriber = serializer.save()
+                queue_email(
+                    "New subscriber",
+                    f"New email subscribed: {subscriber.email}",
+                    [settings.CONTACT_EMAIL],
+                )
             return Response({"message": "Subscribed successfully!"}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
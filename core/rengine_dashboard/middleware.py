@@ -1,9 +1,23 @@
 # iam/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from .permissions import get_current_firm
 
 class CurrentFirmMiddleware:
+    # async-capable, otherwise Django runs every async view behind it in one sync thread
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         request.current_firm = get_current_firm(request)
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.current_firm = await sync_to_async(get_current_firm)(request)
+        return await self.get_response(request)
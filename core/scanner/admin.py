@@ -4,12 +4,14 @@ from .models import *
 
 @admin.register(ScanResult)
 class ScanResultAdmin(admin.ModelAdmin):
-    list_display = ('user', 'scanner', 'command', 'ip_address', 'city', 'region', 'address', 'created_at' , 'download_cef_link')
+    list_display = ('user', 'scanner', 'command', 'output_size', 'ip_address', 'city', 'region', 'address', 'created_at' , 'download_cef_link')
+    list_select_related = ('user',)
     
     readonly_fields = (
-        'user', 'scanner', 'command', 'output', 'ip_address', 'mac_address',
+        'user', 'scanner', 'command', 'output', 'output_size', 'output_hash', 'exit_code', 'cpu_user_sec',
+        'cpu_system_sec', 'max_rss_kb', 'ip_address', 'mac_address',
         'country', 'region_code', 'continent_code', 'timezone', 'utc_offset',
-        'latitude', 'longitude', 'org', 'asn', 'created_at', 'location_map', 'address' , 'download_cef_link'
+        'latitude', 'longitude', 'org', 'asn', 'cached_from', 'created_at', 'location_map', 'address' , 'download_cef_link'
     )
 
     def location_map(self, obj):
@@ -27,6 +29,10 @@ class ScanResultAdmin(admin.ModelAdmin):
             """)
         return "Нет координат"
 
+    def get_queryset(self, request):
+        # The changelist never shows the output, only the change view decompresses it on access
+        return super().get_queryset(request).defer('output_data')
+
     location_map.short_description = "Местоположение на карте"
 
     class Media:
@@ -41,4 +47,56 @@ class ScanResultAdmin(admin.ModelAdmin):
         return mark_safe(
             f'<a href="/download-cef/{obj.id}/" target="_blank">📄 Скачать в CEF</a>'
         )
-    download_cef_link.short_description = "CEF"
\ No newline at end of file
+    download_cef_link.short_description = "CEF"
+
+@admin.register(ScanJob)
+class ScanJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'scanner', 'status', 'shard_index', 'attempts', 'worker', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('status', 'scanner')
+    readonly_fields = (
+        'id', 'user', 'scanner', 'args', 'timeout', 'status', 'result', 'error', 'error_output',
+        'duration_sec', 'worker', 'created_at', 'started_at', 'finished_at',
+        'parent', 'shard_index', 'shard_count', 'attempts'
+    )
+    raw_id_fields = ('parent',)
+
+@admin.register(ScanJobTarget)
+class ScanJobTargetAdmin(admin.ModelAdmin):
+    list_display = ('target', 'job', 'index', 'status', 'duration_sec')
+    list_filter = ('status',)
+    search_fields = ('target',)
+    raw_id_fields = ('job', 'result')
+
+@admin.register(ScheduledScan)
+class ScheduledScanAdmin(admin.ModelAdmin):
+    list_display = ('user', 'name', 'scanner', 'cron', 'enabled', 'next_run_at', 'last_run_at', 'runs', 'skipped_runs')
+    list_filter = ('enabled', 'scanner')
+    search_fields = ('name', 'user__username')
+    readonly_fields = ('last_run_at', 'last_job', 'last_error', 'runs', 'skipped_runs', 'created_at')
+    raw_id_fields = ('user',)
+
+@admin.register(SiemCursor)
+class SiemCursorAdmin(admin.ModelAdmin):
+    # last_id can be edited to replay or skip events
+    list_display = ('name', 'last_id', 'sent', 'last_error', 'updated_at')
+    readonly_fields = ('sent', 'last_error', 'updated_at')
+
+class ScanPortInline(admin.TabularInline):
+    model = ScanPort
+    fields = ('port', 'protocol', 'state', 'reason')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+@admin.register(ScanHost)
+class ScanHostAdmin(admin.ModelAdmin):
+    list_display = ('address', 'hostname', 'state', 'scan')
+    list_select_related = ('scan__user',)
+    list_filter = ('state',)
+    search_fields = ('address', 'hostname')
+    raw_id_fields = ('scan',)
+    inlines = [ScanPortInline]
+
+    def get_queryset(self, request):
+        # The scan column only needs its user and date, not the scan output
+        return super().get_queryset(request).defer('scan__output_data')
@@ -0,0 +1,158 @@
+import asyncio
+import shlex
+import logging
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.views import APIView
+from .services import aexecute_scan
+from .views import MultiScanView
+from .scheduler import SchedulerTimeout, user_key_for
+from users.models import Subscription
+from core.ratelimit import check_rate
+
+logger = logging.getLogger(__name__)
+
+# These views are plain async Django views: under ASGI (core/asgi.py) a scan waiting on
+# its subprocess costs a coroutine instead of a worker thread. DRF authentication and
+# parsing still run, in a thread, through a throwaway instance of the matching sync view;
+# their APIExceptions (401, 403, unparsable body) are answered like DRF would.
+
+
+def as_json_response(response):
+    json_response = JsonResponse(response.data, status=response.status_code, safe=False)
+    if response.has_header('Retry-After'):
+        json_response['Retry-After'] = response['Retry-After']
+    return json_response
+
+def initialize_drf_request(request, view_class=APIView):
+    """
+    The DRF request, authenticated and checked against view_class's permissions.
+    Raises APIException like the sync view would.
+    """
+    view = view_class()
+    drf_request = view.initialize_request(request)
+    view.request = drf_request
+    view.perform_authentication(drf_request)  # runs the authenticators while we are still in a thread
+    view.check_permissions(drf_request)
+    return drf_request
+
+def api_error_response(error):
+    return JsonResponse({"error": error.detail}, status=error.status_code)
+
+
+def make_async_scan_view(scan_view):
+    """
+    Builds the async variant of a view created by scanner.views.make_scan_view.
+    """
+    config = scan_view.scanner_config
+    name = config["name"]
+    timeout = config["timeout"]
+
+    @method_decorator(csrf_exempt, name='dispatch')
+    class AsyncScanView(View):
+        http_method_names = ['post']
+
+        @staticmethod
+        def prepare(request):
+            drf_request = initialize_drf_request(request, scan_view)
+            error = check_rate(drf_request, 'scan', 'user_or_ip', 'token_bucket')
+            if error:
+                return None, None, error
+            args, error = scan_view.get_scan_args(drf_request)
+            if error:
+                return None, None, error
+            user, error = scan_view.charge_attempt(drf_request)
+            return user, args, error
+
+        async def post(self, request):
+            try:
+                user, args, error = await sync_to_async(self.prepare)(request)
+                if error:
+                    return as_json_response(error)
+
+                result, cached = await aexecute_scan(name, args, timeout, user, user_key_for(user, request))
+
+                return JsonResponse({
+                    "output": result["output"],
+                    "error_output": result["error_output"],
+                    "duration_sec": result["duration_sec"],
+                    "cached": cached,
+                })
+
+            except APIException as e:
+                return api_error_response(e)
+            except asyncio.TimeoutError:
+                return JsonResponse({"error": f"{name} scan timed out"}, status=408)
+            except SchedulerTimeout as e:
+                return JsonResponse({"error": str(e)}, status=503)
+            except Exception as e:
+                return JsonResponse({"error": str(e)}, status=500)
+
+    AsyncScanView.__name__ = f"Async{scan_view.__name__}"
+    return AsyncScanView
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncMultiScanView(View):
+    http_method_names = ['post']
+
+    @staticmethod
+    def prepare(request):
+        drf_request = initialize_drf_request(request, MultiScanView)
+        error = check_rate(drf_request, 'scan', 'user_or_ip', 'token_bucket')
+        if error:
+            return None, None, None, None, as_json_response(error)
+        command = drf_request.data.get('command')
+        scanners = drf_request.data.get('scanners', [])
+
+        if not command or not scanners:
+            return None, None, None, None, JsonResponse({"error": "Command and scanners are required"}, status=400)
+
+        if isinstance(scanners, str):
+            scanners = [scanners]
+
+        try:
+            args = shlex.split(command)
+        except ValueError as e:
+            return None, None, None, None, JsonResponse({"error": f"Invalid command: {e}"}, status=400)
+
+        user = drf_request.user if drf_request.user.is_authenticated else None
+        if user:
+            subscription = Subscription.objects.filter(user=user).first()
+            if not subscription or not subscription.is_active():
+                return None, None, None, None, JsonResponse({"error": "No active subscription found."}, status=403)
+
+        return user, args, scanners, user_key_for(user, request), None
+
+    async def post(self, request):
+        try:
+            user, args, scanners, user_key, error = await sync_to_async(self.prepare)(request)
+        except APIException as e:
+            return api_error_response(e)
+        if error:
+            return error
+
+        results = await asyncio.gather(*(self.run_scan(scanner, args, user, user_key) for scanner in scanners))
+        return JsonResponse({"results": list(results)})
+
+    async def run_scan(self, scanner, args, user, user_key):
+        try:
+            scan_args = MultiScanView.get_scan_args(scanner, args)
+            if scan_args is None:
+                return {"scanner": scanner, "error": "Unsupported scanner"}
+
+            result, cached = await aexecute_scan(scanner, scan_args, 120, user, user_key)
+
+            return {"scanner": scanner, "output": result["output"], "error_output": result["error_output"], "cached": cached}
+
+        except asyncio.TimeoutError:
+            return {"scanner": scanner, "error": f"{scanner} scan timed out"}
+        except SchedulerTimeout as e:
+            return {"scanner": scanner, "error": str(e)}
+        except Exception as e:
+            logger.error(f"Error with scanner {scanner}: {e}")
+            return {"scanner": scanner, "error": f"Error running {scanner}: {str(e)}"}
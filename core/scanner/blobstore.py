@@ -0,0 +1,94 @@
+import hashlib
+import mmap
+import os
+import tempfile
+from pathlib import Path
+from django.conf import settings
+from .compression import compress_text, decompress_text, resolve_codec
+
+# Scan outputs larger than settings.SCAN_BLOB_THRESHOLD bytes are kept as files named by
+# the SHA-256 of their text, so identical outputs are stored once. Files hold the output
+# compressed with the codec recorded on the ScanBlob row.
+# A writer registers the blob (the `claim` callback, ScanBlob.touch) before it looks for the
+# file, and gc_scan_blobs moves a file aside before it checks that no row took the blob in
+# the meantime: either the writer finds the file gone and writes it again, or gc finds the
+# row and puts the file back.
+
+
+def blob_root():
+    return Path(settings.SCAN_BLOB_ROOT)
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def blob_path(blob_hash):
+    return blob_root() / blob_hash[:2] / blob_hash[2:4] / blob_hash
+
+def write_blob(text, codec, claim):
+    """
+    Stores text unless a blob with the same content already exists. claim(hash, size, codec)
+    registers the blob and returns the codec its file is (to be) stored with.
+    Returns (hash, size of the text in bytes, codec of the file).
+    """
+    data = text.encode('utf-8')
+    blob_hash = content_hash(data)
+    path = blob_path(blob_hash)
+    codec_used = claim(blob_hash, len(data), resolve_codec(codec))
+    if not path.exists():
+        codec_used, compressed = compress_text(text, codec_used)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write next to the final name and rename, readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    return blob_hash, len(data), codec_used
+
+def read_blob(blob_hash, codec):
+    path = blob_path(blob_hash)
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ''
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return decompress_text(codec, mapped)
+
+def delete_blob(blob_hash):
+    try:
+        os.unlink(blob_path(blob_hash))
+    except FileNotFoundError:
+        pass
+
+def delete_blob_unless(blob_hash, in_use):
+    """
+    Deletes a blob file unless in_use() turns true once the file has been moved aside.
+    Returns whether it was deleted.
+    """
+    path = blob_path(blob_hash)
+    aside = path.with_name(f'.tmp-gc-{blob_hash}')
+    try:
+        os.replace(path, aside)
+    except FileNotFoundError:
+        return False
+    if in_use():
+        try:
+            # Back in place, unless a writer already stored it again
+            os.link(aside, path)
+        except FileExistsError:
+            pass
+        os.unlink(aside)
+        return False
+    os.unlink(aside)
+    return True
+
+def iter_blob_files():
+    root = blob_root()
+    if not root.exists():
+        return
+    for path in root.glob('*/*/*'):
+        if path.is_file() and not path.name.startswith('.tmp-'):
+            yield path
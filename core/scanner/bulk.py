@@ -0,0 +1,145 @@
+import logging
+import subprocess
+import concurrent.futures
+from collections import Counter
+from time import time
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .deltas import chain_key
+from .models import ScanBlob, ScanJob, ScanJobTarget, ScanResult
+from .registry import get_scanner
+from .services import run_tool, scan_result_fields
+from .scheduler import SchedulerTimeout, scan_slot, user_key_for
+from .processes import ScanCancelled
+from . import enrichment, nmap_results, search
+
+logger = logging.getLogger(__name__)
+
+# Bulk scans: one job, one scanner, many targets. The targets run SCAN_BULK_CONCURRENCY at a
+# time, the server's geo lookup is done once per job and results are inserted in batches.
+
+
+def enqueue_bulk_scan(user, name, options, targets, timeout):
+    """
+    options are the user's arguments shared by every target, timeout applies per target.
+    """
+    with transaction.atomic():
+        job = ScanJob.objects.create(
+            user=user, scanner=name, scanner_key=name, args=list(options), timeout=timeout,
+            target_count=len(targets),
+        )
+        ScanJobTarget.objects.bulk_create(
+            [ScanJobTarget(job=job, index=index, target=target) for index, target in enumerate(targets)],
+            batch_size=settings.SCAN_BULK_BATCH_SIZE,
+        )
+    return job
+
+def run_target(job, item, fields, user_key, cancel):
+    """
+    Runs the scanner against one target. Returns (item, unsaved ScanResult or None, nmap hosts).
+    """
+    args = get_scanner(job.scanner).scan_args(list(job.args) + [item.target])
+    try:
+        with nmap_results.xml_report(job.scanner, args) as (run_args, report):
+            with scan_slot(job.scanner, user_key, cancel):
+                result, duration = run_tool(job.scanner, run_args, job.timeout, cancel)
+            hosts = report.hosts()
+    except subprocess.TimeoutExpired:
+        item.status, item.error = ScanJob.STATUS_FAILED, f"{job.scanner} scan timed out"
+        return item, None, []
+    except ScanCancelled:
+        item.status, item.error = ScanJob.STATUS_CANCELLED, "Cancelled"
+        return item, None, []
+    except SchedulerTimeout as e:
+        item.status, item.error = ScanJob.STATUS_FAILED, str(e)
+        return item, None, []
+    except Exception as e:
+        logger.exception("Bulk job %s: %s failed", job.pk, item.target)
+        item.status, item.error = ScanJob.STATUS_FAILED, str(e)
+        return item, None, []
+
+    item.status = ScanJob.STATUS_DONE
+    item.error_output = result.stderr or ''
+    item.duration_sec = duration
+    scan = ScanResult(**fields, command=' '.join(args), output=result.stdout, **(result.usage or {}))
+    return item, scan, hosts
+
+def chain_rounds(scans):
+    """
+    Splits unsaved rows into insert rounds holding at most one row per chain, so a row of a
+    chain that occurs twice in a batch links to the one inserted in the round before.
+    """
+    rounds = []
+    seen = Counter()
+    for scan in scans:
+        index = 0
+        if scan.user_id:
+            key = chain_key(scan.user_id, scan.scanner, scan.command)
+            index = seen[key]
+            seen[key] += 1
+        if index == len(rounds):
+            rounds.append([])
+        rounds[index].append(scan)
+    return rounds
+
+def save_batch(rows):
+    """
+    Inserts the results of finished targets with bulk_create (one per chain_rounds() round,
+    usually a single one) and records them on the targets.
+    """
+    if not rows:
+        return
+    with transaction.atomic():
+        scans = []
+        for batch in chain_rounds([scan for _, scan, _ in rows if scan is not None]):
+            for scan in batch:
+                scan.link_to_chain()
+            scans += ScanResult.objects.bulk_create(batch)
+        # bulk_create skips ScanResult.save() and the signals, which keep the blob reference
+        # counts and the search index
+        for scan in scans:
+            if scan.output_hash:
+                ScanBlob.acquire(scan.output_hash, scan.output_size, scan.output_codec)
+        search.index_scans(scans)
+        enrichment.enrich_scans(scans)
+        for item, scan, hosts in rows:
+            item.result = scan
+            if hosts:
+                nmap_results.save_hosts(scan, hosts)
+        ScanJobTarget.objects.bulk_update(
+            [item for item, _, _ in rows], ['status', 'result', 'error', 'error_output', 'duration_sec']
+        )
+
+def execute_bulk_job(job, cancel=None):
+    """
+    Runs the job's queued targets (a job picked up again after a worker died skips the finished ones).
+    """
+    start_time = time()
+    items = list(job.targets.filter(status=ScanJob.STATUS_QUEUED).order_by('index'))
+    fields = scan_result_fields(job.user, job.scanner, [], '')
+    del fields['command'], fields['output']
+    user_key = user_key_for(job.user)
+
+    pending = []
+    workers = max(1, min(settings.SCAN_BULK_CONCURRENCY, len(items)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_target, job, item, fields, user_key, cancel) for item in items]
+        for future in concurrent.futures.as_completed(futures):
+            pending.append(future.result())
+            if len(pending) >= settings.SCAN_BULK_BATCH_SIZE:
+                save_batch(pending)
+                pending = []
+    save_batch(pending)
+
+    failed = job.targets.filter(status=ScanJob.STATUS_FAILED).count()
+    job.error = f"{failed} of {job.target_count} targets failed" if failed else ''
+    if cancel is not None and cancel.cancelled:
+        job.status = ScanJob.STATUS_CANCELLED
+        job.error = "Cancelled"
+    else:
+        job.status = ScanJob.STATUS_DONE
+    job.duration_sec = round(time() - start_time, 2)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['error', 'duration_sec', 'status', 'finished_at'])
+    return job
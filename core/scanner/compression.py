@@ -0,0 +1,39 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is always available
+    zstandard = None
+
+CODEC_ZLIB = 'zlib'
+CODEC_ZSTD = 'zstd'
+
+
+def available_codecs():
+    codecs = [CODEC_ZLIB]
+    if zstandard is not None:
+        codecs.append(CODEC_ZSTD)
+    return codecs
+
+def resolve_codec(codec):
+    # zstd falls back to zlib when the zstandard package is not installed
+    return CODEC_ZSTD if codec == CODEC_ZSTD and zstandard is not None else CODEC_ZLIB
+
+def compress_text(text, codec=CODEC_ZLIB):
+    """
+    Returns (codec, compressed bytes). Falls back to zlib when zstd is asked for but not installed.
+    """
+    data = (text or '').encode('utf-8')
+    if resolve_codec(codec) == CODEC_ZSTD:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=9).compress(data)
+    return CODEC_ZLIB, zlib.compress(data, 6)
+
+def decompress_text(codec, data):
+    # data may be bytes, a memoryview from the database or an mmap of a blob file
+    if not len(data):
+        return ''
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Output is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    return zlib.decompress(data).decode('utf-8')
@@ -0,0 +1,118 @@
+from datetime import timedelta
+
+# Standard five field cron expressions (minute hour day-of-month month day-of-week) with
+# lists, ranges, steps, month/day names and the @hourly/@daily/@weekly/@monthly/@yearly macros.
+# As in cron, when both day fields are restricted a day matching either of them runs.
+
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+MONTH_NAMES = {name: number for number, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1
+)}
+DAY_NAMES = {name: number for number, name in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])}
+# (low, high, names) per field
+FIELDS = (
+    (0, 59, {}),
+    (0, 23, {}),
+    (1, 31, {}),
+    (1, 12, MONTH_NAMES),
+    (0, 7, DAY_NAMES),
+)
+# Every combination of month and day comes around within this many years (Feb 29 included)
+SEARCH_YEARS = 8
+
+
+class CronError(ValueError):
+    pass
+
+
+def parse_value(value, low, high, names):
+    value = value.lower()
+    number = names[value] if value in names else None
+    if number is None:
+        try:
+            number = int(value)
+        except ValueError:
+            raise CronError(f"Invalid value {value!r}")
+    if not low <= number <= high:
+        raise CronError(f"{number} is out of range {low}-{high}")
+    return number
+
+def parse_field(field, low, high, names):
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            try:
+                step = int(step_text)
+            except ValueError:
+                raise CronError(f"Invalid step {step_text!r}")
+            if step < 1:
+                raise CronError("Step must be at least 1")
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            start, end = parse_value(start_text, low, high, names), parse_value(end_text, low, high, names)
+            if start > end:
+                raise CronError(f"Invalid range {part!r}")
+        else:
+            start = parse_value(part, low, high, names)
+            end = high if step > 1 else start
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        fields = MACROS.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise CronError("A cron expression has 5 fields: minute hour day-of-month month day-of-week")
+        parsed = [parse_field(field, *limits) for field, limits in zip(fields, FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # 7 is Sunday too; Python's weekday() has Monday = 0
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.days_restricted = fields[2] != '*'
+        self.weekdays_restricted = fields[4] != '*'
+
+    def matches_day(self, value):
+        in_days = value.day in self.days
+        in_weekdays = value.weekday() in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return in_days or in_weekdays
+        return in_days and in_weekdays
+
+    def next_after(self, after):
+        """
+        The first matching minute strictly after `after` (a datetime, seconds are dropped).
+        """
+        value = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = value + timedelta(days=366 * SEARCH_YEARS)
+        while value < limit:
+            if value.month not in self.months:
+                # First minute of the next month
+                value = (value.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self.matches_day(value):
+                value = value.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if value.hour not in self.hours:
+                value = value.replace(minute=0) + timedelta(hours=1)
+                continue
+            if value.minute not in self.minutes:
+                value += timedelta(minutes=1)
+                continue
+            return value
+        raise CronError(f"{self.expression!r} never runs")
+
+    def __str__(self):
+        return self.expression
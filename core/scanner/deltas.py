@@ -0,0 +1,93 @@
+import hashlib
+from bisect import bisect_left
+from collections import Counter
+
+# Line level deltas between consecutive outputs of the same scan (see ScanResult.link_to_chain).
+# A delta is a list of operations that rebuild the new text from the previous one:
+#   ["c", start, count]  copy `count` lines of the previous text starting at line `start`
+#   ["i", [lines]]       insert these lines
+# Lines keep their line endings, so the rebuilt text is byte for byte the original.
+
+
+def chain_key(user_id, scanner, command):
+    """
+    Scans by the same user with the same scanner and command form one chain.
+    """
+    return hashlib.sha256(f"{user_id}\0{scanner}\0{command}".encode('utf-8')).hexdigest()
+
+def encode_delta(base, text):
+    """
+    Returns (operations, number of copied lines). Lines are looked up by hash, so this is linear
+    in the number of lines; the result is not always the smallest delta, but it is always exact.
+    """
+    base_lines = base.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    positions = {}
+    for index, line in enumerate(base_lines):
+        positions.setdefault(line, []).append(index)
+
+    operations, inserted = [], []
+    copied = 0
+    cursor = 0
+    i = 0
+    while i < len(lines):
+        candidates = positions.get(lines[i])
+        if not candidates:
+            inserted.append(lines[i])
+            i += 1
+            continue
+        # Prefer the first occurrence after the previous copy, so runs continue where they left off
+        k = bisect_left(candidates, cursor)
+        start = candidates[k] if k < len(candidates) else candidates[0]
+        count = 1
+        while (i + count < len(lines) and start + count < len(base_lines)
+               and lines[i + count] == base_lines[start + count]):
+            count += 1
+        if inserted:
+            operations.append(["i", inserted])
+            inserted = []
+        operations.append(["c", start, count])
+        copied += count
+        cursor = start + count
+        i += count
+    if inserted:
+        operations.append(["i", inserted])
+    return operations, copied
+
+def apply_delta(base, operations):
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for operation in operations:
+        if operation[0] == "c":
+            _, start, count = operation
+            parts.extend(base_lines[start:start + count])
+        else:
+            parts.extend(operation[1])
+    return "".join(parts)
+
+def diff_lines(old, new):
+    """
+    Lines removed from old and added in new, in their original order. Lines are compared as
+    multisets of hashes, a single linear pass over each text (moved lines are not reported).
+    """
+    old_lines = old.splitlines()
+    new_lines = new.splitlines()
+    remaining = Counter(old_lines)
+    added = []
+    for line in new_lines:
+        if remaining[line] > 0:
+            remaining[line] -= 1
+        else:
+            added.append(line)
+    remaining_new = Counter(new_lines)
+    removed = []
+    for line in old_lines:
+        if remaining_new[line] > 0:
+            remaining_new[line] -= 1
+        else:
+            removed.append(line)
+    return {
+        "added": added,
+        "removed": removed,
+        "unchanged": len(new_lines) - len(added),
+    }
@@ -0,0 +1,145 @@
+import logging
+import threading
+import concurrent.futures
+from time import monotonic
+import requests
+from core.http_client import http_get
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from .models import ScanResult
+from . import geoip
+
+logger = logging.getLogger(__name__)
+
+# ScanResult rows carry the server's egress IP and its geo data. The address is the same for
+# every scan, so it is looked up once (SCAN_EGRESS_IP or api.ipify.org, then the offline
+# database in SCAN_GEOIP_DB or ipwho.is) and kept for SCAN_EGRESS_TTL seconds; an expired
+# value is still used while a background thread refreshes it. Until the first lookup has
+# finished, rows are saved without it and filled in afterwards by enrich_scans(), so a scan
+# never waits for these HTTP calls.
+
+# Used when the egress IP cannot be found, as before the cache
+FALLBACK_IP = "8.8.8.8"
+# Seconds before a failed lookup is tried again
+FAILED_LOOKUP_RETRY = 60
+
+_lock = threading.Lock()
+_egress = None
+_expires_at = None
+_refreshing = None
+# One thread for the lookups and the deferred updates, they only wait on the network
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='egress')
+
+
+def get_public_ip():
+    try:
+        res = http_get("https://api.ipify.org?format=json")
+        res.raise_for_status()
+        return res.json().get("ip")
+    except requests.RequestException as e:
+        logger.warning("Error fetching public IP: %s", e)
+        return None
+
+def get_ip_geoinfo(ip):
+    try:
+        res = http_get(f"https://ipwho.is/{ip}")
+        res.raise_for_status()
+        data = res.json()
+        if data.get("success"):
+            return data
+        logger.warning("ipwho.is failed for %s: %s", ip, data.get("message"))
+        return {}
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("GeoIP fetch error for %s: %s", ip, e)
+        return {}
+
+def ipwhois_fields(geo):
+    """
+    ScanResult geo field values from an ipwho.is record.
+    """
+    connection = geo.get("connection") or {}
+    return dict(
+        country=geo.get("country"),
+        country_code=geo.get("country_code"),
+        city=geo.get("city"),
+        region=geo.get("region"),
+        region_code=geo.get("region_code"),
+        continent_code=geo.get("continent_code"),
+        timezone=(geo.get("timezone") or {}).get("id"),
+        utc_offset=geo.get("utc_offset") or (geo.get("timezone") or {}).get("utc"),
+        latitude=geo.get("latitude"),
+        longitude=geo.get("longitude"),
+        org=geo.get("org") or connection.get("org"),
+        asn=geo.get("asn") or connection.get("asn"),
+    )
+
+def lookup_geo(ip):
+    """
+    Geo fields for an address from the offline database (SCAN_GEOIP_DB) when there is one,
+    otherwise from ipwho.is. {} when the address is unknown.
+    """
+    database = geoip.get_geo_database()
+    if database is not None:
+        return database.lookup(ip)
+    geo = get_ip_geoinfo(ip)
+    return ipwhois_fields(geo) if geo else {}
+
+def _refresh():
+    global _egress, _expires_at, _refreshing
+    try:
+        with _lock:
+            current = _egress
+        ip_address = settings.SCAN_EGRESS_IP or get_public_ip()
+        geo = lookup_geo(ip_address) if ip_address else {}
+        if ip_address and geo:
+            fields, ttl = {"ip_address": ip_address, **geo}, settings.SCAN_EGRESS_TTL
+        elif current is not None and (not ip_address or current["ip_address"] == ip_address):
+            # A failed lookup keeps the last good value
+            fields, ttl = current, FAILED_LOOKUP_RETRY
+        else:
+            fields, ttl = {"ip_address": ip_address or FALLBACK_IP}, FAILED_LOOKUP_RETRY
+        with _lock:
+            _egress, _expires_at = fields, monotonic() + ttl
+        return fields
+    finally:
+        with _lock:
+            _refreshing = None
+
+def refresh_egress():
+    """
+    Starts a background lookup unless one is running. Returns its future.
+    """
+    global _refreshing
+    with _lock:
+        if _refreshing is None:
+            _refreshing = _executor.submit(_refresh)
+        return _refreshing
+
+def egress_fields():
+    """
+    The cached egress IP and geo fields, or {} before the first lookup has finished.
+    Never blocks: a missing or expired value is refreshed in the background.
+    """
+    with _lock:
+        egress, expires_at = _egress, _expires_at
+    if egress is None or monotonic() > expires_at:
+        refresh_egress()
+    return dict(egress) if egress is not None else {}
+
+def _enrich(pks):
+    try:
+        fields = _egress if _egress is not None else _refresh()
+        ScanResult.objects.filter(pk__in=pks, ip_address__isnull=True).update(**fields)
+    except Exception:
+        logger.exception("Enriching scans %s failed", pks)
+    finally:
+        close_old_connections()
+
+def enrich_scans(scans):
+    """
+    Fills the egress fields of rows saved without them, in the background once the current
+    transaction has committed.
+    """
+    pks = [scan.pk for scan in scans if scan.ip_address is None]
+    if pks:
+        transaction.on_commit(lambda: _executor.submit(_enrich, pks))
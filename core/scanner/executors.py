@@ -0,0 +1,95 @@
+import ntpath
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# How scanner processes are started, chosen with settings.SCAN_EXECUTOR:
+#   LocalExecutor - exec the binary directly (Linux scan hosts)
+#   WSLExecutor   - run it inside WSL from a Windows host
+#   StubExecutor  - never run a real scanner, print the command instead (tests, development)
+
+
+class Executor:
+    def resolve(self, binaries):
+        """
+        Returns {binary: absolute path or None when not found}, looked up in one go.
+        """
+        raise NotImplementedError
+
+    def command(self, binary, args):
+        """
+        argv that runs binary (already resolved) with args.
+        """
+        raise NotImplementedError
+
+    def path(self, path):
+        """
+        A local path as the scanners see it.
+        """
+        return path
+
+
+class LocalExecutor(Executor):
+    def resolve(self, binaries):
+        return {binary: shutil.which(binary) for binary in binaries}
+
+    def command(self, binary, args):
+        return [binary] + list(args)
+
+
+class WSLExecutor(Executor):
+    # Prints one line per argument: its path inside WSL, or an empty line
+    RESOLVE_SCRIPT = 'for b in "$@"; do command -v "$b" || echo; done'
+
+    def __init__(self, wsl='wsl'):
+        self.wsl = wsl
+
+    def resolve(self, binaries):
+        binaries = list(binaries)
+        try:
+            result = subprocess.run(
+                [self.wsl, 'sh', '-c', self.RESOLVE_SCRIPT, 'sh'] + binaries,
+                capture_output=True, text=True, timeout=30,
+            )
+            found = result.stdout.splitlines()
+        except (OSError, subprocess.SubprocessError):
+            found = []
+        found += [''] * (len(binaries) - len(found))
+        return {binary: path.strip() or None for binary, path in zip(binaries, found)}
+
+    def command(self, binary, args):
+        return [self.wsl, binary] + list(args)
+
+    def path(self, path):
+        # C:\x is /mnt/c/x inside WSL
+        if os.name != 'nt':
+            return path
+        drive, rest = ntpath.splitdrive(os.path.abspath(path))
+        return f"/mnt/{drive[0].lower()}" + rest.replace('\\', '/')
+
+
+class StubExecutor(Executor):
+    STUB = 'import sys; print("stub", *sys.argv[1:])'
+
+    def resolve(self, binaries):
+        return {binary: binary for binary in binaries}
+
+    def command(self, binary, args):
+        return [sys.executable, '-c', self.STUB, binary] + list(args)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = settings.SCAN_EXECUTOR
+                _executor = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _executor
@@ -0,0 +1,122 @@
+import json
+import socket
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import ScanResult, with_chain_outputs
+
+# Scan history as security events, one line per ScanResult, for SIEM ingestion:
+#   cef     ArcSight Common Event Format
+#   jsonl   one JSON object per line
+#   syslog  RFC 5424 syslog lines carrying the CEF record
+# Records are produced from an iterator over the rows ordered by id, so an export uses the same
+# memory for ten rows or ten million, and `after_id` resumes after the last exported record.
+
+EXPORT_FORMATS = {
+    'cef': 'text/plain; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'syslog': 'text/plain; charset=utf-8',
+}
+EXPORT_FIELDS = (
+    'id', 'user_id', 'user__username', 'scanner', 'command', 'ip_address', 'created_at', 'exit_code',
+    'output_data', 'output_codec', 'output_hash', 'output_format', 'previous_id',
+    'country_code', 'city', 'org', 'asn',
+)
+# local0.notice
+SYSLOG_PRIORITY = 16 * 8 + 5
+SYSLOG_APP_NAME = 'webscanner'
+SYSLOG_HOSTNAME = socket.gethostname()
+
+
+def parse_date_bound(value, end=False):
+    """
+    A date or ISO 8601 datetime as an aware datetime. A plain date `end` bound includes the
+    whole day. Returns None when the value is not a date.
+    """
+    try:
+        day = parse_date(value)
+        if day is not None:
+            moment = datetime.combine(day + timedelta(days=1) if end else day, datetime.min.time())
+        else:
+            moment = parse_datetime(value)
+    except ValueError:
+        return None
+    if moment is None:
+        return None
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+def export_queryset(user=None, scanner=None, since=None, until=None, after_id=None):
+    scans = ScanResult.objects.select_related('user').only(*EXPORT_FIELDS).order_by('pk')
+    if user is not None:
+        scans = scans.filter(user=user)
+    if scanner:
+        scans = scans.filter(scanner=scanner)
+    if since:
+        scans = scans.filter(created_at__gte=since)
+    if until:
+        scans = scans.filter(created_at__lt=until)
+    if after_id:
+        scans = scans.filter(pk__gt=after_id)
+    return scans
+
+def cef_header_escape(value):
+    return str(value).replace('\\', '\\\\').replace('|', '\\|')
+
+def cef_value_escape(value):
+    return (str(value).replace('\\', '\\\\').replace('=', '\\=')
+            .replace('\r', '').replace('\n', '\\n'))
+
+def event_message(scan):
+    return scan.output[:settings.SCAN_EXPORT_MESSAGE_LENGTH]
+
+def cef_record(scan):
+    extension = {
+        'rt': int(scan.created_at.timestamp() * 1000),
+        'externalId': scan.pk,
+        'src': scan.ip_address or 'unknown',
+        'suser': scan.user.username if scan.user else 'guest',
+        'request': scan.command,
+        'msg': event_message(scan),
+    }
+    if scan.exit_code is not None:
+        extension.update({'cn1': scan.exit_code, 'cn1Label': 'exitCode'})
+    return "CEF:0|WebScanner|{}|1.0|100|Scan Event|Low|{}".format(
+        cef_header_escape(scan.scanner),
+        ' '.join(f"{key}={cef_value_escape(value)}" for key, value in extension.items()),
+    )
+
+def json_record(scan):
+    return json.dumps({
+        'id': scan.pk,
+        'time': scan.created_at.isoformat(),
+        'user': scan.user.username if scan.user else None,
+        'scanner': scan.scanner,
+        'command': scan.command,
+        'source_ip': scan.ip_address,
+        'country_code': scan.country_code,
+        'city': scan.city,
+        'org': scan.org,
+        'asn': scan.asn,
+        'exit_code': scan.exit_code,
+        'message': event_message(scan),
+    }, ensure_ascii=False)
+
+def syslog_record(scan):
+    timestamp = scan.created_at.astimezone(dt_timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+    return f"<{SYSLOG_PRIORITY}>1 {timestamp} {SYSLOG_HOSTNAME} {SYSLOG_APP_NAME} - {scan.pk} - {cef_record(scan)}"
+
+def format_record(fmt, scan):
+    if fmt == 'jsonl':
+        return json_record(scan)
+    if fmt == 'syslog':
+        return syslog_record(scan)
+    return cef_record(scan)
+
+def export_records(fmt, scans, chunk_size=None, limit=None):
+    """
+    Yields (scan id, line) for the rows of an export_queryset, reading chunk_size rows at a time.
+    """
+    rows = scans[:limit] if limit else scans
+    for scan in with_chain_outputs(rows.iterator(chunk_size=chunk_size or settings.SCAN_EXPORT_CHUNK_SIZE)):
+        yield scan.pk, format_record(fmt, scan) + "\n"
@@ -0,0 +1,237 @@
+import logging
+import queue
+import random
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from django.conf import settings
+from django.db import close_old_connections, connection
+from core.http_client import http_post
+from .export import EXPORT_FORMATS, export_queryset, export_records
+from .models import SiemCursor
+
+logger = logging.getLogger(__name__)
+
+# Ships new ScanResult events to a SIEM collector (the `run_siem_forwarder` command).
+# A reader thread loads records after the cursor into a bounded queue and blocks when it is
+# full; the sending thread takes batches off the queue and only moves the persistent cursor
+# once the collector took a batch. A restart resends at most the batch that was in flight
+# when the process stopped (records carry the scan id, e.g. CEF externalId, for deduplication).
+# Nothing here runs in the request path, so a slow collector never slows a scan down.
+
+
+class TransportError(Exception):
+    pass
+
+
+def truncate_utf8(data, limit):
+    # Cut on a character boundary, a multi-byte sequence split at the limit is dropped
+    return data[:limit].decode('utf-8', 'ignore').encode('utf-8')
+
+
+class SyslogUdpTransport:
+    # Larger datagrams are dropped by most networks and collectors
+    max_datagram = 65000
+
+    def __init__(self, host, port, timeout):
+        self.address = (host, port or 514)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.settimeout(timeout)
+
+    def send(self, lines):
+        try:
+            for line in lines:
+                self.sock.sendto(truncate_utf8(line.rstrip('\n').encode('utf-8'), self.max_datagram), self.address)
+        except OSError as e:
+            raise TransportError(f"UDP send to {self.address[0]}:{self.address[1]} failed: {e}")
+
+    def close(self):
+        self.sock.close()
+
+
+class SyslogTcpTransport:
+    """
+    Syslog over TCP with newline framing (RFC 6587). The connection is kept between batches
+    and opened again after an error.
+    """
+    def __init__(self, host, port, timeout):
+        self.address = (host, port or 514)
+        self.timeout = timeout
+        self.sock = None
+
+    def send(self, lines):
+        try:
+            if self.sock is None:
+                self.sock = socket.create_connection(self.address, timeout=self.timeout)
+            self.sock.sendall(''.join(lines).encode('utf-8'))
+        except OSError as e:
+            self.close()
+            raise TransportError(f"TCP send to {self.address[0]}:{self.address[1]} failed: {e}")
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class HttpTransport:
+    """
+    One POST per batch, the records in the body one per line. Any status but 2xx is a failure.
+    """
+    def __init__(self, url, timeout, fmt):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {'Content-Type': EXPORT_FORMATS[fmt]}
+        if settings.SCAN_SIEM_AUTH_HEADER:
+            name, _, value = settings.SCAN_SIEM_AUTH_HEADER.partition(':')
+            self.headers[name.strip()] = value.strip()
+
+    def send(self, lines):
+        try:
+            response = http_post(self.url, data=''.join(lines).encode('utf-8'), headers=self.headers,
+                                 timeout=self.timeout)
+        except requests.RequestException as e:
+            raise TransportError(f"POST {self.url} failed: {e}")
+        if not 200 <= response.status_code < 300:
+            raise TransportError(f"POST {self.url} returned {response.status_code}")
+
+    def close(self):
+        pass
+
+
+def make_transport(url, fmt, timeout):
+    """
+    tcp://host:port and udp://host:port send syslog lines, http(s):// URLs POST batches.
+    """
+    parts = urlsplit(url)
+    if parts.scheme == 'udp':
+        return SyslogUdpTransport(parts.hostname, parts.port, timeout)
+    if parts.scheme == 'tcp':
+        return SyslogTcpTransport(parts.hostname, parts.port, timeout)
+    if parts.scheme in ('http', 'https'):
+        return HttpTransport(url, timeout, fmt)
+    raise ValueError(f"Unsupported collector URL {url!r}, use tcp://, udp://, http:// or https://")
+
+
+def backoff_delay(failures, maximum):
+    # 1, 2, 4, ... seconds up to `maximum`, with jitter so several forwarders do not retry in step
+    return min(maximum, 2 ** (failures - 1)) * random.uniform(0.5, 1.0)
+
+
+class Forwarder:
+    def __init__(self, transport, name='default', fmt='syslog', batch_size=None, queue_size=None,
+                 flush_interval=None, poll_interval=5.0, backoff_max=None):
+        self.transport = transport
+        self.name = name
+        self.fmt = fmt
+        self.batch_size = batch_size or settings.SCAN_SIEM_BATCH_SIZE
+        self.queue = queue.Queue(maxsize=queue_size or settings.SCAN_SIEM_QUEUE_SIZE)
+        self.flush_interval = settings.SCAN_SIEM_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.poll_interval = poll_interval
+        self.backoff_max = backoff_max or settings.SCAN_SIEM_BACKOFF_MAX
+        self.stopping = threading.Event()
+        # Set by the reader when it found nothing new, for run(once=True)
+        self.caught_up = threading.Event()
+        self.cursor, _ = SiemCursor.objects.get_or_create(name=name)
+
+    def read(self):
+        """
+        Reader thread: queues the records after the cursor, waiting for room when the queue is full.
+        Each batch is read to the end before it is queued, so no query stays open while waiting
+        (on SQLite an open read would keep the cursor update from committing).
+        """
+        after_id = self.cursor.last_id
+        try:
+            while not self.stopping.is_set():
+                records = list(export_records(
+                    self.fmt, export_queryset(after_id=after_id), self.batch_size, limit=self.batch_size
+                ))
+                for record in records:
+                    while not self.stopping.is_set():
+                        try:
+                            self.queue.put(record, timeout=1)
+                            break
+                        except queue.Full:
+                            continue
+                if records:
+                    after_id = records[-1][0]
+                else:
+                    self.caught_up.set()
+                    self.stopping.wait(self.poll_interval)
+                    close_old_connections()
+        except Exception:
+            logger.exception("SIEM forwarder %s: reading events failed", self.name)
+            self.stopping.set()
+        finally:
+            connection.close()
+
+    def next_batch(self):
+        """
+        Up to batch_size records: waits for the first one, then for at most flush_interval
+        seconds for the batch to fill up.
+        """
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=1))
+        except queue.Empty:
+            return batch
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def send(self, batch):
+        """
+        Sends one batch until the collector takes it, backing off exponentially between
+        attempts, then moves the cursor past it. Returns False when stopped before it was sent.
+        """
+        failures = 0
+        lines = [line for _, line in batch]
+        while True:
+            try:
+                self.transport.send(lines)
+                break
+            except TransportError as e:
+                failures += 1
+                delay = backoff_delay(failures, self.backoff_max)
+                logger.warning("SIEM forwarder %s: %s, retrying in %.1f s", self.name, e, delay)
+                if failures == 1:
+                    SiemCursor.objects.filter(pk=self.cursor.pk).update(last_error=str(e))
+                if self.stopping.wait(delay):
+                    return False
+        self.cursor.last_id = batch[-1][0]
+        self.cursor.sent += len(batch)
+        self.cursor.last_error = ''
+        self.cursor.save(update_fields=['last_id', 'sent', 'last_error', 'updated_at'])
+        return True
+
+    def run(self, once=False):
+        """
+        Forwards events until stop() is called, or with once=True until everything that was
+        there when it started has been sent. Returns the number of events sent.
+        """
+        reader = threading.Thread(target=self.read, name=f'siem-reader-{self.name}', daemon=True)
+        reader.start()
+        sent = 0
+        try:
+            while not self.stopping.is_set() or not self.queue.empty():
+                batch = self.next_batch()
+                if batch:
+                    if not self.send(batch):
+                        break
+                    sent += len(batch)
+                elif once and self.caught_up.is_set():
+                    break
+        finally:
+            self.stopping.set()
+            reader.join()
+            self.transport.close()
+        return sent
+
+    def stop(self):
+        self.stopping.set()
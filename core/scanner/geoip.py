@@ -0,0 +1,213 @@
+import csv
+import ipaddress
+import logging
+import threading
+from array import array
+from functools import lru_cache
+from django.conf import settings
+
+try:
+    import maxminddb
+except ImportError:  # optional, only needed for .mmdb databases
+    maxminddb = None
+
+logger = logging.getLogger(__name__)
+
+# Offline IP geolocation (SCAN_GEOIP_DB), for deployments that cannot reach ipwho.is.
+# A CSV range database is loaded into sorted arrays of range starts and ends, one set per
+# address family, and looked up by binary search. IPv6 addresses do not fit a machine word,
+# so they are kept as two arrays of 64-bit halves. Identical location records are stored once.
+# The CSV needs a header with either start/end (addresses or integers) or network (CIDR) and
+# any of the GEO_FIELDS columns, e.g. a GeoLite2 or DB-IP export flattened to one file.
+
+GEO_FIELDS = (
+    'country_code', 'country', 'region', 'region_code', 'city', 'continent_code',
+    'latitude', 'longitude', 'timezone', 'asn', 'org',
+)
+FLOAT_FIELDS = ('latitude', 'longitude')
+HALF = 64
+LOW_MASK = (1 << HALF) - 1
+
+
+class GeoDatabaseError(ValueError):
+    pass
+
+
+def parse_address(value):
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return number, 4 if number <= 0xFFFFFFFF else 6
+    address = ipaddress.ip_address(value)
+    return int(address), address.version
+
+def parse_range(row):
+    if row.get('network'):
+        network = ipaddress.ip_network(row['network'].strip(), strict=False)
+        return int(network.network_address), int(network.broadcast_address), network.version
+    start, version = parse_address(row['start'])
+    end, end_version = parse_address(row['end'])
+    if version != end_version or end < start:
+        raise GeoDatabaseError(f"Invalid range {row['start']} - {row['end']}")
+    return start, end, version
+
+def parse_record(row):
+    record = []
+    for field in GEO_FIELDS:
+        value = (row.get(field) or '').strip() or None
+        if value is not None and field in FLOAT_FIELDS:
+            value = float(value)
+        record.append(value)
+    return tuple(record)
+
+
+class RangeTable:
+    """
+    The disjoint ranges of one address family: starts and ends sorted by start, and for each
+    range the index of its record. `halves` is 1 for IPv4 and 2 for IPv6 (high and low 64 bits).
+    """
+    def __init__(self, ranges, halves):
+        self.halves = halves
+        ranges.sort(key=lambda item: item[0])
+        # find() returns the last range starting before the address, which needs disjoint ranges
+        for previous, current in zip(ranges, ranges[1:]):
+            if current[0] <= previous[1]:
+                address = ipaddress.IPv4Address if halves == 1 else ipaddress.IPv6Address
+                raise GeoDatabaseError(
+                    f"Overlapping ranges starting at {address(previous[0])} and {address(current[0])}"
+                )
+        if halves == 1:
+            self.starts = array('I', (start for start, _, _ in ranges))
+            self.ends = array('I', (end for _, end, _ in ranges))
+        else:
+            self.starts = (array('Q', (start >> HALF for start, _, _ in ranges)),
+                           array('Q', (start & LOW_MASK for start, _, _ in ranges)))
+            self.ends = (array('Q', (end >> HALF for _, end, _ in ranges)),
+                         array('Q', (end & LOW_MASK for _, end, _ in ranges)))
+        self.records = array('I', (record for _, _, record in ranges))
+
+    def __len__(self):
+        return len(self.records)
+
+    def start(self, index):
+        if self.halves == 1:
+            return self.starts[index]
+        return (self.starts[0][index] << HALF) | self.starts[1][index]
+
+    def end(self, index):
+        if self.halves == 1:
+            return self.ends[index]
+        return (self.ends[0][index] << HALF) | self.ends[1][index]
+
+    def find(self, number):
+        """
+        The record index of the range holding `number`, or None.
+        """
+        # Last range starting at or before the address
+        low, high = 0, len(self.records)
+        while low < high:
+            middle = (low + high) // 2
+            if self.start(middle) <= number:
+                low = middle + 1
+            else:
+                high = middle
+        index = low - 1
+        if index >= 0 and number <= self.end(index):
+            return self.records[index]
+        return None
+
+
+class CsvGeoDatabase:
+    def __init__(self, path, cache_size=4096):
+        ranges = {4: [], 6: []}
+        records, record_ids = [], {}
+        with open(path, newline='', encoding='utf-8') as file:
+            reader = csv.DictReader(file)
+            fields = set(reader.fieldnames or ())
+            if 'network' not in fields and not {'start', 'end'} <= fields:
+                raise GeoDatabaseError(f"{path}: the header needs start and end, or network")
+            for line, row in enumerate(reader, start=2):
+                try:
+                    start, end, version = parse_range(row)
+                    record = parse_record(row)
+                except ValueError as e:
+                    raise GeoDatabaseError(f"{path}:{line}: {e}")
+                if record not in record_ids:
+                    record_ids[record] = len(records)
+                    records.append(record)
+                ranges[version].append((start, end, record_ids[record]))
+        self.records = records
+        self.tables = {4: RangeTable(ranges[4], 1), 6: RangeTable(ranges[6], 2)}
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+        logger.info("Loaded %s IPv4 and %s IPv6 ranges (%s locations) from %s",
+                    len(self.tables[4]), len(self.tables[6]), len(records), path)
+
+    def _lookup(self, ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return {}
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        index = self.tables[address.version].find(int(address))
+        if index is None:
+            return {}
+        return dict(zip(GEO_FIELDS, self.records[index]))
+
+
+class MmdbGeoDatabase:
+    """
+    A MaxMind format database (GeoLite2/GeoIP2 City or ASN), read with the maxminddb package.
+    """
+    def __init__(self, path, cache_size=4096):
+        if maxminddb is None:
+            raise GeoDatabaseError(f"{path}: reading .mmdb files needs the maxminddb package")
+        self.reader = maxminddb.open_database(path)
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _lookup(self, ip):
+        try:
+            data = self.reader.get(ip) or {}
+        except ValueError:
+            return {}
+        if not data:
+            return {}
+        subdivision = (data.get('subdivisions') or [{}])[0]
+        location = data.get('location') or {}
+        asn = data.get('autonomous_system_number')
+        return {
+            'country_code': (data.get('country') or {}).get('iso_code'),
+            'country': ((data.get('country') or {}).get('names') or {}).get('en'),
+            'region': (subdivision.get('names') or {}).get('en'),
+            'region_code': subdivision.get('iso_code'),
+            'city': ((data.get('city') or {}).get('names') or {}).get('en'),
+            'continent_code': (data.get('continent') or {}).get('code'),
+            'latitude': location.get('latitude'),
+            'longitude': location.get('longitude'),
+            'timezone': location.get('time_zone'),
+            'asn': str(asn) if asn else None,
+            'org': data.get('autonomous_system_organization'),
+        }
+
+
+def open_geo_database(path, cache_size=4096):
+    if str(path).endswith('.mmdb'):
+        return MmdbGeoDatabase(path, cache_size)
+    return CsvGeoDatabase(path, cache_size)
+
+
+_database = None
+_database_lock = threading.Lock()
+
+def get_geo_database():
+    """
+    The database in SCAN_GEOIP_DB, loaded on first use, or None when none is configured.
+    """
+    global _database
+    if not settings.SCAN_GEOIP_DB:
+        return None
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                _database = open_geo_database(settings.SCAN_GEOIP_DB, settings.SCAN_GEOIP_CACHE_SIZE)
+    return _database
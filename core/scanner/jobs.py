@@ -0,0 +1,243 @@
+import math
+import os
+import socket
+import subprocess
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .models import ScanJob, ScanResult, ScanHost
+from .services import execute_scan, save_scan_result
+from .scheduler import SchedulerTimeout, user_key_for
+from .processes import ScanCancelled
+from .sharding import merge_outputs, split_args
+from .bulk import execute_bulk_job
+
+logger = logging.getLogger(__name__)
+
+# Extra time on top of a job's own timeout before a "running" job is considered abandoned
+STALE_GRACE_SECONDS = 60
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def enqueue_scan(user, name, args, timeout):
+    return ScanJob.objects.create(user=user, scanner=name, scanner_key=name, args=list(args), timeout=timeout)
+
+def enqueue_sharded_scan(user, name, args, shards, timeout):
+    """
+    Queues one job per shard (argument lists from sharding.make_shards) under a parent job.
+    The parent is never claimed by a worker, it finishes when its last shard does.
+    """
+    with transaction.atomic():
+        parent = ScanJob.objects.create(
+            user=user, scanner=name, scanner_key=name, args=list(args), timeout=timeout,
+            status=ScanJob.STATUS_RUNNING, started_at=timezone.now(), shard_count=len(shards),
+        )
+        ScanJob.objects.bulk_create([
+            ScanJob(
+                user=user, scanner=name, scanner_key=name, args=list(shard_args), timeout=timeout,
+                parent=parent, shard_index=index,
+            )
+            for index, shard_args in enumerate(shards)
+        ])
+    return parent
+
+def job_progress(job):
+    """
+    Counts of a sharded job's shards or a bulk job's targets by status, None for other jobs.
+    """
+    if job.shard_count:
+        total, label = job.shard_count, "shards"
+        counts = job.shards.aggregate(
+            **{status: Count('pk', filter=Q(status=status)) for status, _ in ScanJob.STATUS_CHOICES},
+            retried=Count('pk', filter=Q(attempts__gt=1)),
+        )
+    elif job.target_count:
+        total, label = job.target_count, "targets"
+        counts = job.targets.aggregate(
+            **{status: Count('pk', filter=Q(status=status)) for status, _ in ScanJob.STATUS_CHOICES},
+        )
+    else:
+        return None
+    finished = counts[ScanJob.STATUS_DONE] + counts[ScanJob.STATUS_FAILED] + counts[ScanJob.STATUS_CANCELLED]
+    return {
+        label: total,
+        **counts,
+        "percent": round(100 * finished / total, 1),
+    }
+
+def claim_next_job(worker):
+    """
+    Atomically moves the oldest queued job to "running" and returns it.
+    The conditional UPDATE makes this safe with several workers polling the same table.
+    """
+    while True:
+        job = ScanJob.objects.filter(status=ScanJob.STATUS_QUEUED).order_by('created_at').first()
+        if job is None:
+            return None
+        claimed = (ScanJob.objects
+                   .filter(pk=job.pk, status=ScanJob.STATUS_QUEUED)
+                   .update(status=ScanJob.STATUS_RUNNING, started_at=timezone.now(), worker=worker,
+                           attempts=F('attempts') + 1))
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+def job_time_limit(job):
+    """
+    Seconds a job can legitimately run: its timeout, times the rounds of targets for a bulk job.
+    """
+    if job.target_count:
+        return job.timeout * math.ceil(job.target_count / max(1, settings.SCAN_BULK_CONCURRENCY))
+    return job.timeout
+
+def requeue_stale_jobs():
+    """
+    Jobs left in "running" by a worker that died can no longer be alive once their
+    timeout has passed, so they go back to the queue. One that already took
+    SCAN_JOB_MAX_ATTEMPTS workers down with it is failed instead.
+    """
+    now = timezone.now()
+    requeued = 0
+    running = ScanJob.objects.filter(status=ScanJob.STATUS_RUNNING, shard_count=0)
+    for job in running.only('id', 'timeout', 'started_at', 'target_count', 'attempts', 'parent_id'):
+        if job.started_at and job.started_at + timedelta(seconds=job_time_limit(job) + STALE_GRACE_SECONDS) > now:
+            continue
+        stale = ScanJob.objects.filter(pk=job.pk, status=ScanJob.STATUS_RUNNING)
+        if job.attempts < settings.SCAN_JOB_MAX_ATTEMPTS:
+            requeued += stale.update(status=ScanJob.STATUS_QUEUED, started_at=None, worker='')
+            continue
+        error = f"Abandoned by its worker {job.attempts} times"
+        if stale.update(status=ScanJob.STATUS_FAILED, error=error, finished_at=now):
+            logger.warning("Scan job %s failed: %s", job.pk, error)
+            if job.parent_id:
+                finish_sharded_job(job.parent_id)
+    return requeued
+
+def cancel_job(job):
+    """
+    A queued job is cancelled right away. A running one is flagged, and the worker running it kills
+    its process group and gives up its scheduler slot (see cancelled_job_ids). Cancelling a
+    sharded job cancels its shards. Returns False when the job had already finished.
+    """
+    now = timezone.now()
+    if job.shard_count:
+        if not (ScanJob.objects
+                .filter(pk=job.pk, status=ScanJob.STATUS_RUNNING)
+                .update(status=ScanJob.STATUS_CANCELLED, error="Cancelled", cancel_requested_at=now, finished_at=now)):
+            return False
+        for shard in job.shards.filter(status__in=[ScanJob.STATUS_QUEUED, ScanJob.STATUS_RUNNING]):
+            cancel_job(shard)
+        return True
+    if (ScanJob.objects
+            .filter(pk=job.pk, status=ScanJob.STATUS_QUEUED)
+            .update(status=ScanJob.STATUS_CANCELLED, error="Cancelled", cancel_requested_at=now, finished_at=now)):
+        return True
+    return bool(ScanJob.objects
+                .filter(pk=job.pk, status=ScanJob.STATUS_RUNNING)
+                .update(cancel_requested_at=now))
+
+def cancelled_job_ids(job_ids):
+    return set(ScanJob.objects
+               .filter(pk__in=job_ids, status=ScanJob.STATUS_RUNNING, cancel_requested_at__isnull=False)
+               .values_list('pk', flat=True))
+
+def execute_job(job, cancel=None):
+    if job.target_count:
+        return execute_bulk_job(job, cancel)
+    try:
+        result, _ = execute_scan(
+            job.scanner_key or job.scanner, job.args, job.timeout, job.user, user_key_for(job.user), cancel
+        )
+        job.result_id = result["scan_id"]
+        job.error_output = result["error_output"] or ''
+        job.duration_sec = result["duration_sec"]
+        job.error = ''
+        job.status = ScanJob.STATUS_DONE
+    except subprocess.TimeoutExpired:
+        job.error = f"{job.scanner} scan timed out"
+        job.status = ScanJob.STATUS_FAILED
+    except ScanCancelled:
+        job.error = "Cancelled"
+        job.status = ScanJob.STATUS_CANCELLED
+    except SchedulerTimeout:
+        # Not started yet, put it back for the next poll (this was not an attempt)
+        ScanJob.objects.filter(pk=job.pk).update(
+            status=ScanJob.STATUS_QUEUED, started_at=None, worker='', attempts=F('attempts') - 1
+        )
+        job.status = ScanJob.STATUS_QUEUED
+        return job
+    except Exception as e:
+        logger.exception("Scan job %s failed", job.pk)
+        job.error = str(e)
+        job.status = ScanJob.STATUS_FAILED
+
+    if job.parent_id and job.status == ScanJob.STATUS_FAILED and job.attempts < settings.SCAN_SHARD_ATTEMPTS:
+        # Only this shard runs again, the rest of the range is not touched
+        logger.info("Retrying shard %s of job %s: %s", job.shard_index, job.parent_id, job.error)
+        job.save(update_fields=['error'])
+        ScanJob.objects.filter(pk=job.pk, status=ScanJob.STATUS_RUNNING).update(
+            status=ScanJob.STATUS_QUEUED, started_at=None, worker=''
+        )
+        job.status = ScanJob.STATUS_QUEUED
+        return job
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['result', 'error', 'error_output', 'duration_sec', 'status', 'finished_at'])
+    if job.parent_id:
+        finish_sharded_job(job.parent_id)
+    return job
+
+def finish_sharded_job(parent_id):
+    """
+    Merges the shards into the parent's result once all of them have finished. Whoever finishes
+    the last shard gets to merge; the conditional update keeps two workers from both doing it.
+    """
+    unfinished = ScanJob.objects.filter(
+        parent_id=parent_id, status__in=[ScanJob.STATUS_QUEUED, ScanJob.STATUS_RUNNING]
+    )
+    if unfinished.exists():
+        return
+    if not (ScanJob.objects
+            .filter(pk=parent_id, status=ScanJob.STATUS_RUNNING, finished_at__isnull=True)
+            .update(finished_at=timezone.now())):
+        return
+
+    parent = ScanJob.objects.select_related('user').get(pk=parent_id)
+    shards = list(parent.shards.select_related('result').order_by('shard_index'))
+    done = [shard for shard in shards if shard.status == ScanJob.STATUS_DONE and shard.result_id]
+    failed = [shard for shard in shards if shard.status != ScanJob.STATUS_DONE]
+
+    if done:
+        results = [shard.result for shard in done]
+        usage = {
+            "exit_code": next((r.exit_code for r in results if r.exit_code), results[0].exit_code),
+            "cpu_user_sec": sum(r.cpu_user_sec or 0 for r in results),
+            "cpu_system_sec": sum(r.cpu_system_sec or 0 for r in results),
+            "max_rss_kb": max((r.max_rss_kb or 0 for r in results), default=0) or None,
+        }
+        with transaction.atomic():
+            merged = save_scan_result(
+                parent.user, parent.scanner, parent.args,
+                merge_outputs(parent.scanner, [r.output for r in results]), usage=usage,
+            )
+            # nmap hosts already imported per shard now belong to the merged result
+            ScanHost.objects.filter(scan_id__in=[r.pk for r in results]).update(scan=merged)
+            ScanResult.objects.filter(pk__in=[r.pk for r in results]).delete()
+        parent.result = merged
+
+    parent.error_output = "".join(shard.error_output for shard in done)
+    if failed:
+        parent.error = f"{len(failed)} of {len(shards)} shards failed: " + "; ".join(
+            f"#{shard.shard_index} {' '.join(split_args(shard.scanner, shard.args)[1])}: {shard.error}"
+            for shard in failed[:10]
+        )
+    parent.status = ScanJob.STATUS_DONE if done else ScanJob.STATUS_FAILED
+    parent.finished_at = timezone.now()
+    parent.duration_sec = round((parent.finished_at - parent.started_at).total_seconds(), 2)
+    parent.save(update_fields=['result', 'error', 'error_output', 'duration_sec', 'status', 'finished_at'])
+    return parent
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from scanner import geoip
+from scanner.models import ScanResult
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the geo fields of existing scans from the offline geolocation database "
+        "(SCAN_GEOIP_DB or --db), in batches. Only rows without a country unless --all."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db', help="Database file (default: SCAN_GEOIP_DB)")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help="Also overwrite rows that already have geo data")
+
+    def handle(self, *args, **options):
+        path = options['db'] or settings.SCAN_GEOIP_DB
+        if not path:
+            raise CommandError("No geolocation database, set SCAN_GEOIP_DB or pass --db")
+        try:
+            database = geoip.open_geo_database(path, settings.SCAN_GEOIP_CACHE_SIZE)
+        except (OSError, geoip.GeoDatabaseError) as e:
+            raise CommandError(str(e))
+
+        rows = ScanResult.objects.filter(ip_address__isnull=False).exclude(ip_address='')
+        if not options['all']:
+            rows = rows.filter(country__isnull=True)
+        batch_size = options['batch_size']
+        last_pk = 0
+        processed = updated = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk).order_by('pk').only('pk', 'ip_address', *geoip.GEO_FIELDS)[:batch_size])
+            if not batch:
+                break
+            found = []
+            for scan in batch:
+                geo = database.lookup(scan.ip_address)
+                if geo:
+                    for field, value in geo.items():
+                        setattr(scan, field, value)
+                    found.append(scan)
+            ScanResult.objects.bulk_update(found, geoip.GEO_FIELDS)
+            processed += len(batch)
+            updated += len(found)
+            last_pk = batch[-1].pk
+            self.stdout.write(f"Processed {processed} row(s), located {updated}")
@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+import subprocess
+from time import perf_counter, sleep
+from statistics import mean, median
+from django.core.management.base import BaseCommand, CommandError
+from scanner.python_pool import InterpreterPool, PoolUnavailable
+
+# Stands in for a tool like XSStrike: most of its start-up is imports
+STUB_TOOL = """import sys
+import json, email.parser, http.client, urllib.request, decimal, asyncio, xml.dom.minidom, logging.handlers
+print("stub tool", *sys.argv[1:])
+"""
+STUB_PRELOAD = [
+    "json", "email.parser", "http.client", "urllib.request", "decimal", "asyncio", "xml.dom.minidom", "logging.handlers",
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the latency of running a Python tool as a fresh subprocess and through "
+        "the pre-started interpreter pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--python', default=sys.executable, help="Interpreter of the tool")
+        parser.add_argument('--script', help="Tool to run instead of the built-in stub")
+        parser.add_argument('--preload', nargs='*', help="Modules the pool imports up front (with --script)")
+        parser.add_argument('--max-jobs', type=int, default=1000, help="Recycle a worker after this many jobs")
+        parser.add_argument('--tool-args', nargs='*', help="Arguments passed to the tool")
+
+    def handle(self, *args, **options):
+        runs = options['runs']
+        launcher = [options['python']]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            script = options['script']
+            preload = options['preload'] or []
+            if not script:
+                script = os.path.join(tmp, 'stub_tool.py')
+                with open(script, 'w') as f:
+                    f.write(STUB_TOOL)
+                preload = STUB_PRELOAD
+            tool_args = options['tool_args'] or ['example.com']
+
+            cold = []
+            for _ in range(runs):
+                start = perf_counter()
+                subprocess.run(launcher + [script] + tool_args, capture_output=True, text=True, timeout=120)
+                cold.append(perf_counter() - start)
+
+            pool = InterpreterPool('bench', launcher, script, preload, size=1, max_jobs=options['max_jobs'])
+            pool.warm()
+            warm = []
+            try:
+                for _ in range(runs):
+                    warm.append(self.run_pooled(pool, tool_args))
+            finally:
+                pool.close()
+
+        self.stdout.write(f"{runs} runs of {os.path.basename(script)}")
+        self.stdout.write(f"{'mode':<12}{'mean, ms':>10}{'p50, ms':>10}{'p95, ms':>10}")
+        for label, timings in (("subprocess", cold), ("pool", warm)):
+            self.stdout.write(
+                f"{label:<12}{mean(timings) * 1000:>10.1f}{median(timings) * 1000:>10.1f}"
+                f"{percentile(timings, 0.95) * 1000:>10.1f}"
+            )
+
+    def run_pooled(self, pool, tool_args):
+        # A recycled worker is restarted in the background, wait for it like a steady-state server would
+        for _ in range(600):
+            start = perf_counter()
+            try:
+                pool.run(tool_args, 120)
+                return perf_counter() - start
+            except PoolUnavailable:
+                sleep(0.05)
+        raise CommandError("The interpreter pool did not start, see the log for the reason")
@@ -0,0 +1,102 @@
+import os
+import stat
+import asyncio
+import tempfile
+import threading
+import subprocess
+import concurrent.futures
+from time import time
+from django.core.management.base import BaseCommand
+from scanner.services import arun_command
+
+STUB_SCANNER = """#!/bin/sh
+sleep "$1"
+echo "stub scan finished"
+"""
+
+
+class InFlightCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.current -= 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares how many scans can be in flight at once with the thread-per-request WSGI views "
+        "and with the asyncio views, using a stub scanner that only sleeps."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scans', type=int, default=200, help="Number of scans submitted at the same time")
+        parser.add_argument('--scan-seconds', type=float, default=1.0, help="How long each stub scan runs")
+        parser.add_argument('--wsgi-threads', type=int, default=16, help="Worker threads available to the WSGI server")
+
+    def handle(self, *args, **options):
+        scans = options['scans']
+        scan_seconds = options['scan_seconds']
+
+        with tempfile.TemporaryDirectory() as tmp:
+            stub = os.path.join(tmp, 'stub-scanner')
+            with open(stub, 'w') as f:
+                f.write(STUB_SCANNER)
+            os.chmod(stub, os.stat(stub).st_mode | stat.S_IEXEC)
+            cmd = [stub, str(scan_seconds)]
+
+            wsgi = self.bench_wsgi(cmd, scans, options['wsgi_threads'])
+            asgi = self.bench_asgi(cmd, scans)
+
+        self.stdout.write(f"{scans} scans of {scan_seconds}s each")
+        self.stdout.write(f"{'mode':<6}{'peak in-flight':>16}{'peak threads':>14}{'wall time, s':>14}{'scans/s':>10}")
+        for name, (peak, threads, wall) in (('WSGI', wsgi), ('ASGI', asgi)):
+            self.stdout.write(f"{name:<6}{peak:>16}{threads:>14}{wall:>14.2f}{scans / wall:>10.1f}")
+        self.stdout.write(
+            "Before Python 3.12 asyncio reaps each child from a small waiter thread; "
+            "those threads are not request workers and do not limit the WSGI pool."
+        )
+
+    @staticmethod
+    def bench_wsgi(cmd, scans, threads):
+        # Each request holds a worker thread for the whole subprocess.run, as in GenericScanView
+        counter = InFlightCounter()
+        peak_threads = threading.active_count()
+
+        def scan():
+            nonlocal peak_threads
+            with counter:
+                peak_threads = max(peak_threads, threading.active_count())
+                subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+
+        start = time()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda _: scan(), range(scans)))
+        return counter.peak, peak_threads, time() - start
+
+    @staticmethod
+    def bench_asgi(cmd, scans):
+        # One event loop, as in the views from scanner.async_views
+        counter = InFlightCounter()
+        peak_threads = threading.active_count()
+
+        async def scan():
+            nonlocal peak_threads
+            with counter:
+                peak_threads = max(peak_threads, threading.active_count())
+                await arun_command(cmd, 60)
+
+        async def run_all():
+            await asyncio.gather(*(scan() for _ in range(scans)))
+
+        start = time()
+        asyncio.run(run_all())
+        return counter.peak, peak_threads, time() - start
@@ -0,0 +1,49 @@
+from contextlib import ExitStack
+from functools import partial
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from scanner.export import EXPORT_FORMATS, export_queryset, export_records, parse_date_bound
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams scan history as CEF, JSON Lines or syslog records to stdout or a file. "
+        "The id of the last exported scan is printed at the end, pass it to --after-id to continue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='cef')
+        parser.add_argument('--user', help="Username, all users by default")
+        parser.add_argument('--scanner')
+        parser.add_argument('--since', help="Date or ISO 8601 datetime")
+        parser.add_argument('--until', help="Date (included) or ISO 8601 datetime (excluded)")
+        parser.add_argument('--after-id', type=int, default=0)
+        parser.add_argument('--limit', type=int)
+        parser.add_argument('--chunk-size', type=int)
+        parser.add_argument('--output', help="File to append to, stdout by default")
+
+    def handle(self, *args, **options):
+        bounds = {}
+        for name in ('since', 'until'):
+            if options[name]:
+                bounds[name] = parse_date_bound(options[name], end=name == 'until')
+                if bounds[name] is None:
+                    raise CommandError(f"--{name} must be a date or datetime (ISO 8601)")
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user {options['user']!r}")
+
+        scans = export_queryset(user=user, scanner=options['scanner'], after_id=options['after_id'], **bounds)
+        records = export_records(options['format'], scans, options['chunk_size'], options['limit'])
+        last_id, exported = options['after_id'], 0
+        with ExitStack() as stack:
+            if options['output']:
+                write = stack.enter_context(open(options['output'], 'a', encoding='utf-8')).write
+            else:
+                write = partial(self.stdout.write, ending='')
+            for last_id, line in records:
+                write(line)
+                exported += 1
+        self.stderr.write(f"Exported {exported} record(s), last id {last_id}")
@@ -0,0 +1,66 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Exists, OuterRef, Subquery, IntegerField, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from scanner import blobstore
+from scanner.models import ScanBlob, ScanResult
+
+
+class Command(BaseCommand):
+    help = "Deletes scan output blobs that no ScanResult points to any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help="Leave blobs younger than this alone, their row may still be being saved")
+        parser.add_argument('--recount', action='store_true', help="Recompute reference counts from ScanResult first")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(minutes=options['grace_minutes'])
+
+        if options['recount'] and not dry_run:
+            refs = (ScanResult.objects
+                    .filter(output_hash=OuterRef('pk'))
+                    .order_by()
+                    .values('output_hash')
+                    .annotate(n=Count('pk'))
+                    .values('n'))
+            updated = ScanBlob.objects.update(
+                ref_count=Coalesce(Subquery(refs, output_field=IntegerField()), Value(0))
+            )
+            self.stdout.write(f"Recounted references of {updated} blob(s)")
+
+        def in_use(blob_hash):
+            return lambda: ScanBlob.objects.filter(pk=blob_hash).exists()
+
+        unused = ScanBlob.objects.filter(ref_count__lte=0, touched_at__lt=cutoff).filter(
+            ~Exists(ScanResult.objects.filter(output_hash=OuterRef('pk')))
+        )
+        deleted = 0
+        for blob_hash in unused.values_list('hash', flat=True).iterator():
+            if dry_run:
+                deleted += 1
+                continue
+            # The row goes only if it is still unused and untouched, a writer may have taken
+            # the blob since it was listed
+            claimed, _ = unused.filter(pk=blob_hash).delete()
+            if claimed:
+                blobstore.delete_blob_unless(blob_hash, in_use(blob_hash))
+                deleted += 1
+
+        # Files written for a row that was never saved have no ScanBlob at all
+        known = set(ScanBlob.objects.values_list('hash', flat=True))
+        orphans = 0
+        for path in blobstore.iter_blob_files():
+            if path.name in known:
+                continue
+            modified = timezone.datetime.fromtimestamp(path.stat().st_mtime, tz=timezone.get_current_timezone())
+            if modified >= cutoff:
+                continue
+            if dry_run or blobstore.delete_blob_unless(path.name, in_use(path.name)):
+                orphans += 1
+
+        prefix = "Would delete" if dry_run else "Deleted"
+        self.stdout.write(f"{prefix} {deleted} unreferenced blob(s) and {orphans} orphan file(s)")
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from scanner.models import ScanResult
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills output_size/output_preview for older rows and moves inline outputs above "
+        "SCAN_BLOB_THRESHOLD into the blob store, in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # Rows saved before the blob store have output_size 0, newer inline rows only need
+        # a look if the threshold was lowered since. Delta rows stay deltas.
+        pending = Q(output_size=0) | Q(output_size__gt=settings.SCAN_BLOB_THRESHOLD)
+        last_pk = 0
+        processed = 0
+        while True:
+            batch = list(ScanResult.objects
+                         .filter(pending, pk__gt=last_pk, output_hash__isnull=True, output_format='full')
+                         .order_by('pk')
+                         .only('pk', 'output_data', 'output_codec', 'output_hash', 'output_size', 'output_preview')[:batch_size])
+            if not batch:
+                break
+            for scan in batch:
+                # Re-assigning runs the output setter, which picks inline or blob storage
+                scan.output = scan.output
+                scan.save(update_fields=['output_data', 'output_codec', 'output_hash', 'output_size', 'output_preview'])
+            processed += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f"Processed {processed} row(s)")
@@ -0,0 +1,44 @@
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from scanner import search
+from scanner.models import ScanResult, with_chain_outputs
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the full-text index of scan outputs from ScanResult, in batches of one "
+        "transaction each. --start-after resumes an interrupted rebuild."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--start-after', type=int, default=0,
+                            help="Only index rows with a larger id, and keep the existing index")
+
+    def handle(self, *args, **options):
+        backend = search.get_search_backend()
+        if backend is None:
+            raise CommandError("The search index is disabled or not supported by this database")
+        batch_size = options['batch_size']
+        last_pk = options['start_after']
+        if not last_pk:
+            backend.clear()
+
+        scans = with_chain_outputs(
+            ScanResult.objects
+            .filter(pk__gt=last_pk, user__isnull=False)
+            .order_by('pk')
+            .only('pk', 'user_id', 'output_data', 'output_codec', 'output_hash', 'output_format', 'previous_id')
+            .iterator(chunk_size=batch_size)
+        )
+        processed = 0
+        while True:
+            batch = list(islice(scans, batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                search.index_scans(batch)
+            processed += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f"Indexed {processed} row(s), last id {last_pk}")
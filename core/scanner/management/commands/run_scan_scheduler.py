@@ -0,0 +1,42 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from scanner.registry import get_registry
+from scanner.schedules import plan_new_schedules, run_due_schedules, spread_missed_runs
+
+
+class Command(BaseCommand):
+    help = "Queues the runs of scheduled scans (ScheduledScan) when they are due; run_scan_worker executes them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=15.0, help="Seconds between checks for due schedules")
+        parser.add_argument('--catch-up-window', type=int, default=None,
+                            help="Seconds over which runs missed while the scheduler was down are spread "
+                                 "(default: SCAN_SCHEDULE_CATCHUP_WINDOW)")
+        parser.add_argument('--once', action='store_true', help="Queue what is due now and exit")
+
+    def handle(self, *args, **options):
+        get_registry()
+        window = options['catch_up_window']
+        if window is None:
+            window = settings.SCAN_SCHEDULE_CATCHUP_WINDOW
+
+        missed = spread_missed_runs(window)
+        if missed:
+            self.stdout.write(f"Catching up {missed} missed scheduled scan(s) over {window} s")
+        self.stdout.write("Scan scheduler started")
+
+        try:
+            while True:
+                planned = plan_new_schedules()
+                if planned:
+                    self.stdout.write(f"Planned {planned} new schedule(s)")
+                for job in run_due_schedules():
+                    self.stdout.write(f"Queued job {job.pk} ({job.scanner})")
+                close_old_connections()
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping")
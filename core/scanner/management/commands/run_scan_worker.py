@@ -0,0 +1,65 @@
+import time
+import concurrent.futures
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from scanner.registry import get_registry
+from scanner.jobs import cancelled_job_ids, claim_next_job, execute_job, requeue_stale_jobs, worker_id
+from scanner.processes import CancelToken
+
+
+class Command(BaseCommand):
+    help = "Runs queued scan jobs (POST /api/scan/<tool>/ with \"async\": true)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help="Number of scans run at the same time")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit")
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        worker = worker_id()
+        get_registry()
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} abandoned job(s)")
+        self.stdout.write(f"Scan worker {worker} started with concurrency {concurrency}")
+
+        # future -> (job id, CancelToken)
+        running = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                while True:
+                    running = {f: item for f, item in running.items() if not f.done()}
+                    self.cancel_requested(running.values())
+                    job = claim_next_job(worker) if len(running) < concurrency else None
+                    if job:
+                        if job.parent_id:
+                            self.stdout.write(f"Running job {job.pk} ({job.scanner}, shard {job.shard_index} "
+                                              f"of {job.parent_id}, attempt {job.attempts})")
+                        else:
+                            self.stdout.write(f"Running job {job.pk} ({job.scanner})")
+                        cancel = CancelToken()
+                        running[executor.submit(self.run_job, job, cancel)] = (job.pk, cancel)
+                        continue
+                    if options['once'] and not running:
+                        break
+                    time.sleep(poll_interval)
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping, waiting for running scans to finish...")
+
+    def cancel_requested(self, jobs):
+        tokens = {job_id: cancel for job_id, cancel in jobs if not cancel.cancelled}
+        if not tokens:
+            return
+        for job_id in cancelled_job_ids(list(tokens)):
+            self.stdout.write(f"Cancelling job {job_id}")
+            tokens[job_id].cancel()
+
+    @staticmethod
+    def run_job(job, cancel):
+        try:
+            execute_job(job, cancel)
+        finally:
+            close_old_connections()
@@ -0,0 +1,49 @@
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from scanner.export import EXPORT_FORMATS
+from scanner.forwarder import Forwarder, make_transport
+from scanner.models import ScanResult, SiemCursor
+
+
+class Command(BaseCommand):
+    help = (
+        "Forwards new scan results to the SIEM collector in SCAN_SIEM_URL, in batches, resuming "
+        "after the last event the collector accepted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Collector URL (default: SCAN_SIEM_URL)")
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), help="Record format (default: SCAN_SIEM_FORMAT)")
+        parser.add_argument('--name', default='default', help="Cursor name, one per collector")
+        parser.add_argument('--poll-interval', type=float, default=5.0, help="Seconds between checks for new scans")
+        parser.add_argument('--start-at-end', action='store_true',
+                            help="For a new cursor: skip the existing history and only forward new scans")
+        parser.add_argument('--once', action='store_true', help="Forward what is there now and exit")
+
+    def handle(self, *args, **options):
+        url = options['url'] or settings.SCAN_SIEM_URL
+        fmt = options['format'] or settings.SCAN_SIEM_FORMAT
+        if not url:
+            raise CommandError("No collector configured, set SCAN_SIEM_URL or pass --url")
+        if fmt not in EXPORT_FORMATS:
+            raise CommandError(f"Unknown format {fmt!r}")
+        try:
+            transport = make_transport(url, fmt, settings.SCAN_SIEM_TIMEOUT)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['start_at_end'] and not SiemCursor.objects.filter(name=options['name']).exists():
+            last = ScanResult.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            SiemCursor.objects.create(name=options['name'], last_id=last)
+
+        forwarder = Forwarder(transport, name=options['name'], fmt=fmt, poll_interval=options['poll_interval'])
+        signal.signal(signal.SIGTERM, lambda signum, frame: forwarder.stop())
+        self.stdout.write(f"Forwarding scans after id {forwarder.cursor.last_id} to {url} as {fmt}")
+        try:
+            sent = forwarder.run(once=options['once'])
+        except KeyboardInterrupt:
+            forwarder.stop()
+            sent = None
+        forwarder.cursor.refresh_from_db()
+        self.stdout.write(f"Stopped at id {forwarder.cursor.last_id}" + (f", {sent} event(s) sent" if sent is not None else ""))
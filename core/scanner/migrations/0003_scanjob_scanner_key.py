@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0002_scanjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanjob',
+            name='scanner_key',
+            field=models.CharField(blank=True, help_text='Name used for scheduler concurrency limits', max_length=50),
+        ),
+    ]
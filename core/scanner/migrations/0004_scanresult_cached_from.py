@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0003_scanjob_scanner_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanresult',
+            name='cached_from',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cache_hits', to='scanner.scanresult'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:55
+
+import zlib
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def compress_outputs(apps, schema_editor):
+    ScanResult = apps.get_model('scanner', 'ScanResult')
+    last_pk = 0
+    while True:
+        batch = list(ScanResult.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'output')[:BATCH_SIZE])
+        if not batch:
+            break
+        for scan in batch:
+            scan.output_data = zlib.compress((scan.output or '').encode('utf-8'), 6)
+            scan.output_codec = 'zlib'
+        ScanResult.objects.bulk_update(batch, ['output_data', 'output_codec'])
+        last_pk = batch[-1].pk
+
+
+def decompress_outputs(apps, schema_editor):
+    ScanResult = apps.get_model('scanner', 'ScanResult')
+    last_pk = 0
+    while True:
+        batch = list(ScanResult.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'output_data')[:BATCH_SIZE])
+        if not batch:
+            break
+        for scan in batch:
+            scan.output = zlib.decompress(bytes(scan.output_data)).decode('utf-8') if scan.output_data else ''
+        ScanResult.objects.bulk_update(batch, ['output'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0004_scanresult_cached_from'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanresult',
+            name='output_codec',
+            field=models.CharField(default='zlib', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='output_data',
+            field=models.BinaryField(default=b''),
+        ),
+        # A default lets the column be added back with existing rows when migrating backwards
+        migrations.AlterField(
+            model_name='scanresult',
+            name='output',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunPython(compress_outputs, decompress_outputs),
+        migrations.RemoveField(
+            model_name='scanresult',
+            name='output',
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0005_compress_scanresult_output'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanBlob',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.PositiveBigIntegerField()),
+                ('codec', models.CharField(default='zlib', max_length=10)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='output_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='output_preview',
+            field=models.CharField(blank=True, editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='output_size',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
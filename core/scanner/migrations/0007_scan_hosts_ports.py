@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0006_scan_blob_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanHost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=45)),
+                ('address_type', models.CharField(default='ipv4', max_length=10)),
+                ('hostname', models.CharField(blank=True, max_length=255)),
+                ('mac_address', models.CharField(blank=True, max_length=17)),
+                ('state', models.CharField(blank=True, max_length=10)),
+                ('scan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hosts', to='scanner.scanresult')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScanPort',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('protocol', models.CharField(default='tcp', max_length=10)),
+                ('port', models.PositiveIntegerField()),
+                ('state', models.CharField(max_length=20)),
+                ('reason', models.CharField(blank=True, max_length=50)),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ports', to='scanner.scanhost')),
+            ],
+            options={
+                'ordering': ['port'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ScanService',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=100)),
+                ('product', models.CharField(blank=True, max_length=255)),
+                ('version', models.CharField(blank=True, max_length=100)),
+                ('extra_info', models.CharField(blank=True, max_length=255)),
+                ('tunnel', models.CharField(blank=True, max_length=20)),
+                ('cpe', models.CharField(blank=True, max_length=255)),
+                ('port', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='service', to='scanner.scanport')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='scanhost',
+            index=models.Index(fields=['address'], name='scanner_sca_address_04beef_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scanport',
+            index=models.Index(fields=['port', 'state'], name='scanner_sca_port_163688_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scanport',
+            index=models.Index(fields=['state'], name='scanner_sca_state_8f06da_idx'),
+        ),
+    ]
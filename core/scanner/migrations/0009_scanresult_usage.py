@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0008_scanjob_cancel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanresult',
+            name='cpu_system_sec',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='cpu_user_sec',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='exit_code',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='max_rss_kb',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0009_scanresult_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scanjob',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='scanner.scanjob'),
+        ),
+        migrations.AddField(
+            model_name='scanjob',
+            name='shard_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scanjob',
+            name='shard_index',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0010_scanjob_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanjob',
+            name='target_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ScanJobTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('target', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('error_output', models.TextField(blank=True)),
+                ('duration_sec', models.FloatField(blank=True, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='targets', to='scanner.scanjob')),
+                ('result', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='scanner.scanresult')),
+            ],
+            options={
+                'ordering': ['job', 'index'],
+                'indexes': [models.Index(fields=['job', 'status'], name='scanner_sca_job_id_1230c4_idx')],
+                'constraints': [models.UniqueConstraint(fields=('job', 'index'), name='unique_scan_job_target')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0011_bulk_scan_targets'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledScan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('scanner', models.CharField(max_length=50)),
+                ('args', models.JSONField(default=list, help_text="The user's arguments, the scanner defaults are added when queued")),
+                ('cron', models.CharField(max_length=100)),
+                ('timeout', models.PositiveIntegerField(default=180)),
+                ('enabled', models.BooleanField(default=True)),
+                ('next_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('runs', models.PositiveIntegerField(default=0)),
+                ('skipped_runs', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='scanner.scanjob')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_scans', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['next_run_at'],
+                'indexes': [models.Index(fields=['enabled', 'next_run_at'], name='scanner_sch_enabled_33121e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0012_scheduled_scans'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanresult',
+            name='chain_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='chain_position',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='output_format',
+            field=models.CharField(default='full', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='previous',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='next_scans', to='scanner.scanresult'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The full-text index of scanner.search. Existing rows are indexed by `rebuild_scan_search_index`.
+CREATE_SQL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE scanner_scanresult_search USING fts5(output, tokenize = 'unicode61')",
+    ],
+    'postgresql': [
+        "CREATE TABLE scanner_scanresult_search ("
+        "scan_id bigint PRIMARY KEY REFERENCES scanner_scanresult (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+        "output text NOT NULL, document tsvector NOT NULL)",
+        "CREATE INDEX scanner_scanresult_search_document ON scanner_scanresult_search USING gin (document)",
+    ],
+}
+
+
+def create_search_table(apps, schema_editor):
+    for sql in CREATE_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute("DROP TABLE IF EXISTS scanner_scanresult_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0013_scan_delta_chains'),
+        ('users', '0002_integrationpartner_coupon_couponredemption_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanresult',
+            name='folder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scans', to='users.scanfolder'),
+        ),
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0015_siem_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanblob',
+            name='touched_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+from scanner.compression import decompress_text
+
+BATCH_SIZE = 500
+OUTPUT_PREVIEW_LENGTH = 500
+
+
+def fill_output_sizes(apps, schema_editor):
+    # Rows compressed by 0005 got the output_size and output_preview columns in 0006 but no
+    # values. Rows saved since then had them set by ScanResult.output, so a size of 0 there
+    # means an empty output.
+    ScanResult = apps.get_model('scanner', 'ScanResult')
+    pending = ScanResult.objects.filter(output_size=0, output_format='full', output_hash__isnull=True)
+    last_pk = 0
+    while True:
+        batch = list(pending.filter(pk__gt=last_pk).order_by('pk').only('pk', 'output_codec', 'output_data')[:BATCH_SIZE])
+        if not batch:
+            break
+        changed = []
+        for scan in batch:
+            text = decompress_text(scan.output_codec, scan.output_data)
+            if text:
+                scan.output_size = len(text.encode('utf-8'))
+                scan.output_preview = text[:OUTPUT_PREVIEW_LENGTH]
+                changed.append(scan)
+        ScanResult.objects.bulk_update(changed, ['output_size', 'output_preview'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanner', '0016_scan_blob_touched_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_output_sizes, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,70 @@
+import json
+import uuid
+from django.conf import settings
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .compression import compress_text, decompress_text
+from .deltas import apply_delta, chain_key, encode_delta
+from . import blobstore, search
+
+OUTPUT_PREVIEW_LENGTH = 500
+
+
+class ScanBlob(models.Model):
+    """
+    A large scan output stored on disk by content hash (see scanner.blobstore).
+    ref_count is the number of ScanResult rows pointing at it; `gc_scan_blobs` removes blobs nobody uses.
+    """
+    hash = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    codec = models.CharField(max_length=10, default='zlib')
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last time an output with this content was written; gc leaves younger blobs alone
+    touched_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def touch(cls, blob_hash, size, codec):
+        """
+        Registers a blob about to be used, before its file is looked for. Returns the codec
+        of the stored file.
+        """
+        if cls.objects.filter(pk=blob_hash).update(touched_at=timezone.now()):
+            return cls.objects.filter(pk=blob_hash).values_list('codec', flat=True).first() or codec
+        blob, _ = cls.objects.get_or_create(hash=blob_hash, defaults={'size': size, 'codec': codec, 'ref_count': 0})
+        return blob.codec
+
+    @classmethod
+    def acquire(cls, blob_hash, size, codec):
+        blob, created = cls.objects.get_or_create(hash=blob_hash, defaults={'size': size, 'codec': codec, 'ref_count': 1})
+        if not created:
+            cls.objects.filter(pk=blob_hash).update(ref_count=F('ref_count') + 1)
+
+    @classmethod
+    def release(cls, blob_hash):
+        cls.objects.filter(pk=blob_hash).update(ref_count=F('ref_count') - 1)
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.size} bytes, {self.ref_count} refs)"
 
 
 class ScanResult(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     scanner = models.CharField(max_length=50)
     command = models.TextField()
-    output = models.TextField()
+    # Scanner output, read and written through the `output` property: compressed in
+    # output_data, or in the blob store when larger than SCAN_BLOB_THRESHOLD bytes
+    output_data = models.BinaryField(default=b'', editable=False)
+    output_codec = models.CharField(max_length=10, default='zlib', editable=False)
+    output_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True, editable=False)
+    output_size = models.PositiveBigIntegerField(default=0, editable=False)
+    output_preview = models.CharField(max_length=OUTPUT_PREVIEW_LENGTH, blank=True, editable=False)
+    # 'delta': output_data holds the line delta against `previous` (scanner.deltas)
+    output_format = models.CharField(max_length=10, default='full', editable=False)
     ip_address = models.CharField(max_length=100, null=True, blank=True)
     mac_address = models.CharField(max_length=100, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -27,5 +85,327 @@ class ScanResult(models.Model):
     org = models.CharField(max_length=200, blank=True, null=True)
     asn = models.CharField(max_length=50, blank=True, null=True)
 
+    folder = models.ForeignKey('users.ScanFolder', on_delete=models.SET_NULL, null=True, blank=True, related_name='scans')
+
+    # Set when the output was served from the result cache of an earlier identical scan
+    cached_from = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='cache_hits')
+
+    # Scans of one (user, scanner, command) form a chain; chain_position counts the deltas
+    # since the last full snapshot
+    chain_key = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    previous = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='next_scans', editable=False)
+    chain_position = models.PositiveIntegerField(default=0, editable=False)
+
+    # Accounting of the scanner process (empty for cache hits; CPU and memory are only
+    # collected where the platform reports them). output_size is the bytes of output.
+    exit_code = models.IntegerField(null=True, blank=True)
+    cpu_user_sec = models.FloatField(null=True, blank=True)
+    cpu_system_sec = models.FloatField(null=True, blank=True)
+    max_rss_kb = models.PositiveBigIntegerField(null=True, blank=True)
+
+    @property
+    def output(self):
+        """
+        Loaded on first access. List queries should defer output_data so it is never loaded.
+        """
+        if not hasattr(self, '_output_cache'):
+            if self.output_hash:
+                self._output_cache = blobstore.read_blob(self.output_hash, self.output_codec)
+            elif self.output_format == 'delta':
+                operations = json.loads(decompress_text(self.output_codec, self.output_data))
+                self._output_cache = apply_delta(self.previous.output, operations)
+            else:
+                self._output_cache = decompress_text(self.output_codec, self.output_data)
+        return self._output_cache
+
+    @output.setter
+    def output(self, value):
+        value = value or ''
+        size = len(value.encode('utf-8'))
+        if not hasattr(self, '_saved_output_hash'):
+            self._saved_output_hash = self.output_hash if self.pk else None
+
+        if size > settings.SCAN_BLOB_THRESHOLD:
+            self.output_hash, size, self.output_codec = blobstore.write_blob(value, settings.SCAN_OUTPUT_CODEC, ScanBlob.touch)
+            self.output_data = b''
+        else:
+            self.output_hash = None
+            self.output_codec, self.output_data = compress_text(value, settings.SCAN_OUTPUT_CODEC)
+        self.output_format = 'full'
+        self.output_size = size
+        self.output_preview = value[:OUTPUT_PREVIEW_LENGTH]
+        self._output_cache = value
+
+    def link_to_chain(self):
+        """
+        For a new row: links it to the previous scan of its chain and, unless a full snapshot is
+        due (every SCAN_DELTA_SNAPSHOT_EVERY scans) or the outputs differ too much, stores the
+        output as a line delta against it. Called by save(); bulk inserts call it themselves.
+        """
+        every = settings.SCAN_DELTA_SNAPSHOT_EVERY
+        if self.pk or not self.user_id or self.chain_key or not hasattr(self, '_output_cache'):
+            return
+        self.chain_key = chain_key(self.user_id, self.scanner, self.command)
+        previous = ScanResult.objects.filter(chain_key=self.chain_key).order_by('-pk').first()
+        if previous is None:
+            return
+        self.previous = previous
+        if not every or previous.chain_position + 1 >= every:
+            self.chain_position = 0
+            return
+
+        operations, copied = encode_delta(previous.output, self._output_cache)
+        # Less than half of the lines reused: a snapshot is as small and faster to read
+        if copied * 2 < len(self._output_cache.splitlines()):
+            self.chain_position = 0
+            return
+        self.output_codec, self.output_data = compress_text(
+            json.dumps(operations, separators=(',', ':')), settings.SCAN_OUTPUT_CODEC
+        )
+        # A blob the setter already wrote is left to gc_scan_blobs if nothing else uses it
+        self.output_hash = None
+        self.output_format = 'delta'
+        self.chain_position = previous.chain_position + 1
+
+    def store_full(self):
+        """
+        Rewrites a delta row as a full snapshot, e.g. before the row it is based on is deleted.
+        """
+        if self.output_format != 'delta':
+            return
+        self.output = self.output
+        self.chain_position = 0
+        self.save(update_fields=['output_data', 'output_codec', 'output_hash', 'output_size',
+                                 'output_preview', 'output_format', 'chain_position'])
+
+    def save(self, *args, **kwargs):
+        self.link_to_chain()
+        super().save(*args, **kwargs)
+        # Keep blob reference counts in step with the hash this row points at
+        if hasattr(self, '_saved_output_hash'):
+            previous = self._saved_output_hash
+            del self._saved_output_hash
+            if previous != self.output_hash:
+                if self.output_hash:
+                    ScanBlob.acquire(self.output_hash, self.output_size, self.output_codec)
+                if previous:
+                    ScanBlob.release(previous)
+
     def __str__(self):
         return f"{self.user or 'Guest'} — {self.scanner} — {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+def with_chain_outputs(scans, keep=1000):
+    """
+    Yields the scans of an iterable ordered by id, pointing delta rows at the row before them
+    in their chain, so reading a chain in order decompresses each output once instead of the
+    chain's whole history for every row. A delta is always based on the newest row of its
+    chain, so only that row is kept, for the last `keep` chains.
+    """
+    previous_field = ScanResult._meta.get_field('previous')
+    latest = {}
+    for scan in scans:
+        if scan.chain_key:
+            previous = latest.pop(scan.chain_key, None)
+            if previous is not None:
+                if scan.output_format == 'delta' and scan.previous_id == previous.pk:
+                    scan.previous = previous
+                # Once its own output is known, the row before it is not needed any more
+                if hasattr(previous, '_output_cache') and previous_field.is_cached(previous):
+                    previous_field.delete_cached_value(previous)
+            latest[scan.chain_key] = scan
+            if len(latest) > keep:
+                del latest[next(iter(latest))]
+        yield scan
+
+
+class ScanJob(models.Model):
+    """
+    A scan queued from the API and executed later by the `run_scan_worker` command.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_CANCELLED, 'Cancelled'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='scan_jobs')
+    scanner = models.CharField(max_length=255)
+    scanner_key = models.CharField(max_length=50, blank=True, help_text="Name used for scheduler concurrency limits")
+    args = models.JSONField(default=list)
+    timeout = models.PositiveIntegerField(default=180)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    result = models.OneToOneField(ScanResult, on_delete=models.SET_NULL, null=True, blank=True, related_name='job')
+    error = models.TextField(blank=True)
+    error_output = models.TextField(blank=True)
+    duration_sec = models.FloatField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Set by DELETE /jobs/<id>/, the worker running the job kills its processes on its next poll
+    cancel_requested_at = models.DateTimeField(null=True, blank=True)
+
+    # Sharded scans (scanner.sharding): the parent job only collects its shards, which run as
+    # ordinary jobs and are retried on their own. shard_count is 0 for every other job.
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='shards')
+    shard_index = models.PositiveIntegerField(null=True, blank=True)
+    shard_count = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    # Bulk scans: one job runs the scanner against every ScanJobTarget, args are the shared options
+    target_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED, self.STATUS_CANCELLED)
+
+    def __str__(self):
+        return f"{self.user or 'Guest'} — {self.scanner} — {self.status}"
+
+
+class ScheduledScan(models.Model):
+    """
+    A scan queued again and again on a cron schedule (UTC) by the `run_scan_scheduler` command.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scheduled_scans')
+    name = models.CharField(max_length=100, blank=True)
+    scanner = models.CharField(max_length=50)
+    args = models.JSONField(default=list, help_text="The user's arguments, the scanner defaults are added when queued")
+    cron = models.CharField(max_length=100)
+    timeout = models.PositiveIntegerField(default=180)
+    enabled = models.BooleanField(default=True)
+
+    # The cron time plus a random delay, so schedules on the same minute do not all start together
+    next_run_at = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_job = models.ForeignKey(ScanJob, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_error = models.TextField(blank=True)
+    runs = models.PositiveIntegerField(default=0)
+    skipped_runs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['next_run_at']
+        indexes = [models.Index(fields=['enabled', 'next_run_at'])]
+
+    def __str__(self):
+        return f"{self.user} — {self.scanner} — {self.cron}"
+
+
+class ScanJobTarget(models.Model):
+    """
+    One target of a bulk scan job and its outcome.
+    """
+    job = models.ForeignKey(ScanJob, on_delete=models.CASCADE, related_name='targets')
+    index = models.PositiveIntegerField()
+    target = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=ScanJob.STATUS_CHOICES, default=ScanJob.STATUS_QUEUED)
+    result = models.ForeignKey(ScanResult, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    error = models.TextField(blank=True)
+    error_output = models.TextField(blank=True)
+    duration_sec = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['job', 'index']
+        constraints = [models.UniqueConstraint(fields=['job', 'index'], name='unique_scan_job_target')]
+        indexes = [models.Index(fields=['job', 'status'])]
+
+    def __str__(self):
+        return f"{self.target} — {self.status}"
+
+
+class SiemCursor(models.Model):
+    """
+    How far the `run_siem_forwarder` command got: the id of the last ScanResult the collector
+    accepted. One row per forwarder name, so several collectors can be fed independently.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    sent = models.PositiveBigIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} — {self.last_id}"
+
+
+class ScanHost(models.Model):
+    """
+    A host from nmap's XML report (see scanner.nmap_results), one row per <host> element.
+    """
+    scan = models.ForeignKey(ScanResult, on_delete=models.CASCADE, related_name='hosts')
+    address = models.CharField(max_length=45)
+    address_type = models.CharField(max_length=10, default='ipv4')
+    hostname = models.CharField(max_length=255, blank=True)
+    mac_address = models.CharField(max_length=17, blank=True)
+    state = models.CharField(max_length=10, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['address'])]
+
+    def __str__(self):
+        return f"{self.address} ({self.state})"
+
+
+class ScanPort(models.Model):
+    host = models.ForeignKey(ScanHost, on_delete=models.CASCADE, related_name='ports')
+    protocol = models.CharField(max_length=10, default='tcp')
+    port = models.PositiveIntegerField()
+    state = models.CharField(max_length=20)
+    reason = models.CharField(max_length=50, blank=True)
+
+    class Meta:
+        ordering = ['port']
+        indexes = [models.Index(fields=['port', 'state']), models.Index(fields=['state'])]
+
+    def __str__(self):
+        return f"{self.port}/{self.protocol} {self.state}"
+
+
+class ScanService(models.Model):
+    port = models.OneToOneField(ScanPort, on_delete=models.CASCADE, related_name='service')
+    name = models.CharField(max_length=100, db_index=True)
+    product = models.CharField(max_length=255, blank=True)
+    version = models.CharField(max_length=100, blank=True)
+    extra_info = models.CharField(max_length=255, blank=True)
+    tunnel = models.CharField(max_length=20, blank=True)
+    cpe = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return ' '.join(filter(None, [self.name, self.product, self.version]))
+
+
+@receiver(pre_delete, sender=ScanResult)
+def materialize_delta_children(sender, instance, **kwargs):
+    # Rows stored as a delta against this one cannot be rebuilt once it is gone
+    for scan in ScanResult.objects.filter(previous=instance, output_format='delta'):
+        scan.store_full()
+
+@receiver(post_delete, sender=ScanResult)
+def release_output_blob(sender, instance, **kwargs):
+    if instance.output_hash:
+        ScanBlob.release(instance.output_hash)
+
+@receiver(post_save, sender=ScanResult)
+def index_scan_output(sender, instance, created, update_fields=None, **kwargs):
+    # Saves that do not touch the output (e.g. moving the scan to a folder) keep the index entry
+    if created or update_fields is None or 'output_data' in update_fields:
+        search.index_scans([instance])
+
+@receiver(post_delete, sender=ScanResult)
+def remove_scan_output(sender, instance, **kwargs):
+    search.remove_scans([instance.pk])
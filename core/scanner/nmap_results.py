@@ -0,0 +1,226 @@
+import logging
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from django.db import transaction
+from .models import ScanHost, ScanPort, ScanService
+from .executors import get_executor
+
+logger = logging.getLogger(__name__)
+
+# nmap runs also write an XML report, which is loaded into ScanHost/ScanPort/ScanService
+# so questions like "which hosts have 3389 open" are indexed lookups, not output greps.
+
+NMAP_SCANNER = "nmap"
+IMPORT_BATCH_SIZE = 500
+# Options with which the user already sent the XML report somewhere else
+XML_OUTPUT_OPTIONS = ('-oX', '-oA')
+
+
+def wants_xml_report(scanner, args):
+    return scanner == NMAP_SCANNER and not any(arg.startswith(XML_OUTPUT_OPTIONS) for arg in args)
+
+class NoReport:
+    def __call__(self, scan):
+        return 0
+
+    def hosts(self):
+        return []
+
+
+class XMLReport:
+    """
+    The import_report of xml_report: calling it loads the report into a scan,
+    hosts() only parses it (for rows that are saved later with bulk_create).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, scan):
+        # The text output is already saved, a broken report must not fail the scan
+        try:
+            return import_nmap_xml(scan, self.path)
+        except Exception:
+            logger.exception("Could not import nmap XML for scan %s", scan.pk)
+            return 0
+
+    def hosts(self):
+        hosts = []
+        try:
+            if os.path.getsize(self.path) == 0:
+                return hosts
+            for host in iter_nmap_hosts(self.path):
+                hosts.append(host)
+        except ET.ParseError as e:
+            logger.warning("nmap XML %s is incomplete: %s", self.path, e)
+        except OSError:
+            logger.exception("Could not read nmap XML %s", self.path)
+        return hosts
+
+
+@contextmanager
+def xml_report(scanner, args):
+    """
+    Yields (args to run, import_report). For nmap the args also ask for an XML report in a
+    temporary file and import_report(scan) loads it; otherwise the args are unchanged and
+    import_report does nothing.
+    """
+    if not wants_xml_report(scanner, args):
+        yield list(args), NoReport()
+        return
+
+    fd, path = tempfile.mkstemp(prefix='nmap-', suffix='.xml')
+    os.close(fd)
+    try:
+        yield list(args) + ['-oX', get_executor().path(path)], XMLReport(path)
+    finally:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+def _text(value, max_length):
+    return (value or '')[:max_length]
+
+def parse_host(elem):
+    addresses = {a.get('addrtype'): a.get('addr') for a in elem.iterfind('address')}
+    address_type = next((t for t in ('ipv4', 'ipv6') if t in addresses), None)
+    hostname = elem.find('hostnames/hostname')
+    status = elem.find('status')
+
+    ports = []
+    for port in elem.iterfind('ports/port'):
+        state = port.find('state')
+        service = port.find('service')
+        ports.append({
+            "protocol": port.get('protocol', 'tcp'),
+            "port": int(port.get('portid')),
+            "state": state.get('state', '') if state is not None else '',
+            "reason": _text(state.get('reason') if state is not None else '', 50),
+            "service": None if service is None else {
+                "name": _text(service.get('name'), 100),
+                "product": _text(service.get('product'), 255),
+                "version": _text(service.get('version'), 100),
+                "extra_info": _text(service.get('extrainfo'), 255),
+                "tunnel": _text(service.get('tunnel'), 20),
+                "cpe": _text(service.findtext('cpe'), 255),
+            },
+        })
+
+    return {
+        "address": addresses.get(address_type) or addresses.get('mac', ''),
+        "address_type": address_type or 'mac',
+        "hostname": _text(hostname.get('name') if hostname is not None else '', 255),
+        "mac_address": _text(addresses.get('mac'), 17),
+        "state": status.get('state', '') if status is not None else '',
+        "ports": ports,
+    }
+
+def iter_nmap_hosts(source):
+    """
+    Yields one dict per <host> of an nmap XML report (a path or a file object).
+    Elements are dropped as soon as they are read, memory does not grow with the report.
+    """
+    root = None
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if root is None:
+            root = elem
+        if event == 'end' and elem.tag == 'host':
+            yield parse_host(elem)
+            root.clear()
+
+def save_hosts(scan, hosts):
+    with transaction.atomic():
+        host_rows = ScanHost.objects.bulk_create([
+            ScanHost(
+                scan=scan,
+                address=host["address"],
+                address_type=host["address_type"],
+                hostname=host["hostname"],
+                mac_address=host["mac_address"],
+                state=host["state"],
+            )
+            for host in hosts
+        ])
+
+        port_rows, services = [], []
+        for host_row, host in zip(host_rows, hosts):
+            for port in host["ports"]:
+                port_rows.append(ScanPort(
+                    host=host_row, protocol=port["protocol"], port=port["port"],
+                    state=port["state"], reason=port["reason"],
+                ))
+                services.append(port["service"])
+        ScanPort.objects.bulk_create(port_rows)
+        ScanService.objects.bulk_create([
+            ScanService(port=port_row, **service) for port_row, service in zip(port_rows, services) if service
+        ])
+    return len(host_rows)
+
+def import_nmap_xml(scan, source, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Loads an nmap XML report into the hosts of scan and returns how many were saved.
+    A report cut short (nmap killed on timeout) keeps the hosts read before the cut.
+    """
+    if isinstance(source, (str, os.PathLike)) and os.path.getsize(source) == 0:
+        return 0
+
+    saved = 0
+    batch = []
+    try:
+        for host in iter_nmap_hosts(source):
+            batch.append(host)
+            if len(batch) >= batch_size:
+                saved += save_hosts(scan, batch)
+                batch = []
+    except ET.ParseError as e:
+        logger.warning("nmap XML for scan %s is incomplete: %s", scan.pk, e)
+    if batch:
+        saved += save_hosts(scan, batch)
+    return saved
+
+def port_states(scan_id):
+    """
+    {(address, protocol, port): state} of an imported nmap scan.
+    """
+    rows = ScanPort.objects.filter(host__scan_id=scan_id).values_list('host__address', 'protocol', 'port', 'state')
+    return {(address, protocol, port): state for address, protocol, port, state in rows}
+
+def diff_ports(old_scan_id, new_scan_id):
+    """
+    Ports that are open in the newer scan but were not (opened) and the other way round (closed).
+    """
+    old, new = port_states(old_scan_id), port_states(new_scan_id)
+    old_open = {key for key, state in old.items() if state == 'open'}
+    new_open = {key for key, state in new.items() if state == 'open'}
+
+    def rows(keys):
+        return [{"address": address, "protocol": protocol, "port": port} for address, protocol, port in sorted(keys)]
+
+    return {"opened": rows(new_open - old_open), "closed": rows(old_open - new_open)}
+
+def copy_report(scanner, source_scan_id, scan):
+    """
+    Gives a cached copy of an nmap result its own hosts, so it shows up in the owner's queries.
+    """
+    if scanner != NMAP_SCANNER:
+        return 0
+    hosts = []
+    for host in ScanHost.objects.filter(scan_id=source_scan_id).prefetch_related('ports__service'):
+        ports = []
+        for port in host.ports.all():
+            service = getattr(port, 'service', None)
+            ports.append({
+                "protocol": port.protocol, "port": port.port, "state": port.state, "reason": port.reason,
+                "service": None if service is None else {
+                    "name": service.name, "product": service.product, "version": service.version,
+                    "extra_info": service.extra_info, "tunnel": service.tunnel, "cpe": service.cpe,
+                },
+            })
+        hosts.append({
+            "address": host.address, "address_type": host.address_type, "hostname": host.hostname,
+            "mac_address": host.mac_address, "state": host.state, "ports": ports,
+        })
+    return save_hosts(scan, hosts) if hosts else 0
@@ -0,0 +1,171 @@
+"""
+Worker process of scanner.python_pool. It is started with the tool's own interpreter
+(possibly inside WSL), so it must only use the standard library and must not import Django.
+
+    python -u pool_worker.py [--path DIR]... [--preload MODULE]...
+
+The worker imports the preload modules once, prints {"ready": ...} and then reads one JSON
+job per line from stdin: {"script": ..., "args": [...], "timeout": seconds}. Every job runs
+in a forked child, so the tool starts with everything already imported but cannot leak
+state into the next job. The reply is one JSON line with returncode, usage
+(CPU time, peak memory), stdout, stderr and timed_out.
+"""
+import importlib
+import json
+import os
+import runpy
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+POLL_INTERVAL = 0.02
+PR_SET_PDEATHSIG = 1
+
+
+def parse_options(argv):
+    paths, preload = [], []
+    i = 0
+    while i < len(argv):
+        if argv[i] == '--path':
+            paths.append(argv[i + 1])
+        elif argv[i] == '--preload':
+            preload.append(argv[i + 1])
+        i += 2
+    return paths, preload
+
+def preload_modules(paths, modules):
+    for path in paths:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    loaded, failed = [], []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception:
+            failed.append(name)
+    return loaded, failed
+
+def die_with_parent():
+    # Linux only: the job is killed when its worker is (e.g. a cancelled scan)
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.prctl(PR_SET_PDEATHSIG, signal.SIGKILL)
+    except Exception:
+        pass
+
+def run_child(script, args, stdout_fd, stderr_fd):
+    # In the forked child: own process group (so a timeout kills whatever the tool starts),
+    # no access to the job pipe, output into the files the parent reads afterwards
+    os.setpgid(0, 0)
+    die_with_parent()
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(stdout_fd, 1)
+    os.dup2(stderr_fd, 2)
+    code = 0
+    try:
+        script_dir = os.path.dirname(os.path.abspath(script))
+        os.chdir(script_dir)
+        sys.path[0] = script_dir
+        sys.argv = [script] + list(args)
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            sys.stderr.write(f"{e.code}\n")
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+def rusage_dict(rusage):
+    # Same fields as scanner.processes.usage_from_rusage; ru_maxrss is in bytes on macOS
+    max_rss = rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+    return {
+        "cpu_user_sec": round(rusage.ru_utime, 3),
+        "cpu_system_sec": round(rusage.ru_stime, 3),
+        "max_rss_kb": max_rss,
+    }
+
+def wait_child(pid, timeout):
+    """
+    Returns (returncode, timed_out, usage) once the job's child has exited.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        waited, status, rusage = os.wait4(pid, os.WNOHANG)
+        if waited:
+            returncode = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status >> 8
+            return returncode, False, rusage_dict(rusage)
+        if time.monotonic() >= deadline:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            _, _, rusage = os.wait4(pid, 0)
+            return -signal.SIGKILL, True, rusage_dict(rusage)
+        time.sleep(POLL_INTERVAL)
+
+def read_all(f):
+    f.seek(0)
+    return f.read().decode('utf-8', errors='replace')
+
+def run_job(job):
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            run_child(job["script"], job.get("args", []), out.fileno(), err.fileno())
+        returncode, timed_out, usage = wait_child(pid, job.get("timeout") or 180)
+        return {
+            "returncode": returncode,
+            "usage": usage,
+            "stdout": read_all(out),
+            "stderr": read_all(err),
+            "timed_out": timed_out,
+        }
+
+def main():
+    # Replies go to a private copy of stdout, anything printed by preloaded
+    # modules ends up on stderr instead of corrupting the protocol
+    reply_fd = os.dup(1)
+    os.dup2(2, 1)
+    replies = os.fdopen(reply_fd, 'w', buffering=1)
+
+    def reply(payload):
+        replies.write(json.dumps(payload) + "\n")
+        replies.flush()
+
+    if not hasattr(os, 'fork'):
+        reply({"error": "os.fork is not available in this interpreter"})
+        return
+
+    paths, modules = parse_options(sys.argv[1:])
+    loaded, failed = preload_modules(paths, modules)
+    reply({"ready": True, "pid": os.getpid(), "preloaded": loaded, "failed": failed})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            reply(run_job(json.loads(line)))
+        except Exception as e:
+            reply({"error": str(e)})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+# Every scanner runs in its own process group (its own session on POSIX), so a timeout or
+# a cancel can kill the scanner together with everything it started.
+
+if os.name == 'nt':
+    NEW_PROCESS_GROUP = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+else:
+    NEW_PROCESS_GROUP = {'start_new_session': True}
+
+
+class ScanCancelled(Exception):
+    pass
+
+
+def usage_from_rusage(rusage):
+    """
+    The ScanResult accounting fields from a resource.struct_rusage of one child.
+    """
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+    return {
+        "cpu_user_sec": round(rusage.ru_utime, 3),
+        "cpu_system_sec": round(rusage.ru_stime, 3),
+        "max_rss_kb": max_rss,
+    }
+
+def result_usage(returncode, usage=None):
+    """
+    The accounting fields of a ScanResult: exit code, plus CPU time and peak memory when collected.
+    """
+    return {"exit_code": returncode, **(usage or {})}
+
+
+class ScanPopen(subprocess.Popen):
+    """
+    Popen that keeps the rusage of the child when wait()/communicate() reap it (POSIX only).
+    With the WSL executor on Windows nothing is collected.
+    """
+    usage = None
+
+    if hasattr(os, 'wait4'):
+        def _try_wait(self, wait_flags):
+            try:
+                pid, status, rusage = os.wait4(self.pid, wait_flags)
+            except ChildProcessError:
+                # Same as Popen: the child was reaped elsewhere, its status is lost
+                return self.pid, 0
+            if pid == self.pid:
+                self.usage = usage_from_rusage(rusage)
+            return pid, status
+
+
+def kill_process_tree(process):
+    """
+    Kills process and its descendants. process is a Popen or an asyncio Process.
+    """
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == 'nt':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], capture_output=True)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (OSError, subprocess.SubprocessError):
+        pass
+    try:
+        process.kill()
+    except (OSError, ProcessLookupError):
+        pass
+
+
+class CancelToken:
+    """
+    Cancels one scan from another thread: kills the processes attached to it and
+    wakes up whatever registered a callback (e.g. a wait for a scheduler slot).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._processes = set()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            processes = list(self._processes)
+            callbacks = list(self._callbacks)
+        for process in processes:
+            kill_process_tree(process)
+        for callback in callbacks:
+            callback()
+
+    def attach(self, process):
+        with self._lock:
+            if not self._cancelled:
+                self._processes.add(process)
+                return
+        kill_process_tree(process)
+
+    def detach(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def add_callback(self, callback):
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def check(self):
+        if self._cancelled:
+            raise ScanCancelled("Scan cancelled")
+
+
+def run_process(cmd, timeout, cancel=None):
+    """
+    subprocess.run(cmd, capture_output=True, text=True, timeout=timeout) for scanners: on timeout
+    or cancel the whole process group is killed, not only the direct child.
+    The result's `usage` holds the exit code, CPU time and peak memory (see result_usage).
+    Raises subprocess.TimeoutExpired or ScanCancelled.
+    """
+    process = ScanPopen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors='replace', **NEW_PROCESS_GROUP
+    )
+    if cancel is not None:
+        cancel.attach(process)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_process_tree(process)
+        stdout, stderr = process.communicate()
+        raise subprocess.TimeoutExpired(cmd, timeout, output=stdout, stderr=stderr)
+    except BaseException:
+        kill_process_tree(process)
+        process.wait()
+        raise
+    finally:
+        if cancel is not None:
+            cancel.detach(process)
+    if cancel is not None:
+        cancel.check()
+    result = subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+    result.usage = result_usage(process.returncode, process.usage)
+    return result
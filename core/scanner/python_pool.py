@@ -0,0 +1,255 @@
+import json
+import logging
+import os
+import posixpath
+import queue
+import subprocess
+import threading
+from time import monotonic
+from django.conf import settings
+from .executors import get_executor
+from .processes import NEW_PROCESS_GROUP, kill_process_tree, result_usage
+
+logger = logging.getLogger(__name__)
+
+# The Python based tools (settings.SCAN_PYTHON_POOL) run in interpreters started ahead of
+# time with their imports done (scanner/pool_worker.py). A job costs a fork instead of an
+# interpreter start. Whenever no worker can take a job, callers fall back to a plain subprocess.
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pool_worker.py')
+STARTUP_TIMEOUT = 30
+# Extra time for the reply to arrive after the worker itself killed a job on timeout
+REPLY_GRACE_SECONDS = 5
+# After a worker failed to start, the pool is not tried again for this long
+RETRY_AFTER_SECONDS = 60
+
+
+class PoolUnavailable(Exception):
+    pass
+
+
+class PooledInterpreter:
+    """
+    One worker process, used by one job at a time.
+    """
+
+    def __init__(self, launcher, script, preload):
+        self.launcher = list(launcher)
+        self.script = script
+        self.preload = list(preload)
+        self.jobs = 0
+        self.process = None
+        self._replies = queue.Queue()
+
+    def start(self):
+        # The script path is already the one the tool's interpreter sees
+        options = ['--path', posixpath.dirname(self.script)]
+        for module in self.preload:
+            options += ['--preload', module]
+        try:
+            self.process = subprocess.Popen(
+                self.launcher + ['-u', get_executor().path(WORKER_SCRIPT)] + options,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                text=True, encoding='utf-8', errors='replace', **NEW_PROCESS_GROUP,
+            )
+        except OSError as e:
+            raise PoolUnavailable(str(e))
+        # Pipes cannot be polled with a timeout on every platform, a thread reads the replies
+        threading.Thread(target=self._read_replies, daemon=True).start()
+
+        hello = self._next_reply(STARTUP_TIMEOUT)
+        if not hello or not hello.get("ready"):
+            self.stop()
+            raise PoolUnavailable((hello or {}).get("error") or "worker did not start")
+        if hello.get("failed"):
+            logger.warning("Pool worker for %s could not preload %s", self.script, ", ".join(hello["failed"]))
+        return self
+
+    def _read_replies(self):
+        for line in self.process.stdout:
+            try:
+                self._replies.put(json.loads(line))
+            except ValueError:
+                continue
+        self._replies.put(None)
+
+    def _next_reply(self, timeout):
+        try:
+            return self._replies.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def run(self, args, timeout, cancel=None):
+        """
+        Runs the tool with args, returns a CompletedProcess like subprocess.run.
+        Cancelling kills the whole worker, the pool starts a new one.
+        """
+        job = {"script": self.script, "args": list(args), "timeout": timeout}
+        try:
+            self.process.stdin.write(json.dumps(job) + "\n")
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise PoolUnavailable(str(e))
+        self.jobs += 1
+
+        if cancel is not None:
+            cancel.attach(self.process)
+        try:
+            reply = self._next_reply(timeout + REPLY_GRACE_SECONDS)
+        finally:
+            if cancel is not None:
+                cancel.detach(self.process)
+        cmd = self.launcher + [self.script] + list(args)
+        if reply is None:
+            exited = not self.alive
+            self.stop()
+            if exited:
+                raise PoolUnavailable("worker exited")
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        if "error" in reply:
+            raise PoolUnavailable(reply["error"])
+        if reply["timed_out"]:
+            raise subprocess.TimeoutExpired(cmd, timeout, output=reply["stdout"], stderr=reply["stderr"])
+        result = subprocess.CompletedProcess(cmd, reply["returncode"], reply["stdout"], reply["stderr"])
+        result.usage = result_usage(reply["returncode"], reply.get("usage"))
+        return result
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            kill_process_tree(self.process)
+            self.process.wait()
+
+
+class InterpreterPool:
+    """
+    Up to `size` warm workers for one tool. A worker is replaced after `max_jobs` jobs so
+    whatever the preloaded modules accumulate does not live forever.
+    """
+
+    def __init__(self, name, launcher, script, preload, size, max_jobs):
+        self.name = name
+        self.launcher = list(launcher)
+        self.script = script
+        self.preload = list(preload)
+        self.size = size
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._idle = []
+        self._busy = 0
+        self._starting = 0
+        self._retry_at = 0.0
+
+    def _new_worker(self):
+        return PooledInterpreter(self.launcher, self.script, self.preload).start()
+
+    def _spawn(self):
+        # Called with the lock held: starts a replacement in the background
+        if self._busy + len(self._idle) + self._starting >= self.size or monotonic() < self._retry_at:
+            return
+        self._starting += 1
+        threading.Thread(target=self._start_worker, daemon=True).start()
+
+    def _start_worker(self):
+        try:
+            worker = self._new_worker()
+        except PoolUnavailable as e:
+            logger.warning("Could not start a pool worker for %s: %s", self.name, e)
+            with self._lock:
+                self._starting -= 1
+                self._retry_at = monotonic() + RETRY_AFTER_SECONDS
+            return
+        with self._lock:
+            self._starting -= 1
+            self._idle.append(worker)
+
+    def warm(self):
+        with self._lock:
+            for _ in range(self.size):
+                self._spawn()
+
+    def _checkout(self):
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive:
+                    self._busy += 1
+                    return worker
+            self._spawn()
+        raise PoolUnavailable(f"no idle {self.name} worker")
+
+    def _checkin(self, worker, reusable):
+        with self._lock:
+            self._busy -= 1
+            if reusable and worker.alive and worker.jobs < self.max_jobs:
+                self._idle.append(worker)
+                return
+        worker.stop()
+        with self._lock:
+            self._spawn()
+
+    def run(self, args, timeout, cancel=None):
+        """
+        Raises PoolUnavailable when no warm worker is free, the caller then runs the tool itself.
+        """
+        worker = self._checkout()
+        reusable = True
+        try:
+            return worker.run(args, timeout, cancel)
+        except PoolUnavailable:
+            reusable = False
+            raise
+        finally:
+            # A worker that had to be stopped is not alive any more and gets replaced
+            self._checkin(worker, reusable)
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size, "idle": len(self._idle), "busy": self._busy, "starting": self._starting}
+
+    def close(self):
+        with self._lock:
+            workers, self._idle = self._idle, []
+            self._retry_at = float('inf')
+        for worker in workers:
+            worker.stop()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(name, launcher, script):
+    """
+    The pool of a tool listed in settings.SCAN_PYTHON_POOL, started on first use. None for other tools.
+    """
+    preload = settings.SCAN_PYTHON_POOL.get(name)
+    if preload is None or settings.SCAN_PYTHON_POOL_SIZE <= 0:
+        return None
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = InterpreterPool(
+                name, launcher, script, preload,
+                settings.SCAN_PYTHON_POOL_SIZE, settings.SCAN_PYTHON_POOL_MAX_JOBS,
+            )
+            pool.warm()
+    return pool
+
+def is_pooled(name):
+    return name in settings.SCAN_PYTHON_POOL and settings.SCAN_PYTHON_POOL_SIZE > 0
+
+def pool_stats():
+    with _pools_lock:
+        pools = dict(_pools)
+    return {name: pool.stats() for name, pool in sorted(pools.items())}
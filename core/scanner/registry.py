@@ -0,0 +1,184 @@
+import logging
+import shlex
+import threading
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .executors import get_executor
+
+logger = logging.getLogger(__name__)
+
+# Scanner name -> (binary, default arguments). "{tools}" stands for settings.SCAN_TOOLS_DIR,
+# "{testssl}" and "{schemathesis}" for settings.SCAN_TESTSSL_PATH and SCAN_SCHEMATHESIS_PATH.
+# settings.SCAN_SCANNER_BINARIES can point any scanner at another binary.
+SCANNER_DEFINITIONS = {
+    "nmap": ("nmap", []),
+    "zmap": ("zmap", []),
+    "ping": ("ping", ["-c", "4"]),
+    "nikto": ("nikto", []),
+    "traceroute": ("traceroute", []),
+    "whatweb": ("whatweb", []),
+    "wpscan": ("wpscan", []),
+    "dnsrecon": ("dnsrecon", []),
+    "xssstrike": ("{tools}/XSStrike/venv/bin/python", ["{tools}/XSStrike/xsstrike.py"]),
+    "dnsscan": ("python3", ["{tools}/dnscan/dnscan.py"]),
+    "sqlmap": ("sqlmap", []),
+    "commix": ("/snap/bin/commix", []),
+    "joomlavss": ("ruby", ["{tools}/joomlavs/joomlavs.rb", "-u"]),
+    "gitdumper": ("{tools}/XSStrike/venv/bin/python", ["{tools}/git-dumper/git_dumper.py"]),
+    "schemathesis": ("/bin/bash", ["-c", "{schemathesis}"]),
+    "lynx": ("lynx", []),
+    "nuclei": ("nuclei", ["-severity", "medium,high,critical"]),
+    "testssl": ("{testssl}", []),
+}
+# Their last default argument is a bash -c script, the user's arguments are appended to it
+BASH_C_SCANNERS = {"schemathesis"}
+# Tool paths of a registry built without them: looked up on the PATH
+DEFAULT_TOOL_PATHS = {"testssl": "testssl.sh", "schemathesis": "schemathesis"}
+
+# settings.SCAN_RESOURCE_LIMITS are applied by starting the scanner through these tools,
+# which set the limit or priority and exec the next program (so the scanner keeps its pid)
+LIMIT_TOOLS = ("nice", "ionice", "prlimit")
+IONICE_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+# limits key -> (prlimit option, multiplier to its unit)
+RLIMIT_OPTIONS = {
+    "cpu_seconds": ("--cpu", 1),
+    "address_space_mb": ("--as", 1024 * 1024),
+    "open_files": ("--nofile", 1),
+}
+
+
+class UnknownScanner(LookupError):
+    pass
+
+
+def scanner_limits(name, resource_limits):
+    """
+    The "default" limits with the scanner's own entry on top. A key set to None is not limited.
+    """
+    return {**resource_limits.get("default", {}), **resource_limits.get(name, {})}
+
+def limit_wrapper(limits, tools):
+    """
+    argv prefix that applies limits to the command after it. tools maps the LIMIT_TOOLS to
+    their resolved paths; a limit whose tool is missing is left out.
+    """
+    wrapper = []
+    if limits.get("nice") is not None and tools.get("nice"):
+        wrapper += [tools["nice"], "-n", str(limits["nice"])]
+    if limits.get("ionice_class") and tools.get("ionice"):
+        if limits["ionice_class"] not in IONICE_CLASSES:
+            raise ImproperlyConfigured(f"Unknown ionice_class {limits['ionice_class']!r}, use one of {', '.join(IONICE_CLASSES)}")
+        wrapper += [tools["ionice"], "-c", str(IONICE_CLASSES[limits["ionice_class"]])]
+        # The idle class has no levels
+        if limits.get("ionice_level") is not None and limits["ionice_class"] != "idle":
+            wrapper += ["-n", str(limits["ionice_level"])]
+    rlimits = [
+        f"{option}={limits[key] * unit}"
+        for key, (option, unit) in RLIMIT_OPTIONS.items() if limits.get(key) is not None
+    ]
+    if rlimits and tools.get("prlimit"):
+        wrapper += [tools["prlimit"]] + rlimits + ["--"]
+    return wrapper
+
+
+class Scanner:
+    def __init__(self, name, binary, default_args=(), use_bash_c=False, limits=None):
+        self.name = name
+        self.binary = binary
+        self.default_args = list(default_args)
+        self.use_bash_c = use_bash_c
+        self.limits = limits or {}
+        self.path = binary
+        self.available = False
+        self.base = [binary]
+
+    def bind(self, executor, path, wrapper=()):
+        # The executor's argv prefix (with the limit wrapper) is built once, a scan only appends its arguments
+        self.available = path is not None
+        self.path = path or self.binary
+        command = list(wrapper) + [self.path]
+        self.base = executor.command(command[0], command[1:])
+
+    def scan_args(self, args):
+        """
+        The default arguments followed by the user's.
+        """
+        if self.use_bash_c:
+            # bash -c takes the whole script as the argument after -c, user arguments are quoted
+            *options, script = self.default_args
+            return options + [' '.join([script, shlex.join(args)])]
+        return self.default_args + list(args)
+
+    def argv(self, args):
+        return self.base + list(args)
+
+    def __repr__(self):
+        return f"<Scanner {self.name}: {self.path}>"
+
+
+class ScannerRegistry:
+    def __init__(self, executor, definitions, binaries=None, tools_dir='', resource_limits=None, tool_paths=None):
+        binaries = binaries or {}
+        resource_limits = resource_limits or {}
+        placeholders = {**DEFAULT_TOOL_PATHS, **(tool_paths or {}), "tools": tools_dir}
+        self.executor = executor
+        self.scanners = {}
+        for name, (binary, default_args) in definitions.items():
+            self.scanners[name] = Scanner(
+                name,
+                binaries.get(name, binary).format_map(placeholders),
+                [arg.format_map(placeholders) for arg in default_args],
+                use_bash_c=name in BASH_C_SCANNERS,
+                limits=scanner_limits(name, resource_limits),
+            )
+
+        # The limit tools are looked up in the same batch as the scanners
+        binaries = {scanner.binary for scanner in self.scanners.values()}
+        if resource_limits:
+            binaries.update(LIMIT_TOOLS)
+        resolved = executor.resolve(sorted(binaries))
+        tools = {tool: resolved.get(tool) for tool in LIMIT_TOOLS}
+        if resource_limits:
+            missing = [tool for tool, path in tools.items() if path is None]
+            if missing:
+                logger.warning("%s not found, the resource limits they apply are skipped", ", ".join(missing))
+
+        for scanner in self.scanners.values():
+            scanner.bind(executor, resolved.get(scanner.binary), limit_wrapper(scanner.limits, tools))
+            if not scanner.available:
+                logger.warning("Scanner %s: %s was not found, it will be run as configured", scanner.name, scanner.binary)
+
+    def get(self, name):
+        return self.scanners.get(name)
+
+    def __contains__(self, name):
+        return name in self.scanners
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """
+    Built on first use; the WSGI/ASGI entry points and the scan worker build it at startup
+    so binaries are looked up once per process, before the first request.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ScannerRegistry(
+                    get_executor(),
+                    SCANNER_DEFINITIONS,
+                    settings.SCAN_SCANNER_BINARIES,
+                    settings.SCAN_TOOLS_DIR,
+                    settings.SCAN_RESOURCE_LIMITS,
+                    {"testssl": settings.SCAN_TESTSSL_PATH, "schemathesis": settings.SCAN_SCHEMATHESIS_PATH},
+                )
+    return _registry
+
+def get_scanner(name):
+    scanner = get_registry().get(name)
+    if scanner is None:
+        raise UnknownScanner(f"Unknown scanner: {name}")
+    return scanner
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future, InvalidStateError
+from django.core.cache import cache
+from .processes import ScanCancelled
+
+CACHE_KEY_PREFIX = "scan-result"
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def normalize_args(args):
+    return [arg.strip() for arg in args if arg and arg.strip()]
+
+def cache_key(scanner, args):
+    payload = json.dumps([scanner, normalize_args(args)])
+    return f"{CACHE_KEY_PREFIX}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+def _join_or_lead(key):
+    """
+    Returns (future, is_leader). Only the leader runs the scan, the others wait for its future.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future, False
+        future = Future()
+        _inflight[key] = future
+        return future, True
+
+def _finish(key, future, value=None, error=None):
+    with _inflight_lock:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+    if future.done():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+    except InvalidStateError:
+        pass
+
+def _leader_error(error):
+    # A leader cancelled by its own caller says nothing about the scan: followers run it again
+    return ScanCancelled("Scan cancelled") if isinstance(error, asyncio.CancelledError) else error
+
+def _follow(future, cancel):
+    """
+    Waits for the leader's value. Raises ScanCancelled as soon as the caller's own token is
+    cancelled, or when the leader was cancelled.
+    """
+    if cancel is None:
+        return future.result()
+    done = threading.Event()
+    future.add_done_callback(lambda _: done.set())
+    cancel.add_callback(done.set)
+    try:
+        done.wait()
+    finally:
+        cancel.remove_callback(done.set)
+    cancel.check()
+    return future.result()
+
+def run_cached(scanner, args, ttl, run, cancel=None):
+    """
+    Returns (value, cached). Within ttl seconds of a successful run the stored value is
+    returned; concurrent identical calls share the run that is already in flight.
+    A falsy ttl disables both. cancel is the caller's optional CancelToken.
+    """
+    if not ttl:
+        return run(), False
+
+    key = cache_key(scanner, args)
+    while True:
+        value = cache.get(key)
+        if value is not None:
+            return value, True
+        future, is_leader = _join_or_lead(key)
+        if is_leader:
+            break
+        try:
+            return _follow(future, cancel), True
+        except ScanCancelled:
+            if cancel is not None and cancel.cancelled:
+                raise
+            # Only the leader's caller gave up, this one still wants the result
+
+    try:
+        value = run()
+    except BaseException as e:
+        _finish(key, future, error=_leader_error(e))
+        raise
+    cache.set(key, value, ttl)
+    _finish(key, future, value)
+    return value, False
+
+async def arun_cached(scanner, args, ttl, run):
+    """
+    asyncio version of run_cached, run is a coroutine function.
+    Waiters from threads and from coroutines share the same in-flight runs.
+    """
+    if not ttl:
+        return await run(), False
+
+    key = cache_key(scanner, args)
+    while True:
+        value = cache.get(key)
+        if value is not None:
+            return value, True
+        future, is_leader = _join_or_lead(key)
+        if is_leader:
+            break
+        try:
+            # Shielded: a follower that is cancelled (e.g. its client went away) must not
+            # cancel the run the leader and the other followers share
+            return await asyncio.shield(asyncio.wrap_future(future)), True
+        except ScanCancelled:
+            continue
+
+    try:
+        value = await run()
+    except BaseException as e:
+        _finish(key, future, error=_leader_error(e))
+        raise
+    cache.set(key, value, ttl)
+    _finish(key, future, value)
+    return value, False
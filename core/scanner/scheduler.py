@@ -0,0 +1,251 @@
+import asyncio
+import threading
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from time import monotonic
+from django.conf import settings
+from core.ratelimit import client_ip
+from .processes import ScanCancelled
+
+
+class SchedulerTimeout(Exception):
+    pass
+
+
+class ScanTicket:
+    def __init__(self, scanner, user_key, notify):
+        self.scanner = scanner
+        self.user_key = user_key
+        self.notify = notify
+        self.enqueued_at = monotonic()
+        self.granted_at = None
+        self.released = False
+
+    @property
+    def wait_time(self):
+        if self.granted_at is None:
+            return monotonic() - self.enqueued_at
+        return self.granted_at - self.enqueued_at
+
+
+class ScannerStats:
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def as_dict(self, limit):
+        return {
+            "limit": limit,
+            "queued": self.queued,
+            "running": self.running,
+            "started": self.started,
+            "avg_wait_sec": round(self.total_wait / self.started, 3) if self.started else 0.0,
+            "max_wait_sec": round(self.max_wait, 3),
+            "last_wait_sec": round(self.last_wait, 3),
+        }
+
+
+class ScanScheduler:
+    """
+    Decides which waiting scan may start its process.
+
+    A scan starts only while both the global limit and the limit of its scanner have
+    room. Waiting scans are kept in one queue per user and users are served round-robin,
+    so one account submitting many scanners cannot starve the others.
+    """
+
+    def __init__(self, max_concurrent, scanner_limits=None):
+        self.max_concurrent = max_concurrent
+        self.scanner_limits = dict(scanner_limits or {})
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._users = deque()
+        self._running = 0
+        self._stats = defaultdict(ScannerStats)
+
+    def limit_for(self, scanner):
+        return self.scanner_limits.get(scanner, self.max_concurrent)
+
+    def submit(self, scanner, user_key, notify):
+        """
+        Queues a ticket; notify() is called (possibly from another thread) once it may run.
+        """
+        ticket = ScanTicket(scanner, user_key, notify)
+        with self._lock:
+            if user_key not in self._queues:
+                self._queues[user_key] = deque()
+                self._users.append(user_key)
+            self._queues[user_key].append(ticket)
+            self._stats[scanner].queued += 1
+            granted = self._dispatch()
+        self._notify(granted)
+        return ticket
+
+    def release(self, ticket):
+        with self._lock:
+            if ticket.granted_at is None or ticket.released:
+                return
+            ticket.released = True
+            self._running -= 1
+            self._stats[ticket.scanner].running -= 1
+            granted = self._dispatch()
+        self._notify(granted)
+
+    def cancel(self, ticket):
+        """
+        Gives up on a ticket: removes it from its queue, or releases its slot if it was already granted.
+        """
+        with self._lock:
+            queue = self._queues.get(ticket.user_key)
+            if ticket.granted_at is None and queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self._stats[ticket.scanner].queued -= 1
+                if not queue:
+                    self._drop_user(ticket.user_key)
+                return
+        self.release(ticket)
+
+    def _drop_user(self, user_key):
+        del self._queues[user_key]
+        self._users.remove(user_key)
+
+    def _has_room(self, scanner):
+        return self._stats[scanner].running < self.limit_for(scanner)
+
+    def _dispatch(self):
+        # Called with the lock held, returns the tickets that were granted
+        granted = []
+        while self._running < self.max_concurrent and self._users:
+            for _ in range(len(self._users)):
+                user_key = self._users[0]
+                queue = self._queues[user_key]
+                ticket = next((t for t in queue if self._has_room(t.scanner)), None)
+                if ticket is None:
+                    self._users.rotate(-1)
+                    continue
+
+                queue.remove(ticket)
+                if queue:
+                    self._users.rotate(-1)
+                else:
+                    self._drop_user(user_key)
+                self._grant(ticket)
+                granted.append(ticket)
+                break
+            else:
+                break
+        return granted
+
+    def _grant(self, ticket):
+        ticket.granted_at = monotonic()
+        self._running += 1
+        stats = self._stats[ticket.scanner]
+        stats.queued -= 1
+        stats.running += 1
+        stats.started += 1
+        stats.last_wait = ticket.wait_time
+        stats.total_wait += stats.last_wait
+        stats.max_wait = max(stats.max_wait, stats.last_wait)
+
+    @staticmethod
+    def _notify(tickets):
+        for ticket in tickets:
+            ticket.notify()
+
+    def acquire(self, scanner, user_key, timeout=None, cancel=None):
+        """
+        Waits for a slot. cancel is an optional scanner.processes.CancelToken that ends the wait early.
+        """
+        event = threading.Event()
+        ticket = self.submit(scanner, user_key, event.set)
+        if cancel is not None:
+            cancel.add_callback(event.set)
+        try:
+            granted = event.wait(timeout)
+        finally:
+            if cancel is not None:
+                cancel.remove_callback(event.set)
+        if cancel is not None and cancel.cancelled:
+            self.cancel(ticket)
+            raise ScanCancelled("Scan cancelled")
+        if not granted:
+            self.cancel(ticket)
+            raise SchedulerTimeout(f"{scanner} is busy, try again later")
+        return ticket
+
+    @contextmanager
+    def slot(self, scanner, user_key, timeout=None, cancel=None):
+        ticket = self.acquire(scanner, user_key, timeout, cancel)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, scanner, user_key, timeout=None):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        ticket = self.submit(scanner, user_key, notify)
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), timeout)
+        except asyncio.TimeoutError:
+            self.cancel(ticket)
+            raise SchedulerTimeout(f"{scanner} is busy, try again later")
+        except BaseException:
+            self.cancel(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": self._running,
+                "queued": sum(len(q) for q in self._queues.values()),
+                "waiting_users": len(self._users),
+                "scanners": {
+                    name: stats.as_dict(self.limit_for(name)) for name, stats in sorted(self._stats.items())
+                },
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """
+    The scheduler shared by every scan entry point of this process.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = ScanScheduler(
+                    settings.SCAN_MAX_CONCURRENT,
+                    settings.SCAN_SCANNER_CONCURRENCY,
+                )
+    return _scheduler
+
+def scan_slot(scanner, user_key, cancel=None):
+    return get_scheduler().slot(scanner, user_key, settings.SCAN_QUEUE_TIMEOUT, cancel)
+
+def ascan_slot(scanner, user_key):
+    return get_scheduler().aslot(scanner, user_key, settings.SCAN_QUEUE_TIMEOUT)
+
+def user_key_for(user=None, request=None):
+    if user is not None:
+        return f"user:{user.pk}"
+    if request is not None:
+        return f"guest:{client_ip(request)}"
+    return "guest"
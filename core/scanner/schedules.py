@@ -0,0 +1,121 @@
+import logging
+import random
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from users.models import Subscription
+from .cron import CronError, CronExpression
+from .models import ScheduledScan
+from .registry import UnknownScanner, get_scanner
+from .jobs import enqueue_scan
+
+logger = logging.getLogger(__name__)
+
+# Scheduled scans are queued as ordinary ScanJobs by the `run_scan_scheduler` command and
+# executed by `run_scan_worker`. Each run is delayed by a random jitter so schedules that
+# share a cron minute do not start at the same second.
+
+
+def next_run(schedule, after):
+    """
+    The schedule's next cron time after `after`, plus up to SCAN_SCHEDULE_JITTER seconds (and at
+    most a quarter of the gap to the run after it, so frequent schedules keep their rhythm).
+    """
+    cron = CronExpression(schedule.cron)
+    at = cron.next_after(after)
+    gap = (cron.next_after(at) - at).total_seconds()
+    return at + timedelta(seconds=random.uniform(0, min(settings.SCAN_SCHEDULE_JITTER, gap / 4)))
+
+def charge_run(schedule):
+    """
+    A scheduled run uses an attempt like a scan from the API. Returns an error message or None.
+    """
+    subscription = Subscription.objects.filter(user=schedule.user).first()
+    if not subscription:
+        return "No subscription found"
+    subscription.expire_if_needed()
+    if not subscription.is_active():
+        return "Subscription expired."
+    if not subscription.use_attempt():
+        return "No attempts left."
+    return None
+
+def skip_run(schedule, reason):
+    logger.info("Scheduled scan %s skipped: %s", schedule.pk, reason)
+    schedule.skipped_runs += 1
+    schedule.last_error = reason
+    schedule.save(update_fields=['skipped_runs', 'last_error'])
+
+def run_due(schedule, now):
+    """
+    Queues one run of a due schedule and moves next_run_at on. Returns the ScanJob, or None
+    when the run was skipped or another scheduler process got to it first.
+    """
+    try:
+        upcoming = next_run(schedule, now)
+    except CronError as e:
+        ScheduledScan.objects.filter(pk=schedule.pk).update(enabled=False, last_error=f"Disabled: {e}")
+        return None
+    # Only the process that moves next_run_at from the due value queues the run
+    if not (ScheduledScan.objects
+            .filter(pk=schedule.pk, next_run_at=schedule.next_run_at)
+            .update(next_run_at=upcoming)):
+        return None
+    schedule.next_run_at = upcoming
+
+    if schedule.last_job_id and not schedule.last_job.is_finished:
+        skip_run(schedule, "The previous run is still going")
+        return None
+    try:
+        args = get_scanner(schedule.scanner).scan_args(schedule.args)
+    except UnknownScanner as e:
+        skip_run(schedule, str(e))
+        return None
+    error = charge_run(schedule)
+    if error:
+        skip_run(schedule, error)
+        return None
+
+    job = enqueue_scan(schedule.user, schedule.scanner, args, schedule.timeout)
+    schedule.last_job = job
+    schedule.last_run_at = now
+    schedule.last_error = ''
+    schedule.runs += 1
+    schedule.save(update_fields=['last_job', 'last_run_at', 'last_error', 'runs'])
+    return job
+
+def run_due_schedules(now=None, limit=100):
+    now = now or timezone.now()
+    due = (ScheduledScan.objects
+           .filter(enabled=True, next_run_at__lte=now)
+           .select_related('user', 'last_job')
+           .order_by('next_run_at')[:limit])
+    return [job for job in (run_due(schedule, now) for schedule in due) if job]
+
+def plan_new_schedules(now=None):
+    """
+    Gives enabled schedules without a next run (e.g. created in the admin) their first one.
+    """
+    now = now or timezone.now()
+    planned = 0
+    for schedule in ScheduledScan.objects.filter(enabled=True, next_run_at__isnull=True):
+        try:
+            schedule.next_run_at = next_run(schedule, now)
+        except CronError as e:
+            schedule.enabled = False
+            schedule.last_error = f"Disabled: {e}"
+        schedule.save(update_fields=['next_run_at', 'enabled', 'last_error'])
+        planned += 1
+    return planned
+
+def spread_missed_runs(window, now=None):
+    """
+    Runs missed while no scheduler was running are caught up once per schedule (not once per
+    missed cron time), spaced evenly over the next `window` seconds instead of all at once.
+    """
+    now = now or timezone.now()
+    missed = list(ScheduledScan.objects.filter(enabled=True, next_run_at__lt=now).order_by('next_run_at'))
+    for index, schedule in enumerate(missed):
+        schedule.next_run_at = now + timedelta(seconds=window * index / len(missed))
+    ScheduledScan.objects.bulk_update(missed, ['next_run_at'], batch_size=500)
+    return len(missed)
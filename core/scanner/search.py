@@ -0,0 +1,185 @@
+import re
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+# Full-text index over scan outputs. Outputs are stored compressed (and as deltas or blobs),
+# so the index keeps its own copy of the text in a table next to scanner_scanresult:
+#   SQLite:   an FTS5 table, rowid = ScanResult.id, ranked with bm25()
+#   Postgres: a table with a tsvector column and a GIN index, ranked with ts_rank()
+# Both are created by migration 0014 and kept in sync by the ScanResult signals; the
+# `rebuild_scan_search_index` command fills them for existing rows.
+
+SEARCH_TABLE = "scanner_scanresult_search"
+SNIPPET_TOKENS = 12
+# A query term: a quoted phrase or a run of characters without spaces, optionally ending in *
+TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+class SearchError(ValueError):
+    pass
+
+
+def index_text(text):
+    # Very large outputs are indexed up to SCAN_SEARCH_MAX_CHARS
+    return (text or '')[:settings.SCAN_SEARCH_MAX_CHARS]
+
+def parse_terms(query):
+    """
+    Splits a user query into (phrase, prefix) terms; all terms must match. Punctuation inside a
+    term is kept, so CVE-2021-44228 or mail.example.com match as phrases.
+    """
+    terms = []
+    for match in TERM_RE.finditer(query or ''):
+        text = match.group(1) if match.group(1) is not None else match.group(2)
+        prefix = match.group(1) is None and text.endswith('*')
+        text = text.rstrip('*') if prefix else text
+        if text.strip():
+            terms.append((text, prefix))
+    if not terms:
+        raise SearchError("Empty search query")
+    return terms
+
+
+class SqliteSearchBackend:
+    def fts_query(self, query):
+        parts = []
+        for text, prefix in parse_terms(query):
+            phrase = '"' + text.replace('"', '""') + '"'
+            parts.append(phrase + '*' if prefix else phrase)
+        return ' '.join(parts)
+
+    def index(self, rows):
+        rows = [(pk, index_text(text)) for pk, text in rows]
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(pk,) for pk, _ in rows])
+            cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (rowid, output) VALUES (%s, %s)", rows)
+
+    def remove(self, pks):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(pk,) for pk in pks])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+    def search(self, query, where, params, limit, offset):
+        sql = (
+            f"SELECT s.id, bm25({SEARCH_TABLE}) AS rank, "
+            f"snippet({SEARCH_TABLE}, 0, '[', ']', '…', {SNIPPET_TOKENS}) "
+            f"FROM {SEARCH_TABLE} JOIN scanner_scanresult s ON s.id = {SEARCH_TABLE}.rowid "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND {where} "
+            f"ORDER BY rank LIMIT %s OFFSET %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.fts_query(query), *params, limit, offset])
+            # bm25() is lower for better matches
+            return [(pk, -rank, snippet) for pk, rank, snippet in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    config = 'simple'
+
+    def ts_query(self, query):
+        """
+        A tsquery from the user's terms: phrases are joined with <->, prefixes end in :*.
+        The words are passed as parameters, only the operators are built here.
+        """
+        parts, params = [], []
+        for text, prefix in parse_terms(query):
+            if prefix:
+                parts.append(f"to_tsquery('{self.config}', %s)")
+                params.append(re.sub(r'\W+', ' ', text).strip().replace(' ', ' <-> ') + ':*')
+            else:
+                parts.append(f"phraseto_tsquery('{self.config}', %s)")
+                params.append(text)
+        return ' && '.join(parts), params
+
+    def index(self, rows):
+        rows = [(pk, index_text(text)) for pk, text in rows]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (scan_id, output, document) "
+                f"VALUES (%s, %s, to_tsvector('{self.config}', %s)) "
+                f"ON CONFLICT (scan_id) DO UPDATE SET output = EXCLUDED.output, document = EXCLUDED.document",
+                [(pk, text, text) for pk, text in rows],
+            )
+
+    def remove(self, pks):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE scan_id = ANY(%s)", [list(pks)])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {SEARCH_TABLE}")
+
+    def search(self, query, where, params, limit, offset):
+        ts_query, query_params = self.ts_query(query)
+        sql = (
+            f"WITH q AS (SELECT {ts_query} AS query) "
+            f"SELECT s.id, ts_rank(f.document, q.query) AS rank, "
+            f"ts_headline('{self.config}', f.output, q.query, "
+            f"'StartSel=[, StopSel=], MaxWords={SNIPPET_TOKENS * 2}, MinWords={SNIPPET_TOKENS}') "
+            f"FROM {SEARCH_TABLE} f JOIN scanner_scanresult s ON s.id = f.scan_id, q "
+            f"WHERE f.document @@ q.query AND {where} "
+            f"ORDER BY rank DESC LIMIT %s OFFSET %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*query_params, *params, limit, offset])
+            return cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+def get_search_backend():
+    """
+    The backend for the default database, or None when it has no full-text index.
+    """
+    if not settings.SCAN_SEARCH_ENABLED:
+        return None
+    backend = BACKENDS.get(connection.vendor)
+    return backend() if backend else None
+
+def index_scans(scans):
+    """
+    Indexes (or re-indexes) ScanResult rows, e.g. after a bulk_create, which skips the signals.
+    Guest scans are not searchable, so they are not indexed.
+    """
+    backend = get_search_backend()
+    rows = [(scan.pk, scan.output) for scan in scans if scan.user_id]
+    if backend and rows:
+        backend.index(rows)
+
+def remove_scans(pks):
+    backend = get_search_backend()
+    if backend and pks:
+        backend.remove(pks)
+
+def search_scans(query, user, scanner=None, since=None, until=None, folder=None, limit=20, offset=0):
+    """
+    The user's scans matching the query, best first: a list of (scan id, rank, snippet) where
+    the matches in the snippet are marked with [ and ]. Raises SearchError.
+    """
+    backend = get_search_backend()
+    if backend is None:
+        raise SearchError("Search is not available on this database")
+    conditions, params = ["s.user_id = %s"], [user.pk]
+    if scanner:
+        conditions.append("s.scanner = %s")
+        params.append(scanner)
+    if since:
+        conditions.append("s.created_at >= %s")
+        params.append(connection.ops.adapt_datetimefield_value(since))
+    if until:
+        conditions.append("s.created_at < %s")
+        params.append(connection.ops.adapt_datetimefield_value(until))
+    if folder:
+        conditions.append("s.folder_id = %s")
+        params.append(folder)
+    try:
+        return backend.search(query, ' AND '.join(conditions), params, limit, offset)
+    except DatabaseError as e:
+        # e.g. a query the FTS parser rejects
+        raise SearchError(f"Invalid search query: {e}")
@@ -1,11 +1,110 @@
+import shlex
+from django.utils import timezone
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from .models import *
+from .jobs import job_progress
+from .cron import CronError, CronExpression
+from .registry import get_registry
 
 class ScanResultSerializer(serializers.ModelSerializer):
+    output = serializers.CharField(read_only=True)
+
     class Meta:
         model = ScanResult
-        fields = '__all__'
+        exclude = ['output_data', 'output_codec', 'output_hash', 'output_format', 'chain_key']
         read_only_fields = ['id', 'created_at']
 
+
+
+class ScanJobSerializer(serializers.ModelSerializer):
+    result_id = serializers.IntegerField(read_only=True)
+    parent_id = serializers.UUIDField(read_only=True)
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ScanJob
+        fields = [
+            'id', 'scanner', 'args', 'status', 'result_id', 'error',
+            'duration_sec', 'created_at', 'started_at', 'finished_at', 'cancel_requested_at',
+            'parent_id', 'shard_index', 'shard_count', 'attempts', 'target_count', 'progress'
+        ]
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        return job_progress(obj)
+
+
+class ScanJobTargetSerializer(serializers.ModelSerializer):
+    scan_id = serializers.IntegerField(source='result_id', read_only=True)
+    output_preview = serializers.CharField(source='result.output_preview', read_only=True, default=None)
+    output_size = serializers.IntegerField(source='result.output_size', read_only=True, default=None)
+
+    class Meta:
+        model = ScanJobTarget
+        fields = [
+            'index', 'target', 'status', 'scan_id', 'error', 'error_output',
+            'duration_sec', 'output_preview', 'output_size'
+        ]
+        read_only_fields = fields
+
+
+class ScheduledScanSerializer(serializers.ModelSerializer):
+    args = serializers.ListField(child=serializers.CharField(), required=False)
+    # A command line instead of args, split like the scan endpoints do
+    command = serializers.CharField(write_only=True, required=False)
+    timeout = serializers.IntegerField(min_value=1, max_value=3600, required=False)
+
+    class Meta:
+        model = ScheduledScan
+        fields = [
+            'id', 'name', 'scanner', 'args', 'command', 'cron', 'timeout', 'enabled',
+            'next_run_at', 'last_run_at', 'last_job', 'last_error', 'runs', 'skipped_runs', 'created_at'
+        ]
+        read_only_fields = ['id', 'next_run_at', 'last_run_at', 'last_job', 'last_error', 'runs', 'skipped_runs', 'created_at']
+
+    def validate_scanner(self, value):
+        if value not in get_registry():
+            raise serializers.ValidationError("Unknown scanner")
+        return value
+
+    def validate_cron(self, value):
+        try:
+            CronExpression(value).next_after(timezone.now())
+        except CronError as e:
+            raise serializers.ValidationError(str(e))
+        return value.strip()
+
+    def validate(self, data):
+        command = data.pop('command', None)
+        if command is not None:
+            try:
+                data['args'] = shlex.split(command)
+            except ValueError as e:
+                raise serializers.ValidationError({"command": str(e)})
+        if not self.instance and not data.get('args'):
+            raise serializers.ValidationError("Provide 'args' or 'command'.")
+        return data
+
+
+class ScanServiceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ScanService
+        fields = ['name', 'product', 'version', 'extra_info', 'tunnel', 'cpe']
+
+
+class ScanPortSerializer(serializers.ModelSerializer):
+    service = ScanServiceSerializer(read_only=True)
+
+    class Meta:
+        model = ScanPort
+        fields = ['port', 'protocol', 'state', 'reason', 'service']
+
+
+class ScanHostSerializer(serializers.ModelSerializer):
+    ports = ScanPortSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = ScanHost
+        fields = ['id', 'address', 'address_type', 'hostname', 'mac_address', 'state', 'ports']
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import subprocess
+from time import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .models import ScanResult
+from .result_cache import run_cached, arun_cached
+from .scheduler import scan_slot, ascan_slot
+from .registry import get_scanner
+from .processes import NEW_PROCESS_GROUP, CancelToken, kill_process_tree, result_usage, run_process
+from . import enrichment, nmap_results, python_pool
+
+logger = logging.getLogger(__name__)
+
+
+def run_scan_command(name, args, timeout, cancel=None):
+    """
+    Runs the scanner and returns (CompletedProcess, duration in seconds).
+    Raises subprocess.TimeoutExpired like subprocess.run does, or ScanCancelled.
+    """
+    start_time = time()
+    result = run_process(get_scanner(name).argv(args), timeout, cancel)
+    duration = round(time() - start_time, 2)
+    return result, duration
+
+def run_tool(name, args, timeout, cancel=None):
+    """
+    run_scan_command, through a warm interpreter when the tool has a pool (args[0] is then the script).
+    """
+    pool = python_pool.get_pool(name, get_scanner(name).base, args[0]) if args else None
+    if pool is not None:
+        start_time = time()
+        try:
+            result = pool.run(args[1:], timeout, cancel)
+            return result, round(time() - start_time, 2)
+        except python_pool.PoolUnavailable as e:
+            if cancel is not None:
+                cancel.check()
+            logger.info("Running %s without the interpreter pool: %s", name, e)
+    return run_scan_command(name, args, timeout, cancel)
+
+async def arun_command(cmd, timeout):
+    """
+    Runs cmd with asyncio and returns (returncode, stdout, stderr, duration).
+    On timeout (asyncio.TimeoutError) or when the caller is cancelled, e.g. because the
+    client went away, the child's whole process group is killed.
+    """
+    start_time = time()
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        **NEW_PROCESS_GROUP,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+    except BaseException:
+        kill_process_tree(process)
+        await asyncio.shield(process.wait())
+        raise
+    duration = round(time() - start_time, 2)
+    return process.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace'), duration
+
+async def arun_scan_command(name, args, timeout):
+    return await arun_command(get_scanner(name).argv(args), timeout)
+
+async def arun_tool(name, args, timeout):
+    if not python_pool.is_pooled(name):
+        return await arun_scan_command(name, args, timeout)
+    # The tool runs in a thread, cancelling the coroutine alone would leave it running
+    cancel = CancelToken()
+    try:
+        result, duration = await sync_to_async(run_tool, thread_sensitive=False)(name, args, timeout, cancel)
+    except subprocess.TimeoutExpired:
+        raise asyncio.TimeoutError()
+    except asyncio.CancelledError:
+        cancel.cancel()
+        raise
+    return result.returncode, result.stdout, result.stderr, duration
+
+def scan_result_fields(user, scanner, args, output):
+    """
+    Field values for a ScanResult row. The server's IP and geo data come from the enrichment
+    cache; before it is filled they are left empty and enrichment.enrich_scans() adds them later.
+    """
+    return dict(
+        user=user,
+        scanner=scanner,
+        command=' '.join(args),
+        output=output,
+        **enrichment.egress_fields(),
+    )
+
+def save_scan_result(user, scanner, args, output, cached_from_id=None, usage=None):
+    """
+    usage is the process accounting of the run (CompletedProcess.usage from run_process).
+    """
+    scan = ScanResult.objects.create(
+        cached_from_id=cached_from_id,
+        **scan_result_fields(user, scanner, args, output),
+        **(usage or {}),
+    )
+    enrichment.enrich_scans([scan])
+    return scan
+
+def execute_scan(name, args, timeout, user, user_key, cancel=None):
+    """
+    Runs a scan through the scheduler and the result cache and stores its ScanResult.
+    Returns (result dict, cached). A cache hit still gets its own row, linked to the original one.
+    cancel is an optional CancelToken; a cancelled scan raises ScanCancelled.
+    """
+    def run():
+        with nmap_results.xml_report(name, args) as (run_args, import_report):
+            with scan_slot(name, user_key, cancel):
+                result, duration = run_tool(name, run_args, timeout, cancel)
+            scan = save_scan_result(user, name, args, result.stdout, usage=result.usage)
+            import_report(scan)
+        return {
+            "scan_id": scan.id,
+            "output": result.stdout,
+            "error_output": result.stderr,
+            "duration_sec": duration,
+        }
+
+    value, cached = run_cached(name, args, settings.SCAN_CACHE_TTL.get(name), run, cancel)
+    if cached:
+        scan = save_scan_result(user, name, args, value["output"], cached_from_id=value["scan_id"])
+        nmap_results.copy_report(name, value["scan_id"], scan)
+        value = {**value, "scan_id": scan.id}
+    return value, cached
+
+async def aexecute_scan(name, args, timeout, user, user_key):
+    async def run():
+        with nmap_results.xml_report(name, args) as (run_args, import_report):
+            async with ascan_slot(name, user_key):
+                returncode, stdout, stderr, duration = await arun_tool(name, run_args, timeout)
+            # asyncio reaps the child itself, only the exit code is known here
+            scan = await asave_scan_result(user, name, args, stdout, usage=result_usage(returncode))
+            await sync_to_async(import_report)(scan)
+        return {
+            "scan_id": scan.id,
+            "output": stdout,
+            "error_output": stderr,
+            "duration_sec": duration,
+        }
+
+    value, cached = await arun_cached(name, args, settings.SCAN_CACHE_TTL.get(name), run)
+    if cached:
+        scan = await asave_scan_result(user, name, args, value["output"], cached_from_id=value["scan_id"])
+        await sync_to_async(nmap_results.copy_report)(name, value["scan_id"], scan)
+        value = {**value, "scan_id": scan.id}
+    return value, cached
+
+async def asave_scan_result(user, scanner, args, output, cached_from_id=None, usage=None):
+    fields = scan_result_fields(user, scanner, args, output)
+    scan = await ScanResult.objects.acreate(cached_from_id=cached_from_id, **fields, **(usage or {}))
+    await sync_to_async(enrichment.enrich_scans)([scan])
+    return scan
@@ -0,0 +1,166 @@
+import ipaddress
+import re
+
+# Sharded scans: the targets of one nmap/zmap run are split into chunks that run as separate
+# jobs (see jobs.enqueue_sharded_scan), and the chunk outputs are merged back into one result.
+
+# Options that take the next argument as their value, so that value is not a target
+VALUE_OPTIONS = {
+    "nmap": {
+        "-p", "-e", "-S", "-D", "-g", "-iL", "-iR", "-oN", "-oX", "-oG", "-oA", "-oS",
+        "--exclude", "--excludefile", "--exclude-ports", "--top-ports", "--port-ratio",
+        "--source-port", "--script", "--script-args", "--script-args-file", "--script-timeout",
+        "--min-rate", "--max-rate", "--max-retries", "--host-timeout", "--scan-delay", "--max-scan-delay",
+        "--min-rtt-timeout", "--max-rtt-timeout", "--initial-rtt-timeout", "--min-hostgroup",
+        "--max-hostgroup", "--min-parallelism", "--max-parallelism", "--ttl", "--data", "--data-string",
+        "--data-length", "--dns-servers", "--proxies", "--spoof-mac", "--mtu", "--version-intensity",
+        "--stylesheet", "--datadir", "--resume",
+    },
+    "zmap": {
+        "-p", "-o", "-b", "-w", "-r", "-B", "-n", "-N", "-t", "-c", "-e", "-i", "-G", "-s", "-S",
+        "-M", "-O", "-f", "-P", "-T", "-C", "--target-port", "--output-file", "--blocklist-file",
+        "--allowlist-file", "--rate", "--bandwidth", "--max-targets", "--max-results", "--max-runtime",
+        "--cooldown-time", "--interface", "--gateway-mac", "--source-port", "--source-ip",
+        "--probe-module", "--output-module", "--output-fields", "--output-filter", "--probes",
+        "--sender-threads", "--seed", "--shards", "--shard", "--config",
+    },
+}
+# A hostname, address, CIDR block or nmap range (10.0.0.1-20, 10.0.*.1)
+TARGET_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9.:\-_/*,\[\]]*$')
+
+
+class ShardError(ValueError):
+    pass
+
+
+def can_shard(scanner):
+    return scanner in VALUE_OPTIONS
+
+def split_args(scanner, args):
+    """
+    Returns (options, targets): the arguments without the targets, and the targets in order.
+    """
+    value_options = VALUE_OPTIONS.get(scanner, set())
+    options, targets = [], []
+    takes_value = False
+    for arg in args:
+        if takes_value:
+            options.append(arg)
+            takes_value = False
+        elif arg.startswith('-'):
+            options.append(arg)
+            takes_value = arg in value_options
+        elif TARGET_RE.match(arg):
+            targets.append(arg)
+        else:
+            options.append(arg)
+    return options, targets
+
+def target_blocks(target, shard_size):
+    """
+    Yields (target, number of addresses). CIDR blocks larger than shard_size are split into
+    blocks of at most shard_size addresses; hostnames and ranges count as one address.
+    """
+    try:
+        network = ipaddress.ip_network(target, strict=False)
+    except ValueError:
+        yield target, 1
+        return
+    if network.num_addresses <= shard_size:
+        yield str(network) if '/' in target else target, network.num_addresses
+        return
+    new_prefix = network.max_prefixlen - (shard_size.bit_length() - 1)
+    for subnet in network.subnets(new_prefix=new_prefix):
+        yield str(subnet), subnet.num_addresses
+
+def make_shards(scanner, args, shard_size, max_shards):
+    """
+    Splits a scan into argument lists of at most shard_size target addresses each.
+    Raises ShardError when there is nothing to split or the scan would need more than max_shards.
+    """
+    options, targets = split_args(scanner, args)
+    if not targets:
+        raise ShardError("No targets to shard")
+
+    total = 0
+    for target in targets:
+        try:
+            network = ipaddress.ip_network(target, strict=False)
+        except ValueError:
+            total += 1
+            continue
+        total += network.num_addresses
+        if total > shard_size * max_shards:
+            break
+    if -(-total // shard_size) > max_shards:
+        raise ShardError(f"Too many shards, at most {max_shards} of {shard_size} addresses are allowed")
+
+    shards, current, current_size = [], [], 0
+    for target in targets:
+        for block, size in target_blocks(target, shard_size):
+            if current and current_size + size > shard_size:
+                shards.append(current)
+                current, current_size = [], 0
+            current.append(block)
+            current_size += size
+    if current:
+        shards.append(current)
+    if len(shards) > max_shards:
+        raise ShardError(f"Too many shards, at most {max_shards} of {shard_size} addresses are allowed")
+    return [options + shard for shard in shards]
+
+
+NMAP_DONE_RE = re.compile(
+    r'^Nmap done: (\d+) IP address(?:es)? \((\d+) hosts? up\) scanned in ([\d.]+) seconds'
+)
+
+def merge_nmap_output(outputs):
+    """
+    One nmap report from the shard reports: a single banner and a "Nmap done" line with the totals.
+    """
+    lines, addresses, hosts_up, seconds = [], 0, 0, 0.0
+    for index, output in enumerate(outputs):
+        for line in output.splitlines():
+            done = NMAP_DONE_RE.match(line)
+            if done:
+                addresses += int(done.group(1))
+                hosts_up += int(done.group(2))
+                seconds += float(done.group(3))
+            elif index and line.startswith('Starting Nmap'):
+                continue
+            else:
+                lines.append(line)
+    while lines and not lines[-1].strip():
+        lines.pop()
+    lines.append(
+        f"Nmap done: {addresses} IP address{'' if addresses == 1 else 'es'} "
+        f"({hosts_up} host{'' if hosts_up == 1 else 's'} up) scanned in {seconds:.2f} seconds "
+        f"({len(outputs)} shards)"
+    )
+    return "\n".join(lines) + "\n"
+
+def merge_csv_output(outputs):
+    """
+    zmap prints one result per line, with a header line when the CSV output module is used:
+    the header is kept once.
+    """
+    header = None
+    first_lines = {output.split("\n", 1)[0] for output in outputs if output}
+    if len(first_lines) == 1:
+        line = first_lines.pop()
+        if ',' in line and not any(ch.isdigit() for ch in line):
+            header = line
+
+    lines = [header] if header else []
+    for output in outputs:
+        for line in output.splitlines():
+            if line and line != header:
+                lines.append(line)
+    return "\n".join(lines) + "\n" if lines else ""
+
+def merge_outputs(scanner, outputs):
+    if scanner == "nmap":
+        return merge_nmap_output(outputs)
+    if scanner == "zmap":
+        return merge_csv_output(outputs)
+    return "".join(outputs)
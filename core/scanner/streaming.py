@@ -0,0 +1,194 @@
+import json
+import queue
+import tempfile
+import threading
+import subprocess
+from time import time
+from .processes import NEW_PROCESS_GROUP, ScanCancelled, ScanPopen, kill_process_tree, result_usage
+
+# Output beyond this size is spooled to a temporary file instead of being kept in memory
+SPOOL_MAX_BYTES = 64 * 1024
+# Lines waiting to be sent to the client when several scanners share one response
+MAX_PENDING_LINES = 256
+
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+
+def get_stream_format(request):
+    """
+    Returns 'ndjson', 'sse' or None when the client did not ask for a streamed response.
+    """
+    value = request.query_params.get("stream") or request.data.get("stream")
+    if not value:
+        if 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''):
+            return 'sse'
+        return None
+    value = str(value).strip().lower()
+    if value in STREAM_FORMATS:
+        return value
+    if value in ('1', 'true', 'yes', 'on'):
+        return 'ndjson'
+    return None
+
+def format_event(fmt, event, payload):
+    if fmt == 'sse':
+        return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+    return json.dumps({"event": event, **payload}, default=str) + "\n"
+
+
+class ScanProcessStream:
+    """
+    Runs a scanner and hands out its stdout line by line.
+
+    Everything read is also written to a spooled temp file, so the complete output
+    is still available for the ScanResult row without keeping it in memory while
+    the scan is running. stderr is drained by a background thread the same way.
+    """
+
+    def __init__(self, cmd, timeout, slot=None, cancel=None):
+        self.cmd = cmd
+        self.timeout = timeout
+        self.slot = slot
+        # The CancelToken the slot waits with, cancelled by close()
+        self.cancel = cancel
+        self._lock = threading.Lock()
+        self._holds_slot = False
+        self._closed = False
+        self.process = None
+        self.timed_out = False
+        self.error = None
+        self.duration = None
+        self._stdout = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode='w+', encoding='utf-8')
+        self._stderr = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode='w+', encoding='utf-8')
+        self._timer = None
+        self._stderr_thread = None
+        self._start_time = None
+
+    def start(self):
+        """
+        Waits for a scheduler slot when one was given, then starts the process.
+        Raises ScanCancelled when the stream was closed in the meantime.
+        """
+        if self.slot is not None:
+            self.slot.__enter__()
+        with self._lock:
+            self._holds_slot = self.slot is not None
+            closed = self._closed
+            if not closed:
+                # Under the lock, so close() either sees the process or stops it from starting
+                self._start_time = time()
+                self.process = ScanPopen(
+                    self.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    text=True, errors='replace', bufsize=1, **NEW_PROCESS_GROUP,
+                )
+        if closed:
+            # The client went away while this stream waited for its slot
+            self._release_slot()
+            raise ScanCancelled("Stream closed")
+        self._timer = threading.Timer(self.timeout, self._on_timeout)
+        self._timer.daemon = True
+        self._timer.start()
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+        return self
+
+    def _on_timeout(self):
+        self.timed_out = True
+        self.kill()
+
+    def _drain_stderr(self):
+        for line in self.process.stderr:
+            self._stderr.write(line)
+
+    def lines(self):
+        for line in self.process.stdout:
+            self._stdout.write(line)
+            yield line
+
+    def kill(self):
+        # Also called from close(), i.e. when the client disconnects mid-stream
+        if self.process and self.process.poll() is None:
+            kill_process_tree(self.process)
+
+    def finish(self):
+        """
+        Waits for the process and returns (stdout, stderr) as read from the spool files.
+        """
+        self.process.wait()
+        self._timer.cancel()
+        self._stderr_thread.join()
+        self.duration = round(time() - self._start_time, 2)
+        self._release_slot()
+        self._stdout.seek(0)
+        self._stderr.seek(0)
+        return self._stdout.read(), self._stderr.read()
+
+    @property
+    def usage(self):
+        """
+        Exit code and resource usage of the finished process, see processes.result_usage.
+        """
+        return result_usage(self.process.returncode, self.process.usage)
+
+    def _release_slot(self):
+        with self._lock:
+            holds, self._holds_slot = self._holds_slot, False
+        if holds:
+            self.slot.__exit__(None, None, None)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        if self.cancel is not None:
+            self.cancel.cancel()
+        if self._timer:
+            self._timer.cancel()
+        self.kill()
+        self._release_slot()
+        self._stdout.close()
+        self._stderr.close()
+
+
+def merge_streams(streams):
+    """
+    Starts (if needed) and reads several ScanProcessStreams in parallel, yielding (name, line)
+    pairs as they arrive. A stream that fails to start gets its exception in stream.error.
+    (name, None) is yielded once a stream has reached the end of its output.
+    """
+    pending = queue.Queue(maxsize=MAX_PENDING_LINES)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                pending.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def reader(name, stream):
+        try:
+            if stream.process is None:
+                stream.start()
+            for line in stream.lines():
+                put((name, line))
+        except Exception as e:
+            stream.error = e
+        finally:
+            put((name, None))
+
+    for name, stream in streams.items():
+        threading.Thread(target=reader, args=(name, stream), daemon=True).start()
+
+    remaining = len(streams)
+    try:
+        while remaining:
+            name, line = pending.get()
+            if line is None:
+                remaining -= 1
+            yield name, line
+    finally:
+        stopped.set()
@@ -1,3 +1,1567 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+import io
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+import requests
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import IsAuthenticated
+from core import ratelimit
+from core.http_client import CircuitBreaker, CircuitOpen, HttpClient
+from users.models import Plan, ScanFolder, Subscription
+from . import blobstore, compression, enrichment, executors, python_pool, registry, services
+from .bulk import enqueue_bulk_scan, save_batch
+from .cron import CronError, CronExpression
+from .deltas import apply_delta, diff_lines, encode_delta
+from .executors import LocalExecutor, StubExecutor, WSLExecutor
+from .forwarder import Forwarder, SyslogTcpTransport, SyslogUdpTransport, backoff_delay, make_transport
+from .jobs import STALE_GRACE_SECONDS, cancel_job, cancelled_job_ids, claim_next_job, enqueue_scan, requeue_stale_jobs
+from .geoip import CsvGeoDatabase, GeoDatabaseError
+from .management.commands.run_scan_worker import Command as ScanWorkerCommand
+from .models import ScanBlob, ScanHost, ScanJob, ScanPort, ScanResult, ScheduledScan, SiemCursor, with_chain_outputs
+from .nmap_results import diff_ports, import_nmap_xml
+from .processes import CancelToken, ScanCancelled, run_process
+from .registry import SCANNER_DEFINITIONS, ScannerRegistry, UnknownScanner, get_scanner
+from .result_cache import arun_cached, run_cached
+from .sharding import ShardError, make_shards, merge_outputs
+from .scheduler import ScanScheduler, SchedulerTimeout, user_key_for
+from .search import search_scans
+from .services import execute_scan, save_scan_result, scan_result_fields
+from .schedules import next_run
+from .streaming import ScanProcessStream, merge_streams
+from .views import MultiScanView
 
-# Create your tests here.
+
+class SchedulerTests(SimpleTestCase):
+    def submit(self, scheduler, granted, scanner, user_key, name):
+        return scheduler.submit(scanner, user_key, lambda: granted.append(name))
+
+    def test_users_are_served_round_robin(self):
+        scheduler = ScanScheduler(1)
+        granted = []
+        tickets = {f'hog{i}': self.submit(scheduler, granted, 'nmap', 'hog', f'hog{i}') for i in range(4)}
+        tickets.update((user, self.submit(scheduler, granted, 'nmap', user, user)) for user in ('a', 'b'))
+        self.assertEqual(granted, ['hog0'])
+        # Each finished scan lets the next one start
+        for name in granted:
+            scheduler.release(tickets[name])
+        self.assertEqual(granted, ['hog0', 'hog1', 'a', 'b', 'hog2', 'hog3'])
+        self.assertEqual((scheduler.stats()['running'], scheduler.stats()['queued']), (0, 0))
+
+    def test_scanner_limit_does_not_block_other_scanners(self):
+        scheduler = ScanScheduler(3, {'zmap': 1})
+        granted = []
+        first = self.submit(scheduler, granted, 'zmap', 'a', 'zmap-a')
+        self.submit(scheduler, granted, 'zmap', 'b', 'zmap-b')
+        self.submit(scheduler, granted, 'nmap', 'b', 'nmap-b')
+        self.assertEqual(granted, ['zmap-a', 'nmap-b'])
+        self.assertEqual(scheduler.stats()['scanners']['zmap']['queued'], 1)
+        scheduler.release(first)
+        self.assertEqual(granted, ['zmap-a', 'nmap-b', 'zmap-b'])
+
+    def test_waiting_scan_times_out_and_leaves_the_queue(self):
+        scheduler = ScanScheduler(1)
+        holder = scheduler.acquire('nmap', 'a')
+        with self.assertRaises(SchedulerTimeout):
+            scheduler.acquire('nmap', 'b', timeout=0.05)
+        self.assertEqual(scheduler.stats()['queued'], 0)
+        scheduler.release(holder)
+        with scheduler.slot('nmap', 'b', timeout=1):
+            self.assertEqual(scheduler.stats()['running'], 1)
+        self.assertEqual(scheduler.stats()['running'], 0)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def start_leader(self, run):
+        results = {}
+        def lead():
+            try:
+                results['value'] = run_cached('nmap', ['a.com'], 60, run)
+            except BaseException as e:
+                results['error'] = e
+        thread = threading.Thread(target=lead)
+        thread.start()
+        return thread, results
+
+    def test_followers_share_the_leaders_run(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+        def run():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'output': 'x'}
+        thread, leader = self.start_leader(run)
+        started.wait(5)
+        follower = {}
+        follower_thread = threading.Thread(
+            target=lambda: follower.update(value=run_cached('nmap', [' a.com '], 60, run))
+        )
+        follower_thread.start()
+        release.set()
+        thread.join(5)
+        follower_thread.join(5)
+        self.assertEqual(calls, [1])
+        self.assertEqual(leader['value'], ({'output': 'x'}, False))
+        self.assertEqual(follower['value'], ({'output': 'x'}, True))
+        # and the value is cached afterwards
+        self.assertEqual(run_cached('nmap', ['a.com'], 60, run), ({'output': 'x'}, True))
+
+    def test_cancelled_follower_stops_waiting_and_leader_finishes(self):
+        started, release = threading.Event(), threading.Event()
+        def run():
+            started.set()
+            release.wait(5)
+            return 'done'
+        thread, leader = self.start_leader(run)
+        started.wait(5)
+        token = CancelToken()
+        threading.Timer(0.05, token.cancel).start()
+        with self.assertRaises(ScanCancelled):
+            run_cached('nmap', ['a.com'], 60, run, token)
+        release.set()
+        thread.join(5)
+        self.assertEqual(leader['value'], ('done', False))
+
+    def test_follower_reruns_when_the_leader_is_cancelled(self):
+        started, release = threading.Event(), threading.Event()
+        leader_token = CancelToken()
+        def cancelled_run():
+            started.set()
+            release.wait(5)
+            leader_token.check()
+        thread, leader = self.start_leader(cancelled_run)
+        started.wait(5)
+        follower = {}
+        follower_thread = threading.Thread(
+            target=lambda: follower.update(value=run_cached('nmap', ['a.com'], 60, lambda: 'own run'))
+        )
+        follower_thread.start()
+        leader_token.cancel()
+        release.set()
+        thread.join(5)
+        follower_thread.join(5)
+        self.assertIsInstance(leader['error'], ScanCancelled)
+        self.assertEqual(follower['value'], ('own run', False))
+
+    def test_cancelled_async_follower_does_not_cancel_the_shared_run(self):
+        async def scenario():
+            release = asyncio.Event()
+            async def run():
+                await release.wait()
+                return 'done'
+            leader = asyncio.ensure_future(arun_cached('nmap', ['a.com'], 60, run))
+            await asyncio.sleep(0.01)
+            follower = asyncio.ensure_future(arun_cached('nmap', ['a.com'], 60, run))
+            other = asyncio.ensure_future(arun_cached('nmap', ['a.com'], 60, run))
+            await asyncio.sleep(0.01)
+            follower.cancel()
+            await asyncio.sleep(0.01)
+            release.set()
+            self.assertEqual(await leader, ('done', False))
+            self.assertEqual(await other, ('done', True))
+            self.assertTrue(follower.cancelled())
+        asyncio.run(scenario())
+
+
+class MergeStreamsTests(SimpleTestCase):
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def closed_while_waiting(self, with_cancel):
+        scheduler = ScanScheduler(1)
+        holder = scheduler.acquire('other', 'user:1')
+        cancel = CancelToken() if with_cancel else None
+        stream = ScanProcessStream(
+            [sys.executable, '-c', 'print(1)'], 10,
+            slot=scheduler.slot('lynx', 'guest:1', 10, cancel), cancel=cancel,
+        )
+        events = []
+        consumer = threading.Thread(target=lambda: events.extend(merge_streams({'lynx': stream})))
+        consumer.start()
+        self.assertTrue(self.wait_for(lambda: scheduler.stats()['queued'] == 1))
+        # The client goes away while the stream still waits for its slot
+        stream.close()
+        scheduler.release(holder)
+        consumer.join(5)
+        self.assertTrue(self.wait_for(lambda: scheduler.stats()['running'] == 0))
+        self.assertEqual(scheduler.stats()['queued'], 0)
+        self.assertIsNone(stream.process)
+        self.assertIsInstance(stream.error, ScanCancelled)
+        self.assertEqual(events, [('lynx', None)])
+
+    def test_slot_granted_after_close_is_released(self):
+        self.closed_while_waiting(with_cancel=False)
+
+    def test_close_cancels_the_slot_wait(self):
+        self.closed_while_waiting(with_cancel=True)
+
+    def test_lines_of_all_streams_are_relayed(self):
+        streams = {
+            name: ScanProcessStream([sys.executable, '-c', f'print("{name}-1"); print("{name}-2")'], 10)
+            for name in ('a', 'b')
+        }
+        events = list(merge_streams(streams))
+        for name, stream in streams.items():
+            self.assertEqual([line for n, line in events if n == name], [f'{name}-1\n', f'{name}-2\n', None])
+            self.assertEqual(stream.finish()[0], f'{name}-1\n{name}-2\n')
+            stream.close()
+
+
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def request(self, remote_addr='10.0.0.1', forwarded=None):
+        extra = {'REMOTE_ADDR': remote_addr}
+        if forwarded:
+            extra['HTTP_X_FORWARDED_FOR'] = forwarded
+        return RequestFactory().post('/', **extra)
+
+    def test_parse_rate(self):
+        self.assertEqual(ratelimit.parse_rate('5/m'), (5, 60))
+        self.assertEqual(ratelimit.parse_rate('10/15m'), (10, 900))
+        with self.assertRaises(ratelimit.RateError):
+            ratelimit.parse_rate('often')
+
+    def test_sliding_window_is_atomic_across_threads(self):
+        backend = ratelimit.LocalBackend(1000)
+        allowed = []
+        def hammer():
+            for _ in range(50):
+                allowed.append(backend.sliding_window('k', 100, 60)[0])
+        threads = [threading.Thread(target=hammer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(allowed), 100)
+        self.assertGreater(backend.sliding_window('k', 100, 60)[2], 0)
+
+    def test_token_bucket_allows_a_burst_then_refills(self):
+        backend = ratelimit.LocalBackend(1000)
+        self.assertEqual([backend.token_bucket('k', 3, 60)[0] for _ in range(4)], [True, True, True, False])
+        allowed, _, retry_after = backend.token_bucket('k', 3, 60)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 20, delta=1)
+
+    def test_local_backend_keeps_a_bounded_number_of_keys(self):
+        backend = ratelimit.LocalBackend(50)
+        for i in range(500):
+            backend.sliding_window(f'k{i}', 5, 60)
+        self.assertLessEqual(len(backend.entries), 50)
+
+    def test_cache_backend(self):
+        backend = ratelimit.CacheBackend('default')
+        self.assertEqual([backend.sliding_window('w', 3, 60)[0] for _ in range(5)], [True] * 3 + [False] * 2)
+        self.assertEqual([backend.token_bucket('b', 2, 60)[0] for _ in range(3)], [True, True, False])
+
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        request = self.request('10.0.0.1', forwarded='1.2.3.4')
+        self.assertEqual(ratelimit.client_ip(request), '10.0.0.1')
+        self.assertEqual(user_key_for(request=request), 'guest:10.0.0.1')
+
+    @override_settings(RATELIMIT_TRUSTED_PROXIES=1)
+    def test_forwarded_for_entry_of_the_trusted_proxy(self):
+        # The client sent a made-up entry, the proxy appended the real address
+        request = self.request('10.0.0.254', forwarded='6.6.6.6, 203.0.113.7')
+        self.assertEqual(ratelimit.client_ip(request), '203.0.113.7')
+        self.assertEqual(user_key_for(request=request), 'guest:203.0.113.7')
+        self.assertEqual(ratelimit.client_ip(self.request('203.0.113.8')), '203.0.113.8')
+
+    @override_settings(RATELIMIT_RATES={'guest_scan': '3/d'}, GUEST_SCAN_KEY='ip', RATELIMIT_BACKEND='local')
+    def test_guest_quota_cannot_be_reset_with_a_header(self):
+        ratelimit._backend = None
+        self.addCleanup(setattr, ratelimit, '_backend', None)
+        results = [ratelimit.use_guest_scan(self.request('10.0.0.9', forwarded=f'1.1.1.{i}'))[0] for i in range(5)]
+        self.assertEqual(results, [True, True, True, False, False])
+
+
+class BlobGcTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings = override_settings(SCAN_BLOB_ROOT=root.name, SCAN_BLOB_THRESHOLD=10)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def gc(self):
+        call_command('gc_scan_blobs', stdout=open(os.devnull, 'w'))
+
+    def stored(self, text):
+        scan = ScanResult(scanner='nmap', command='nmap a.com')
+        scan.output = text
+        return scan
+
+    def age(self, blob_hash):
+        hour_ago = timezone.now() - timedelta(hours=2)
+        ScanBlob.objects.filter(pk=blob_hash).update(created_at=hour_ago, touched_at=hour_ago)
+        path = blobstore.blob_path(blob_hash)
+        if path.exists():
+            os.utime(path, (hour_ago.timestamp(), hour_ago.timestamp()))
+
+    def test_unused_blob_and_orphan_file_are_deleted(self):
+        unused = self.stored('an output nobody keeps').output_hash
+        orphan = self.stored('an output without a row').output_hash
+        ScanBlob.objects.filter(pk=orphan).delete()
+        self.age(unused)
+        self.age(orphan)
+        self.gc()
+        self.assertFalse(ScanBlob.objects.filter(pk=unused).exists())
+        self.assertFalse(blobstore.blob_path(unused).exists())
+        self.assertFalse(blobstore.blob_path(orphan).exists())
+
+    def test_rewritten_output_is_kept_until_it_is_saved(self):
+        text = 'the same output written twice'
+        old = self.stored(text)
+        self.age(old.output_hash)
+        # A new scan with the same output finds the file in place; gc runs before it is saved
+        scan = self.stored(text)
+        self.gc()
+        scan.save()
+        scan.refresh_from_db()
+        self.assertEqual(scan.output, text)
+        self.assertEqual(ScanBlob.objects.get(pk=scan.output_hash).ref_count, 1)
+
+    def test_file_is_put_back_when_a_row_appears(self):
+        blob_hash = self.stored('claimed while gc looked').output_hash
+        self.assertFalse(blobstore.delete_blob_unless(blob_hash, lambda: True))
+        self.assertTrue(blobstore.blob_path(blob_hash).exists())
+        self.assertTrue(blobstore.delete_blob_unless(blob_hash, lambda: False))
+        self.assertFalse(blobstore.blob_path(blob_hash).exists())
+        self.assertEqual(list(blobstore.blob_path(blob_hash).parent.iterdir()), [])
+
+
+def use_stub_scanners(test):
+    """
+    Scanners print their argv instead of running, the egress lookup is not made and guests
+    start with a full scan quota.
+    """
+    cache.clear()
+    registry = ScannerRegistry(StubExecutor(), SCANNER_DEFINITIONS, {}, '/nonexistent', {'default': {}})
+    for patch in (
+        mock.patch('scanner.registry._registry', registry),
+        mock.patch.multiple(enrichment, _egress={'ip_address': '192.0.2.1'}, _expires_at=float('inf')),
+        mock.patch.object(ratelimit, '_backend', None),
+    ):
+        patch.start()
+        test.addCleanup(patch.stop)
+
+
+class MultiScanTests(TestCase):
+    def setUp(self):
+        use_stub_scanners(self)
+        self.user = User.objects.create(username='multi')
+
+    def test_results_are_saved_through_the_scan_service(self):
+        result = MultiScanView().run_scan('ping', ['a.com'], self.user, 'user:1')
+        self.assertEqual(result['output'], 'stub ping -c 4 a.com\n')
+        self.assertFalse(result['cached'])
+        scan = ScanResult.objects.get()
+        self.assertEqual((scan.user, scan.scanner, scan.command), (self.user, 'ping', '-c 4 a.com'))
+        self.assertEqual(scan.ip_address, '192.0.2.1')
+
+        # The same scan again comes from the result cache and is linked to the first row
+        self.assertTrue(MultiScanView().run_scan('ping', ['a.com'], self.user, 'user:1')['cached'])
+        self.assertEqual(ScanResult.objects.latest('pk').cached_from_id, scan.pk)
+
+    @override_settings(SCAN_MULTI_MAX_WORKERS=2)
+    def test_scanner_threads_are_bounded(self):
+        running, peak = [0], [0]
+        lock = threading.Lock()
+        def run_scan(view, scanner, args, user, user_key):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return {"scanner": scanner}
+        with mock.patch.object(MultiScanView, 'run_scan', run_scan):
+            response = self.client.post('/api/custom-scan/', {'command': 'a.com', 'scanners': ['ping'] * 6},
+                                        content_type='application/json')
+        self.assertEqual(len(response.json()['results']), 6)
+        self.assertEqual(peak[0], 2)
+
+
+class ChainOutputTests(TestCase):
+    def test_chain_is_read_in_order_without_keeping_its_history(self):
+        user = User.objects.create(username='chain')
+        lines = ''.join(f'line {i}\n' for i in range(50))
+        outputs = [f'{lines}run {i}\n' for i in range(6)]
+        for output in outputs:
+            ScanResult.objects.create(user=user, scanner='nmap', command='nmap a.com', output=output)
+        self.assertEqual(ScanResult.objects.filter(output_format='delta').count(), 5)
+
+        read, alive = [], []
+        with self.assertNumQueries(1):
+            for scan in with_chain_outputs(ScanResult.objects.order_by('pk').iterator()):
+                read.append(scan.output)
+                alive.append(weakref.ref(scan))
+                del scan
+                # The current row and the one its delta was applied to
+                alive = [ref for ref in alive if ref() is not None]
+                self.assertLessEqual(len(alive), 2)
+        self.assertEqual(read, outputs)
+
+
+class CronTests(SimpleTestCase):
+    start = datetime(2025, 3, 1, 10, 7, 30)
+
+    def next_times(self, expression, count=3):
+        cron, at, times = CronExpression(expression), self.start, []
+        for _ in range(count):
+            at = cron.next_after(at)
+            times.append(at)
+        return times
+
+    def test_steps_ranges_and_names(self):
+        self.assertEqual(self.next_times('*/20 * * * *'), [
+            datetime(2025, 3, 1, 10, 20), datetime(2025, 3, 1, 10, 40), datetime(2025, 3, 1, 11, 0),
+        ])
+        # 2025-03-01 is a Saturday
+        self.assertEqual(self.next_times('30 9 * * mon-fri', 2), [
+            datetime(2025, 3, 3, 9, 30), datetime(2025, 3, 4, 9, 30),
+        ])
+        self.assertEqual(self.next_times('@monthly', 1), [datetime(2025, 4, 1)])
+        self.assertEqual(self.next_times('0 0 * * 7', 1), [datetime(2025, 3, 2)])
+
+    def test_restricted_day_fields_match_either(self):
+        # The 13th of a month or any Friday
+        self.assertEqual(self.next_times('0 0 13 * fri', 3), [
+            datetime(2025, 3, 7), datetime(2025, 3, 13), datetime(2025, 3, 14),
+        ])
+
+    def test_leap_day(self):
+        self.assertEqual(self.next_times('0 0 29 feb *', 1), [datetime(2028, 2, 29)])
+
+    def test_invalid_expressions(self):
+        for expression in ('* * * *', '60 * * * *', '*/0 * * * *', '5-1 * * * *', '0 0 31 feb *', 'x * * * *'):
+            with self.subTest(expression), self.assertRaises(CronError):
+                CronExpression(expression).next_after(self.start)
+
+    @override_settings(SCAN_SCHEDULE_JITTER=300)
+    def test_jitter_is_bounded_by_the_setting_and_the_gap(self):
+        hourly, every_minute = ScheduledScan(cron='0 * * * *'), ScheduledScan(cron='* * * * *')
+        for _ in range(50):
+            delay = (next_run(hourly, self.start) - datetime(2025, 3, 1, 11, 0)).total_seconds()
+            self.assertTrue(0 <= delay <= 300)
+            delay = (next_run(every_minute, self.start) - datetime(2025, 3, 1, 10, 8)).total_seconds()
+            self.assertTrue(0 <= delay <= 15)
+
+
+class DeltaTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='delta')
+        self.lines = ''.join(f'22/tcp open ssh {i}\n' for i in range(40))
+
+    def scan(self, output):
+        return ScanResult.objects.create(user=self.user, scanner='nmap', command='nmap a.com', output=output)
+
+    def test_encode_and_apply_round_trip(self):
+        base = 'a\nb\nc\nd\n'
+        for text in ('', base, 'a\nb\nc\nd', 'x\na\nb\ny\nd\n', 'd\nc\nb\na\n', 'b\nb\nb\n', 'new\n'):
+            with self.subTest(text=text):
+                operations, _ = encode_delta(base, text)
+                self.assertEqual(apply_delta(base, operations), text)
+        self.assertEqual(encode_delta(base, 'a\nb\nz\n'), ([['c', 0, 2], ['i', ['z\n']]], 2))
+
+    @override_settings(SCAN_DELTA_SNAPSHOT_EVERY=3)
+    def test_chain_stores_deltas_between_snapshots(self):
+        outputs = [f'{self.lines}run {i}\n' for i in range(5)]
+        scans = [self.scan(output) for output in outputs]
+        stored = ScanResult.objects.filter(pk__in=[scan.pk for scan in scans]).order_by('pk')
+        self.assertEqual([(s.output_format, s.chain_position) for s in stored],
+                         [('full', 0), ('delta', 1), ('delta', 2), ('full', 0), ('delta', 1)])
+        self.assertEqual([scan.output for scan in stored], outputs)
+        # Outputs that share too little are stored in full
+        self.assertEqual(self.scan('something else entirely\n').output_format, 'full')
+
+    def test_deleting_a_base_row_rewrites_the_delta_on_it(self):
+        first, second, third = (self.scan(f'{self.lines}run {i}\n') for i in range(3))
+        first.delete()
+        second = ScanResult.objects.get(pk=second.pk)
+        self.assertEqual((second.output_format, second.chain_position), ('full', 0))
+        self.assertEqual(second.output, f'{self.lines}run 1\n')
+        self.assertEqual(ScanResult.objects.get(pk=third.pk).output, f'{self.lines}run 2\n')
+
+    def test_diff_lines(self):
+        self.assertEqual(diff_lines('a\nb\nc\n', 'a\nc\nd\n'), {'added': ['d'], 'removed': ['b'], 'unchanged': 2})
+
+
+class ShardingTests(SimpleTestCase):
+    def test_cidr_blocks_are_split_and_packed(self):
+        shards = make_shards('nmap', ['-p', '80', '10.0.0.0/24', 'a.com', '10.0.1.5'], 64, 10)
+        self.assertEqual(shards, [
+            ['-p', '80', '10.0.0.0/26'],
+            ['-p', '80', '10.0.0.64/26'],
+            ['-p', '80', '10.0.0.128/26'],
+            ['-p', '80', '10.0.0.192/26'],
+            ['-p', '80', 'a.com', '10.0.1.5'],
+        ])
+        # Blocks are powers of two no larger than the shard size
+        self.assertEqual(len(make_shards('zmap', ['-p', '443', '2001:db8::/120'], 100, 10)), 4)
+
+    def test_limits(self):
+        with self.assertRaises(ShardError):
+            make_shards('nmap', ['10.0.0.0/8'], 256, 1024)
+        with self.assertRaises(ShardError):
+            make_shards('nmap', ['-p', '80'], 256, 1024)
+
+    def test_nmap_reports_are_merged_with_totals(self):
+        outputs = [
+            "Starting Nmap 7.94\nNmap scan report for 10.0.0.1\n22/tcp open ssh\n\n"
+            "Nmap done: 64 IP addresses (1 host up) scanned in 2.50 seconds\n",
+            "Starting Nmap 7.94\nNmap scan report for 10.0.0.70\n80/tcp open http\n\n"
+            "Nmap done: 64 IP addresses (2 hosts up) scanned in 1.25 seconds\n",
+        ]
+        merged = merge_outputs('nmap', outputs)
+        self.assertEqual(merged.count('Starting Nmap'), 1)
+        self.assertIn('Nmap scan report for 10.0.0.70\n80/tcp open http', merged)
+        self.assertTrue(merged.endswith(
+            "Nmap done: 128 IP addresses (3 hosts up) scanned in 3.75 seconds (2 shards)\n"
+        ))
+
+    def test_zmap_csv_header_is_kept_once(self):
+        outputs = ['saddr,sport\n10.0.0.1,443\n', 'saddr,sport\n10.0.0.70,443\n', '']
+        self.assertEqual(merge_outputs('zmap', outputs), 'saddr,sport\n10.0.0.1,443\n10.0.0.70,443\n')
+
+
+NMAP_XML = """<?xml version="1.0"?>
+<nmaprun scanner="nmap" args="nmap -oX - 10.0.0.1 2001:db8::1">
+<host><status state="up" reason="arp-response"/>
+<address addr="10.0.0.1" addrtype="ipv4"/><address addr="00:11:22:33:44:55" addrtype="mac"/>
+<hostnames><hostname name="router.lan" type="PTR"/></hostnames>
+<ports>
+<port protocol="tcp" portid="22"><state state="open" reason="syn-ack"/>
+<service name="ssh" product="OpenSSH" version="9.6"><cpe>cpe:/a:openbsd:openssh:9.6</cpe></service></port>
+<port protocol="tcp" portid="80"><state state="closed" reason="reset"/></port>
+</ports></host>
+<host><status state="up" reason="echo-reply"/>
+<address addr="2001:db8::1" addrtype="ipv6"/>
+<ports><port protocol="udp" portid="53"><state state="open" reason="udp-response"/>
+<service name="domain"/></port></ports></host>
+"""
+
+
+class NmapImportTests(TestCase):
+    def scan(self):
+        return ScanResult.objects.create(scanner='nmap', command='nmap a.com', output='')
+
+    def import_report(self, xml):
+        scan = self.scan()
+        return scan, import_nmap_xml(scan, io.BytesIO(xml.encode('utf-8')), batch_size=1)
+
+    def test_hosts_ports_and_services_are_imported(self):
+        scan, saved = self.import_report(NMAP_XML + '</nmaprun>\n')
+        self.assertEqual(saved, 2)
+        router = ScanHost.objects.get(scan=scan, address='10.0.0.1')
+        self.assertEqual((router.address_type, router.hostname, router.mac_address, router.state),
+                         ('ipv4', 'router.lan', '00:11:22:33:44:55', 'up'))
+        ssh = ScanPort.objects.get(host=router, port=22)
+        self.assertEqual((ssh.state, ssh.service.product, ssh.service.cpe), ('open', 'OpenSSH', 'cpe:/a:openbsd:openssh:9.6'))
+        self.assertFalse(hasattr(ScanPort.objects.get(host=router, port=80), 'service'))
+        dns = ScanPort.objects.get(host__scan=scan, host__address_type='ipv6')
+        self.assertEqual((dns.protocol, dns.port, dns.service.name), ('udp', 53, 'domain'))
+
+    def test_report_cut_short_keeps_the_hosts_read(self):
+        truncated = NMAP_XML[:NMAP_XML.index('<host><status state="up" reason="echo')] + '<host><status sta'
+        with self.assertLogs('scanner.nmap_results', 'WARNING'):
+            _, saved = self.import_report(truncated)
+        self.assertEqual(saved, 1)
+
+    def test_diff_ports(self):
+        old, _ = self.import_report(NMAP_XML + '</nmaprun>')
+        new, _ = self.import_report(NMAP_XML.replace('state="closed" reason="reset"', 'state="open" reason="syn-ack"')
+                                    .replace('portid="22"><state state="open"', 'portid="22"><state state="filtered"')
+                                    + '</nmaprun>')
+        self.assertEqual(diff_ports(old.pk, new.pk), {
+            'opened': [{'address': '10.0.0.1', 'protocol': 'tcp', 'port': 80}],
+            'closed': [{'address': '10.0.0.1', 'protocol': 'tcp', 'port': 22}],
+        })
+
+
+class GeoIpTests(SimpleTestCase):
+    def database(self, *rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write('network,start,end,country_code,city,latitude\n')
+            file.writelines(f'{row}\n' for row in rows)
+        self.addCleanup(os.unlink, file.name)
+        return CsvGeoDatabase(file.name)
+
+    def test_range_lookup(self):
+        database = self.database(
+            '10.0.0.0/8,,,DE,Berlin,52.5',
+            ',1.2.3.0,1.2.3.255,FR,Paris,48.9',
+            # 1.2.4.0 - 1.2.4.255 as integers, the same location
+            ',16909312,16909567,FR,Paris,48.9',
+            '2001:db8::/32,,,JP,Tokyo,35.7',
+            ',2001:db9::,2001:db9::ffff,US,,',
+        )
+        self.assertEqual(len(database.records), 4)
+        self.assertEqual(database.lookup('10.0.0.0')['city'], 'Berlin')
+        self.assertEqual(database.lookup('10.255.255.255')['latitude'], 52.5)
+        self.assertEqual(database.lookup('1.2.4.77')['city'], 'Paris')
+        self.assertEqual(database.lookup('1.2.5.0'), {})
+        self.assertEqual(database.lookup('9.255.255.255'), {})
+        self.assertEqual(database.lookup('2001:db8:ffff::1')['country_code'], 'JP')
+        self.assertEqual(database.lookup('2001:db9::ffff')['country_code'], 'US')
+        self.assertIsNone(database.lookup('2001:db9::ffff')['city'])
+        self.assertEqual(database.lookup('2001:db9::1:0'), {})
+        # IPv4-mapped IPv6 addresses are looked up as IPv4
+        self.assertEqual(database.lookup('::ffff:10.1.2.3')['city'], 'Berlin')
+        self.assertEqual(database.lookup('not an address'), {})
+
+    def test_invalid_databases(self):
+        for rows in (('10.0.0.0/8,,,DE,,', '10.1.0.0/16,,,FR,,'), (',1.2.3.4,::1,DE,,',), (',1.2.3.9,1.2.3.1,DE,,',)):
+            with self.subTest(rows), self.assertRaises(GeoDatabaseError):
+                self.database(*rows)
+
+
+class Listener:
+    """
+    A local syslog collector: keeps what TCP clients or UDP senders deliver.
+    """
+    def __init__(self, kind='tcp', port=0):
+        self.kind = kind
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM if kind == 'tcp' else socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', port))
+        self.port = self.sock.getsockname()[1]
+        self.received = []
+        self.connections = 0
+        if kind == 'tcp':
+            self.sock.listen()
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                if self.kind == 'udp':
+                    self.received.append(self.sock.recv(70000))
+                    continue
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            with client:
+                while data := client.recv(65536):
+                    self.received.append(data)
+
+    def lines(self):
+        if self.kind == 'udp':
+            return [data.decode('utf-8') for data in self.received]
+        return b''.join(self.received).decode('utf-8').splitlines()
+
+    def close(self):
+        self.sock.close()
+
+
+class ForwarderTests(TransactionTestCase):
+    def setUp(self):
+        self.listener = None
+        self.batches = []
+
+    def tearDown(self):
+        if self.listener is not None:
+            self.listener.close()
+
+    def scans(self, count):
+        return [ScanResult.objects.create(scanner='nmap', command=f'nmap host{i}', output=f'out {i}')
+                for i in range(count)]
+
+    def forward(self, transport, **options):
+        send = transport.send
+        def record(lines):
+            send(lines)
+            self.batches.append(len(lines))
+        transport.send = record
+        forwarder = Forwarder(transport, batch_size=2, flush_interval=0.2, poll_interval=0.05, **options)
+        return forwarder.run(once=True)
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_events_arrive_in_batches_and_the_cursor_resumes(self):
+        self.listener = Listener('tcp')
+        scans = self.scans(5)
+        self.assertEqual(self.forward(SyslogTcpTransport('127.0.0.1', self.listener.port, 5)), 5)
+        self.assertEqual(self.batches, [2, 2, 1])
+        self.assertTrue(self.wait_for(lambda: len(self.listener.lines()) == 5))
+        self.assertIn('nmap host4', self.listener.lines()[-1])
+        cursor = SiemCursor.objects.get(name='default')
+        self.assertEqual((cursor.last_id, cursor.sent), (scans[-1].pk, 5))
+
+        # A restarted forwarder only sends what came after the cursor
+        later = self.scans(1)
+        self.assertEqual(self.forward(SyslogTcpTransport('127.0.0.1', self.listener.port, 5)), 1)
+        self.assertTrue(self.wait_for(lambda: len(self.listener.lines()) == 6))
+        self.assertEqual(SiemCursor.objects.get(name='default').last_id, later[0].pk)
+
+    def test_failed_connection_backs_off_until_the_collector_is_up(self):
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        self.scans(1)
+        failures = []
+        def backoff(count, maximum):
+            failures.append(count)
+            if count == 2:
+                self.listener = Listener('tcp', port)
+            return 0.05
+        with mock.patch('scanner.forwarder.backoff_delay', backoff), \
+                self.assertLogs('scanner.forwarder', 'WARNING') as logs:
+            self.assertEqual(self.forward(SyslogTcpTransport('127.0.0.1', port, 5)), 1)
+        self.assertEqual(failures, [1, 2])
+        self.assertIn('retrying in', logs.output[0])
+        self.assertEqual(SiemCursor.objects.get(name='default').last_error, '')
+        self.assertTrue(self.wait_for(lambda: len(self.listener.lines()) == 1))
+
+    def test_backoff_delay_doubles_up_to_the_maximum(self):
+        for failures, low, high in ((1, 0.5, 1), (4, 4, 8), (20, 150, 300)):
+            self.assertTrue(low <= backoff_delay(failures, 300) <= high)
+
+    def test_udp_datagrams_are_cut_on_a_character_boundary(self):
+        self.listener = Listener('udp')
+        self.scans(3)
+        self.assertEqual(self.forward(make_transport(f'udp://127.0.0.1:{self.listener.port}', 'syslog', 5)), 3)
+        self.assertTrue(self.wait_for(lambda: len(self.listener.lines()) == 3))
+
+        transport = SyslogUdpTransport('127.0.0.1', self.listener.port, 5)
+        transport.max_datagram = 9
+        transport.send(['ééééé\n'])
+        transport.close()
+        self.assertTrue(self.wait_for(lambda: len(self.listener.received) == 4))
+        self.assertEqual(self.listener.received[-1].decode('utf-8'), 'éééé')
+
+
+class AsyncScanViewTests(TestCase):
+    def setUp(self):
+        use_stub_scanners(self)
+
+    def post(self, url, data, **extra):
+        return self.client.post(url, data, content_type='application/json', **extra)
+
+    def test_scan_runs_without_a_thread(self):
+        response = self.post('/aio/ping/', {'target': 'a.com'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['output'], 'stub ping -c 4 a.com\n')
+        response = self.post('/aio/api/custom-scan/', {'command': 'a.com', 'scanners': ['ping', 'nope']})
+        self.assertEqual(response.json()['results'], [
+            {'scanner': 'ping', 'output': 'stub ping -c 4 a.com\n', 'error_output': '', 'cached': True},
+            {'scanner': 'nope', 'error': 'Unsupported scanner'},
+        ])
+
+    def test_failed_authentication_is_answered_like_drf(self):
+        for url, data in (('/aio/ping/', {'target': 'a.com'}),
+                          ('/aio/api/custom-scan/', {'command': 'a.com', 'scanners': ['ping']})):
+            with self.subTest(url):
+                response = self.post(url, data, HTTP_AUTHORIZATION='Token not-a-token')
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response.json(), {'error': 'Invalid token.'})
+        self.assertFalse(ScanResult.objects.exists())
+
+    def test_permissions_of_the_sync_view_apply(self):
+        with mock.patch.object(MultiScanView, 'permission_classes', [IsAuthenticated]):
+            response = self.post('/aio/api/custom-scan/', {'command': 'a.com', 'scanners': ['ping']})
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('credentials were not provided', response.json()['error'])
+
+
+class StatusServer:
+    """
+    A local HTTP server answering each request with the next of `statuses` (the last one repeats).
+    """
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.hits = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status = server.statuses[min(server.hits, len(server.statuses) - 1)]
+                server.hits += 1
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.host = f'127.0.0.1:{self.httpd.server_port}'
+        self.url = f'http://{self.host}/'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class HttpClientTests(SimpleTestCase):
+    def http_client(self, retries=0, threshold=3, cooldown=60):
+        return HttpClient(timeout=5, retries=retries, backoff=0, pool_size=2,
+                          breaker_threshold=threshold, breaker_cooldown=cooldown)
+
+    def server(self, *statuses):
+        server = StatusServer(*statuses)
+        self.addCleanup(server.close)
+        return server
+
+    def closed_port_url(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return f'http://127.0.0.1:{sock.getsockname()[1]}/'
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        server = self.server(503)
+        client = self.http_client()
+        self.assertEqual([client.get(server.url).status_code for _ in range(3)], [503, 503, 503])
+        with mock.patch.object(client.session, 'request') as request, self.assertRaises(CircuitOpen):
+            client.get(server.url)
+        request.assert_not_called()
+        self.assertEqual(server.hits, 3)
+        stats = client.host_stats()[server.host]
+        self.assertEqual(
+            (stats['requests'], stats['errors'], stats['rejected'], stats['circuit']), (3, 3, 1, 'open')
+        )
+        self.assertIsNotNone(stats['p95_sec'])
+
+    def test_client_errors_and_successes_keep_the_circuit_closed(self):
+        server = self.server(503, 503, 404, 503, 503, 200)
+        client = self.http_client()
+        self.assertEqual([client.get(server.url).status_code for _ in range(6)], [503, 503, 404, 503, 503, 200])
+        stats = client.host_stats()[server.host]
+        self.assertEqual((stats['requests'], stats['errors'], stats['circuit']), (6, 4, 'closed'))
+
+    def test_half_open_circuit_lets_one_probe_through(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+        breaker.record(False)
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record(False)
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        # A failed probe reopens right away
+        breaker.record(False)
+        self.assertEqual(breaker.state, 'open')
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record(True)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_successful_probe_closes_the_circuit(self):
+        server = self.server(503, 503, 200)
+        client = self.http_client(threshold=2, cooldown=0.05)
+        client.get(server.url)
+        client.get(server.url)
+        with self.assertRaises(CircuitOpen):
+            client.get(server.url)
+        time.sleep(0.06)
+        self.assertEqual(client.get(server.url).status_code, 200)
+        self.assertEqual(client.host_stats()[server.host]['circuit'], 'closed')
+        self.assertEqual(server.hits, 3)
+
+    def test_retries_do_not_wrap_circuit_open(self):
+        url = self.closed_port_url()
+        client = self.http_client(retries=2, threshold=1)
+        with self.assertRaises(requests.ConnectionError) as failure, self.assertLogs('urllib3', 'WARNING') as logs:
+            client.get(url)
+        self.assertEqual(len(logs.records), 2)
+        self.assertNotIsInstance(failure.exception, CircuitOpen)
+        with self.assertRaises(CircuitOpen) as rejected:
+            client.get(url)
+        self.assertIs(type(rejected.exception), CircuitOpen)
+        self.assertIsNone(rejected.exception.__context__)
+        stats = client.host_stats()[url.split('/')[2]]
+        self.assertEqual((stats['requests'], stats['errors'], stats['rejected']), (1, 1, 1))
+
+
+def live_group_members(pgid):
+    """
+    Pids of the processes of group pgid that are still running (zombies left to init do not count).
+    """
+    members = []
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/stat') as file:
+                # The fields after "(comm)": state, ppid, pgrp...
+                state, _, pgrp = file.read().rsplit(')', 1)[1].split()[:3]
+        except OSError:
+            continue
+        if int(pgrp) == pgid and state != 'Z':
+            members.append(int(pid))
+    return members
+
+
+class ProcessTreeMixin:
+    def start_tree(self):
+        """
+        A command that leaves a background child behind and reports its process group.
+        """
+        pid_file = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'pid')
+        return ['sh', '-c', f'echo $$ > {pid_file}; sleep 60 & sleep 60'], pid_file
+
+    def wait_for_group(self, pid_file):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            if os.path.exists(pid_file) and open(pid_file).read().strip():
+                pgid = int(open(pid_file).read())
+                if len(live_group_members(pgid)) >= 3:
+                    return pgid
+            time.sleep(0.01)
+        self.fail("process tree did not start")
+
+    def assertGroupGone(self, pgid):
+        deadline = time.monotonic() + 5
+        while live_group_members(pgid) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(live_group_members(pgid), [])
+
+    def run_in_thread(self, cmd, timeout, cancel=None):
+        outcome = {}
+        def run():
+            try:
+                outcome['result'] = run_process(cmd, timeout, cancel)
+            except BaseException as e:
+                outcome['error'] = e
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread, outcome
+
+
+@skipUnless(os.path.isdir('/proc'), "needs /proc to inspect process groups")
+class ProcessTreeTests(ProcessTreeMixin, SimpleTestCase):
+    def test_cancel_kills_the_whole_process_group(self):
+        cmd, pid_file = self.start_tree()
+        token = CancelToken()
+        thread, outcome = self.run_in_thread(cmd, 30, token)
+        pgid = self.wait_for_group(pid_file)
+        token.cancel()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertIsInstance(outcome.get('error'), ScanCancelled)
+        self.assertGroupGone(pgid)
+
+    def test_timeout_kills_the_whole_process_group(self):
+        cmd, pid_file = self.start_tree()
+        started = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            run_process(cmd, 0.5)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertGroupGone(int(open(pid_file).read()))
+
+    def test_token_cancelled_before_the_start_kills_at_once(self):
+        cmd, _ = self.start_tree()
+        token = CancelToken()
+        token.cancel()
+        started = time.monotonic()
+        with self.assertRaises(ScanCancelled):
+            run_process(cmd, 30, token)
+        self.assertLess(time.monotonic() - started, 5)
+
+
+@skipUnless(os.path.isdir('/proc'), "needs /proc to inspect process groups")
+class JobCancelTests(ProcessTreeMixin, TestCase):
+    def test_queued_job_is_cancelled_right_away(self):
+        job = ScanJob.objects.create(scanner='nmap', args=['a.com'])
+        response = self.client.delete(f'/api/scan/jobs/{job.pk}/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], ScanJob.STATUS_CANCELLED)
+        self.assertIsNone(ScanJob.objects.filter(status=ScanJob.STATUS_QUEUED).first())
+        self.assertEqual(self.client.delete(f'/api/scan/jobs/{job.pk}/').status_code, 409)
+
+    def test_worker_kills_the_process_group_of_a_cancelled_job(self):
+        job = ScanJob.objects.create(scanner='nmap', args=['a.com'], status=ScanJob.STATUS_RUNNING,
+                                     started_at=timezone.now())
+        cmd, pid_file = self.start_tree()
+        token = CancelToken()
+        thread, outcome = self.run_in_thread(cmd, 30, token)
+        pgid = self.wait_for_group(pid_file)
+
+        worker = ScanWorkerCommand(stdout=io.StringIO())
+        worker.cancel_requested([(job.pk, token)])
+        self.assertFalse(token.cancelled)
+        self.assertTrue(cancel_job(job))
+        self.assertEqual(cancelled_job_ids([job.pk]), {job.pk})
+        worker.cancel_requested([(job.pk, token)])
+        self.assertTrue(token.cancelled)
+
+        thread.join(5)
+        self.assertIsInstance(outcome.get('error'), ScanCancelled)
+        self.assertGroupGone(pgid)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ScanJob.STATUS_RUNNING)
+        self.assertIsNotNone(job.cancel_requested_at)
+
+
+class JobQueueTests(TestCase):
+    def abandon(self, job):
+        # Its worker died long enough ago for the job's time limit to have passed
+        started_at = timezone.now() - timedelta(seconds=job.timeout + STALE_GRACE_SECONDS + 1)
+        ScanJob.objects.filter(pk=job.pk).update(started_at=started_at)
+
+    def test_job_is_claimed_only_once(self):
+        first = enqueue_scan(None, 'nmap', ['a.com'], 60)
+        second = enqueue_scan(None, 'nmap', ['b.com'], 60)
+        original_first = QuerySet.first
+        def first_then_lose_the_race(queryset):
+            job = original_first(queryset)
+            if job is not None and job.pk == first.pk:
+                # Another worker claims the same job between our SELECT and UPDATE
+                ScanJob.objects.filter(pk=job.pk).update(status=ScanJob.STATUS_RUNNING, worker='other', attempts=1)
+            return job
+        with mock.patch.object(QuerySet, 'first', first_then_lose_the_race):
+            job = claim_next_job('me')
+        self.assertEqual((job.pk, job.worker, job.status, job.attempts), (second.pk, 'me', ScanJob.STATUS_RUNNING, 1))
+        self.assertEqual(ScanJob.objects.get(pk=first.pk).worker, 'other')
+        self.assertIsNone(claim_next_job('me'))
+
+    def test_stale_job_is_requeued_with_its_attempt_counted(self):
+        stale = enqueue_scan(None, 'nmap', ['a.com'], 60)
+        alive = enqueue_scan(None, 'nmap', ['b.com'], 60)
+        claim_next_job('dead')
+        claim_next_job('alive')
+        self.abandon(stale)
+        self.assertEqual(requeue_stale_jobs(), 1)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.worker, stale.started_at, stale.attempts), (ScanJob.STATUS_QUEUED, '', None, 1))
+        self.assertEqual(ScanJob.objects.get(pk=alive.pk).status, ScanJob.STATUS_RUNNING)
+        job = claim_next_job('new')
+        self.assertEqual((job.pk, job.attempts), (stale.pk, 2))
+
+    @override_settings(SCAN_JOB_MAX_ATTEMPTS=2)
+    def test_job_fails_after_max_attempts(self):
+        job = enqueue_scan(None, 'nmap', ['a.com'], 60)
+        claim_next_job('dead')
+        self.abandon(job)
+        self.assertEqual(requeue_stale_jobs(), 1)
+        claim_next_job('dead again')
+        self.abandon(job)
+        with self.assertLogs('scanner.jobs', 'WARNING'):
+            self.assertEqual(requeue_stale_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (ScanJob.STATUS_FAILED, 2, "Abandoned by its worker 2 times"))
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(claim_next_job('next'))
+
+
+class BulkScanTests(TestCase):
+    def setUp(self):
+        use_stub_scanners(self)
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        overrides = override_settings(SCAN_BLOB_ROOT=root.name, SCAN_BLOB_THRESHOLD=10)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create(username='bulk')
+
+    def subscribe(self, attempts):
+        plan = Plan.objects.create(slug='bulk', name='Bulk')
+        return Subscription.objects.create(
+            user=self.user, plan=plan, end_date=timezone.now() + timedelta(days=30), attempts_left=attempts
+        )
+
+    def post(self, targets):
+        token, _ = Token.objects.get_or_create(user=self.user)
+        return self.client.post('/api/scan/bulk/', {'scanner': 'ping', 'targets': targets},
+                                content_type='application/json', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_attempts_are_charged_with_the_job(self):
+        subscription = self.subscribe(attempts=3)
+        response = self.post(['a.com', 'b.com'])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(ScanJob.objects.get(pk=response.json()['job_id']).targets.count(), 2)
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.attempts_left, 1)
+        self.assertEqual(self.post(['a.com', 'b.com']).status_code, 403)
+
+    def test_attempts_are_kept_when_the_job_is_not_queued(self):
+        subscription = self.subscribe(attempts=3)
+        with mock.patch('scanner.views.enqueue_bulk_scan', side_effect=DatabaseError), \
+                self.assertRaises(DatabaseError), self.assertLogs('django.request', 'ERROR'):
+            self.post(['a.com', 'b.com'])
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.attempts_left, 3)
+
+    def save_targets(self, targets):
+        """
+        What execute_bulk_job does with the targets once the stub scanner has run.
+        """
+        job = enqueue_bulk_scan(self.user, 'ping', [], targets, 60)
+        fields = scan_result_fields(self.user, 'ping', [], '')
+        del fields['command'], fields['output']
+        rows = []
+        for item in job.targets.order_by('index'):
+            item.status = ScanJob.STATUS_DONE
+            command = f'ping -c 4 {item.target}'
+            rows.append((item, ScanResult(**fields, command=command, output=f'stub {command}\n'), []))
+        save_batch(rows)
+        return job
+
+    def test_rows_of_one_chain_in_a_batch_link_to_each_other(self):
+        first = save_scan_result(self.user, 'ping', ['ping', '-c', '4', 'a.com'], 'stub ping -c 4 a.com\n')
+        job = self.save_targets(['a.com', 'b.com', 'a.com'])
+        a1, b, a2 = [item.result for item in job.targets.select_related('result').order_by('index')]
+        self.assertEqual((a1.previous_id, a1.chain_position), (first.pk, 1))
+        self.assertEqual((a2.previous_id, a2.chain_position), (a1.pk, 2))
+        self.assertIsNone(b.previous_id)
+        scans = list(with_chain_outputs(ScanResult.objects.filter(chain_key=first.chain_key)))
+        self.assertEqual([scan.pk for scan in scans], [first.pk, a1.pk, a2.pk])
+        self.assertEqual({scan.output for scan in scans}, {'stub ping -c 4 a.com\n'})
+
+    def test_batch_insert_matches_a_normal_save(self):
+        output = 'stub ping -c 4 a.com\n'
+        # Before the first egress lookup the rows are saved without it, both ways
+        with mock.patch.object(enrichment, '_egress', None), mock.patch.object(enrichment, 'refresh_egress'), \
+                self.captureOnCommitCallbacks() as callbacks:
+            saved = save_scan_result(self.user, 'ping', ['ping', '-c', '4', 'other.com'], output)
+            job = self.save_targets(['a.com', 'b.com'])
+        scans = list(ScanResult.objects.exclude(pk=saved.pk).order_by('command'))
+        self.assertEqual([scan.output for scan in scans], [output, 'stub ping -c 4 b.com\n'])
+        self.assertEqual({item.result_id for item in job.targets.all()}, {scan.pk for scan in scans})
+
+        # Reference counts: the blob of `output` is shared with the row saved normally
+        self.assertEqual(saved.output_hash, scans[0].output_hash)
+        for blob in ScanBlob.objects.all():
+            self.assertEqual(blob.ref_count, ScanResult.objects.filter(output_hash=blob.hash).count())
+        self.assertEqual(ScanBlob.objects.get(pk=saved.output_hash).ref_count, 2)
+
+        # Search index
+        self.assertEqual({pk for pk, _, _ in search_scans('a.com', self.user)}, {saved.pk, scans[0].pk})
+        self.assertEqual([pk for pk, _, _ in search_scans('b.com', self.user)], [scans[1].pk])
+
+        # Enrichment, once the transaction has committed
+        self.assertEqual(ScanResult.objects.filter(ip_address__isnull=True).count(), 3)
+        with mock.patch.object(enrichment._executor, 'submit', lambda function, *args: function(*args)):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(set(ScanResult.objects.values_list('ip_address', flat=True)), {'192.0.2.1'})
+
+
+class ScanSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='search')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+
+    def scan(self, output, scanner='nmap', user=None, **fields):
+        return ScanResult.objects.create(user=user or self.user, scanner=scanner, command=f'{scanner} a.com',
+                                         output=output, **fields)
+
+    def search(self, **params):
+        response = self.client.get('/api/scan/search/', params, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [result['id'] for result in response.json()['results']]
+
+    def test_saved_scan_is_found_by_a_word_of_its_output(self):
+        scan = self.scan('22/tcp open ssh OpenSSH 8.9p1\n80/tcp open http nginx\n')
+        self.scan('22/tcp open ssh OpenSSH 9.6\n', user=User.objects.create(username='other'))
+        response = self.client.get('/api/scan/search/', {'q': 'openssh'}, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        [result] = response.json()['results']
+        self.assertEqual(result['id'], scan.pk)
+        self.assertIn('[OpenSSH]', result['snippet'])
+        self.assertEqual(self.search(q='ngi*'), [scan.pk])
+        self.assertEqual(self.search(q='"open http" nginx'), [scan.pk])
+        self.assertEqual(self.search(q='apache'), [])
+
+    def test_updated_output_replaces_the_indexed_terms(self):
+        scan = self.scan('80/tcp open http nginx\n')
+        scan.output = '80/tcp open http apache\n'
+        scan.save()
+        self.assertEqual(self.search(q='nginx'), [])
+        self.assertEqual(self.search(q='apache'), [scan.pk])
+
+    def test_deleted_scan_is_no_longer_found(self):
+        scan = self.scan('80/tcp open http nginx\n')
+        scan.delete()
+        self.assertEqual(self.search(q='nginx'), [])
+
+    def test_scanner_date_and_folder_filters(self):
+        folder = ScanFolder.objects.create(user=self.user, name='prod')
+        old = self.scan('nginx on the old host\n', folder=folder)
+        ScanResult.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=30))
+        new = self.scan('nginx on the new host\n', scanner='nikto')
+        self.assertEqual(set(self.search(q='nginx')), {old.pk, new.pk})
+        self.assertEqual(self.search(q='nginx', scanner='nmap'), [old.pk])
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        self.assertEqual(self.search(q='nginx', since=since), [new.pk])
+        self.assertEqual(self.search(q='nginx', until=since), [old.pk])
+        self.assertEqual(self.search(q='nginx', folder=folder.pk), [old.pk])
+
+    def test_invalid_queries_are_rejected(self):
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        self.assertEqual(self.client.get('/api/scan/search/', {'q': ''}, **auth).status_code, 400)
+        self.assertEqual(self.client.get('/api/scan/search/', {'q': 'a', 'since': 'soon'}, **auth).status_code, 400)
+        self.assertEqual(self.client.get('/api/scan/search/', {'q': 'a'}).status_code, 401)
+
+
+class CompressionTests(SimpleTestCase):
+    TEXT = "PORT   STATE SERVICE\n22/tcp open  ssh — ünïcode ✓\n" * 50
+
+    def test_zlib_round_trip(self):
+        codec, data = compression.compress_text(self.TEXT, compression.CODEC_ZLIB)
+        self.assertEqual(codec, compression.CODEC_ZLIB)
+        self.assertLess(len(data), len(self.TEXT.encode('utf-8')))
+        self.assertEqual(compression.decompress_text(codec, data), self.TEXT)
+        self.assertEqual(compression.decompress_text(codec, memoryview(data)), self.TEXT)
+
+    def test_empty_output(self):
+        self.assertEqual(compression.decompress_text(*compression.compress_text(None)), '')
+        self.assertEqual(compression.decompress_text(compression.CODEC_ZLIB, b''), '')
+
+    @skipUnless(compression.zstandard, "zstandard is not installed")
+    def test_zstd_round_trip(self):
+        codec, data = compression.compress_text(self.TEXT, compression.CODEC_ZSTD)
+        self.assertEqual(codec, compression.CODEC_ZSTD)
+        self.assertEqual(compression.decompress_text(codec, data), self.TEXT)
+
+    def test_zstd_falls_back_to_zlib_without_zstandard(self):
+        with mock.patch.object(compression, 'zstandard', None):
+            self.assertEqual(compression.available_codecs(), [compression.CODEC_ZLIB])
+            codec, data = compression.compress_text(self.TEXT, compression.CODEC_ZSTD)
+            self.assertEqual(codec, compression.CODEC_ZLIB)
+            self.assertEqual(compression.decompress_text(codec, data), self.TEXT)
+            with self.assertRaises(RuntimeError):
+                compression.decompress_text(compression.CODEC_ZSTD, b'\x28\xb5\x2f\xfd')
+
+
+@override_settings(SCAN_BLOB_THRESHOLD=1 << 20)
+class OutputSizeMigrationTests(TestCase):
+    def test_rows_from_before_0006_get_their_size_and_preview(self):
+        migration = importlib.import_module('scanner.migrations.0017_fill_scanresult_output_size')
+        long_output = 'é' * 600
+        old = ScanResult.objects.create(scanner='nmap', command='nmap a.com', output=long_output)
+        empty = ScanResult.objects.create(scanner='nmap', command='nmap b.com', output='')
+        ScanResult.objects.filter(pk=old.pk).update(output_size=0, output_preview='')
+        migration.fill_output_sizes(apps, None)
+        old.refresh_from_db()
+        self.assertEqual((old.output_size, old.output_preview), (1200, 'é' * 500))
+        self.assertEqual(ScanResult.objects.get(pk=empty.pk).output_size, 0)
+
+
+class ScanHostAdminTests(TestCase):
+    def test_changelist_does_not_load_scan_outputs(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        def add_hosts(count):
+            user = User.objects.create(username=f'owner{ScanResult.objects.count()}')
+            for i in range(count):
+                scan = ScanResult.objects.create(user=user, scanner='nmap', command='nmap a.com', output='x' * 100)
+                ScanHost.objects.create(scan=scan, address=f'10.0.0.{ScanHost.objects.count() + 1}')
+
+        add_hosts(1)
+        with CaptureQueriesContext(connection) as one_host:
+            self.assertEqual(self.client.get('/admin/scanner/scanhost/').status_code, 200)
+        add_hosts(5)
+        with CaptureQueriesContext(connection) as six_hosts:
+            response = self.client.get('/admin/scanner/scanhost/')
+        self.assertContains(response, '10.0.0.6')
+        self.assertEqual(len(six_hosts), len(one_host))
+        self.assertFalse([query for query in six_hosts if 'output_data' in query['sql']])
+
+
+POOLED_SCRIPT = """
+import os, signal, sys, time
+action = sys.argv[1]
+if action == 'crash':
+    os.kill(os.getppid(), signal.SIGKILL)
+elif action == 'hang':
+    os.kill(os.getppid(), signal.SIGSTOP)
+elif action == 'sleep':
+    time.sleep(60)
+print('pid', os.getppid(), *sys.argv[1:])
+sys.exit(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+"""
+
+
+@skipUnless(hasattr(os, 'fork'), "pool workers fork their jobs")
+class PythonPoolTests(SimpleTestCase):
+    def make_pool(self, size=1, max_jobs=10):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        script = os.path.join(directory, 'tool.py')
+        with open(script, 'w') as file:
+            file.write(POOLED_SCRIPT)
+        pool = python_pool.InterpreterPool('tool', [sys.executable], script, ['json'], size, max_jobs)
+        self.addCleanup(pool.close)
+        pool.warm()
+        self.wait_for_idle(pool)
+        return pool
+
+    def wait_for_idle(self, pool):
+        deadline = time.monotonic() + 10
+        while pool.stats()['idle'] < pool.size and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(pool.stats(), {"size": pool.size, "idle": pool.size, "busy": 0, "starting": 0})
+        return pool._idle[0].process.pid
+
+    def test_warm_worker_runs_the_script(self):
+        pool = self.make_pool()
+        worker_pid = pool._idle[0].process.pid
+        result = pool.run(['exit', '3'], 10)
+        self.assertEqual((result.returncode, result.stdout, result.stderr), (3, f'pid {worker_pid} exit 3\n', ''))
+        self.assertEqual(result.usage['exit_code'], 3)
+        self.assertIn('max_rss_kb', result.usage)
+        # The worker is reused for the next job
+        self.assertEqual(pool.run(['exit'], 10).stdout, f'pid {worker_pid} exit\n')
+
+    def test_worker_is_replaced_after_max_jobs(self):
+        pool = self.make_pool(max_jobs=1)
+        first = pool.run(['exit'], 10).stdout
+        self.wait_for_idle(pool)
+        self.assertNotEqual(pool.run(['exit'], 10).stdout, first)
+
+    def test_crashed_worker_is_replaced(self):
+        pool = self.make_pool()
+        crashed_pid = pool._idle[0].process.pid
+        with self.assertRaises(python_pool.PoolUnavailable):
+            pool.run(['crash'], 10)
+        self.assertNotEqual(self.wait_for_idle(pool), crashed_pid)
+        self.assertEqual(pool.run(['exit', '0'], 10).returncode, 0)
+
+    def test_timed_out_job_keeps_its_worker(self):
+        pool = self.make_pool()
+        worker_pid = pool._idle[0].process.pid
+        with self.assertRaises(subprocess.TimeoutExpired):
+            pool.run(['sleep'], 0.2)
+        self.assertEqual(self.wait_for_idle(pool), worker_pid)
+
+    def test_hung_worker_is_replaced(self):
+        pool = self.make_pool()
+        hung_pid = pool._idle[0].process.pid
+        with mock.patch.object(python_pool, 'REPLY_GRACE_SECONDS', 0), self.assertRaises(subprocess.TimeoutExpired):
+            pool.run(['hang'], 0.2)
+        self.assertNotEqual(self.wait_for_idle(pool), hung_pid)
+
+    def test_run_tool_falls_back_to_a_subprocess(self):
+        use_stub_scanners(self)
+        # Never warmed: no worker can take the job
+        cold = python_pool.InterpreterPool('ping', [sys.executable], 'ping.py', [], 0, 1)
+        with mock.patch.object(python_pool, 'get_pool', return_value=cold), self.assertLogs('scanner.services', 'INFO'):
+            result, _ = services.run_tool('ping', ['-c', '4', 'a.com'], 10)
+        self.assertEqual(result.stdout, 'stub ping -c 4 a.com\n')
+        token = CancelToken()
+        token.cancel()
+        with mock.patch.object(python_pool, 'get_pool', return_value=cold), self.assertRaises(ScanCancelled):
+            services.run_tool('ping', ['-c', '4', 'a.com'], 10, token)
+
+
+class ScannerRegistryTests(SimpleTestCase):
+    def fresh_registry(self, **settings_overrides):
+        """
+        get_scanner() as a new process would see it with these settings.
+        """
+        for patch in (mock.patch.object(registry, '_registry', None), mock.patch.object(executors, '_executor', None)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        overrides = override_settings(
+            SCAN_EXECUTOR={'BACKEND': 'scanner.executors.StubExecutor'}, SCAN_RESOURCE_LIMITS={}, **settings_overrides
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_tool_paths_come_from_the_settings(self):
+        self.fresh_registry(
+            SCAN_TOOLS_DIR='/opt/tools', SCAN_TESTSSL_PATH='/opt/testssl/testssl.sh',
+            SCAN_SCHEMATHESIS_PATH='/opt/bin/schemathesis', SCAN_SCANNER_BINARIES={'nmap': '/opt/nmap/nmap'},
+        )
+        self.assertEqual(get_scanner('testssl').path, '/opt/testssl/testssl.sh')
+        self.assertEqual(get_scanner('schemathesis').scan_args(['run', 'http://a.com/spec file']),
+                         ['-c', "/opt/bin/schemathesis run 'http://a.com/spec file'"])
+        self.assertEqual(get_scanner('xssstrike').default_args, ['/opt/tools/XSStrike/xsstrike.py'])
+        nmap = get_scanner('nmap')
+        self.assertEqual(nmap.argv(['-sV', 'a.com']),
+                         [sys.executable, '-c', StubExecutor.STUB, '/opt/nmap/nmap', '-sV', 'a.com'])
+        with self.assertRaises(UnknownScanner):
+            get_scanner('nope')
+
+    def test_default_tool_paths(self):
+        self.assertEqual(settings.SCAN_TESTSSL_PATH, '/home/armen/testssl.sh/testssl.sh')
+        self.assertEqual(settings.SCAN_SCHEMATHESIS_PATH, '/root/.local/bin/schemathesis')
+        # A registry built without tool paths looks the tools up on the PATH
+        bare = ScannerRegistry(StubExecutor(), SCANNER_DEFINITIONS)
+        self.assertEqual(bare.get('testssl').path, 'testssl.sh')
+        self.assertEqual(bare.get('schemathesis').default_args, ['-c', 'schemathesis'])
+
+    def test_stub_executor_prints_the_command(self):
+        self.fresh_registry()
+        result = subprocess.run(get_scanner('ping').argv(get_scanner('ping').scan_args(['a.com'])),
+                                capture_output=True, text=True)
+        self.assertEqual(result.stdout, 'stub ping -c 4 a.com\n')
+
+    def test_local_executor(self):
+        executor = LocalExecutor()
+        self.assertEqual(executor.resolve(['sh', 'no-such-scanner']), {'sh': shutil.which('sh'), 'no-such-scanner': None})
+        self.assertEqual(executor.command('/usr/bin/nmap', ['-sV']), ['/usr/bin/nmap', '-sV'])
+        available = ScannerRegistry(executor, {'shell': ('sh', ['-c']), 'missing': ('no-such-scanner', [])})
+        self.assertTrue(available.get('shell').available)
+        shell = available.get('shell')
+        self.assertEqual(shell.argv(shell.scan_args(['echo hi'])), [shutil.which('sh'), '-c', 'echo hi'])
+        self.assertFalse(available.get('missing').available)
+        self.assertEqual(available.get('missing').argv([]), ['no-such-scanner'])
+
+    def test_wsl_executor(self):
+        # `env` stands in for wsl.exe: it runs the lookup script with the local shell
+        executor = WSLExecutor(wsl='env')
+        self.assertEqual(executor.resolve(['sh', 'no-such-scanner']), {'sh': shutil.which('sh'), 'no-such-scanner': None})
+        self.assertEqual(executor.command('/usr/bin/nmap', ['-sV']), ['env', '/usr/bin/nmap', '-sV'])
+        self.assertEqual(WSLExecutor(wsl='/nonexistent/wsl').resolve(['sh']), {'sh': None})
+
+
+ALLOCATE_SCRIPT = "import sys; data = bytearray(int(sys.argv[1]) * 1024 * 1024); print(len(data))"
+BUSY_SCRIPT = "while True: pass"
+
+
+@skipUnless(sys.platform.startswith('linux') and shutil.which('prlimit'), "needs prlimit")
+class ResourceLimitTests(TestCase):
+    def limited(self, **limits):
+        """
+        A registry running `python` locally under the limits.
+        """
+        definitions = {'python': (sys.executable, ['-c'])}
+        limited = ScannerRegistry(LocalExecutor(), definitions, resource_limits={'default': limits})
+        patch = mock.patch('scanner.registry._registry', limited)
+        patch.start()
+        self.addCleanup(patch.stop)
+        cache.clear()
+        return limited.get('python')
+
+    def run_python(self, scanner, *args, timeout=30):
+        return run_process(scanner.argv(scanner.scan_args(list(args))), timeout)
+
+    def test_limits_are_applied_through_prlimit_and_nice(self):
+        scanner = self.limited(address_space_mb=512, cpu_seconds=5, nice=5)
+        self.assertEqual(scanner.base[:5], [shutil.which('nice'), '-n', '5', shutil.which('prlimit'), '--cpu=5'])
+        self.assertEqual(self.run_python(scanner, 'import os; print(os.nice(0))').stdout.strip(),
+                         str(min(19, os.nice(0) + 5)))
+
+    def test_address_space_limit_makes_a_large_allocation_fail(self):
+        scanner = self.limited(address_space_mb=256)
+        self.assertEqual(self.run_python(scanner, ALLOCATE_SCRIPT, '16').returncode, 0)
+        result = self.run_python(scanner, ALLOCATE_SCRIPT, '1024')
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('MemoryError', result.stderr)
+        self.assertEqual(result.usage['exit_code'], result.returncode)
+
+    def test_cpu_limit_kills_a_busy_scanner(self):
+        scanner = self.limited(cpu_seconds=1)
+        started = time.monotonic()
+        result = self.run_python(scanner, BUSY_SCRIPT)
+        self.assertLess(result.returncode, 0)
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertGreaterEqual(result.usage['cpu_user_sec'] + result.usage['cpu_system_sec'], 0.9)
+
+    def test_scan_result_gets_the_usage_of_its_process(self):
+        self.limited()
+        with mock.patch.multiple(enrichment, _egress={'ip_address': '192.0.2.1'}, _expires_at=float('inf')):
+            result, cached = execute_scan('python', ['-c', ALLOCATE_SCRIPT, '64'], 30, None, 'guest')
+        self.assertFalse(cached)
+        scan = ScanResult.objects.get(pk=result['scan_id'])
+        self.assertEqual((scan.output, scan.exit_code), ('67108864\n', 0))
+        self.assertGreater(scan.max_rss_kb, 64 * 1024)
+        self.assertGreater(scan.cpu_user_sec + scan.cpu_system_sec, 0)
+
+
+def read_events(response):
+    """
+    The events of a streamed scan response as (event, payload) pairs.
+    """
+    body = b''.join(response.streaming_content).decode('utf-8')
+    if response['Content-Type'] == 'text/event-stream':
+        events = []
+        for frame in body.split('\n\n')[:-1]:
+            event, data = frame.split('\n')
+            events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+        return events
+    return [(event.pop('event'), event) for event in map(json.loads, body.splitlines())]
+
+
+@skipUnless(os.path.isdir('/proc'), "needs /proc to inspect process groups")
+class StreamingViewTests(ProcessTreeMixin, TestCase):
+    def setUp(self):
+        use_stub_scanners(self)
+        patch = mock.patch('scanner.scheduler._scheduler', ScanScheduler(4))
+        self.scheduler = patch.start()
+        self.addCleanup(patch.stop)
+
+    def post(self, url, data):
+        return self.client.post(url, data, content_type='application/json')
+
+    def test_ndjson_stream(self):
+        response = self.post('/ping/?stream=ndjson', {'target': 'a.com'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        events = read_events(response)
+        self.assertEqual([event for event, _ in events], ['queued', 'start', 'line', 'done'])
+        self.assertEqual(events[2][1], {'data': 'stub ping -c 4 a.com'})
+        scan = ScanResult.objects.get(pk=events[-1][1]['scan_id'])
+        self.assertEqual((scan.output, scan.exit_code), ('stub ping -c 4 a.com\n', 0))
+        self.assertEqual(self.scheduler.stats()['running'], 0)
+
+    def test_sse_stream(self):
+        response = self.post('/ping/?stream=sse', {'target': 'a.com'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        events = read_events(response)
+        self.assertEqual([event for event, _ in events], ['queued', 'start', 'line', 'done'])
+        self.assertTrue(ScanResult.objects.filter(pk=events[-1][1]['scan_id']).exists())
+
+    def test_multi_scanner_stream(self):
+        response = self.post('/api/custom-scan/?stream=ndjson', {'command': 'a.com', 'scanners': ['ping', 'nope']})
+        events = read_events(response)
+        self.assertIn(('error', {'scanner': 'nope', 'error': 'Unsupported scanner'}), events)
+        self.assertIn(('line', {'scanner': 'ping', 'data': 'stub ping -c 4 a.com'}), events)
+        event, done = events[-1]
+        self.assertEqual((event, done['scanner']), ('done', 'ping'))
+        self.assertEqual(ScanResult.objects.get(pk=done['scan_id']).scanner, 'ping')
+
+    def test_closing_the_response_kills_the_scanner_and_frees_its_slot(self):
+        # A "ping" that prints its process group and keeps running
+        script = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'slow.sh')
+        with open(script, 'w') as file:
+            file.write('echo $$; sleep 60 & sleep 60\n')
+        slow = ScannerRegistry(LocalExecutor(), {'ping': ('sh', [script])})
+        with mock.patch('scanner.registry._registry', slow):
+            response = self.post('/ping/?stream=ndjson', {'target': 'a.com'})
+            events = iter(response.streaming_content)
+            self.assertEqual([json.loads(next(events))['event'] for _ in range(2)], ['queued', 'start'])
+            pgid = int(json.loads(next(events))['data'])
+            self.assertEqual(self.scheduler.stats()['running'], 1)
+            # What the server does when the client goes away
+            response.close()
+        self.assertGroupGone(pgid)
+        self.assertEqual(self.scheduler.stats()['running'], 0)
+        self.assertFalse(ScanResult.objects.exists())
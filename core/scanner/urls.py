@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import *
 from scanner.views import *
+from .async_views import make_async_scan_view, AsyncMultiScanView
 
 urlpatterns = [
     path('nmap/', NmapScanView.as_view(), name='nmap-scan'),
@@ -21,6 +22,29 @@ urlpatterns = [
     path('lynx/', LynxScanView.as_view(), name='lynx-scan'),
     path('nuclei/', NucleiScanView.as_view(), name='nuclei-scan'),
     path('testssl/', TestSSLView.as_view(), name='testssl-scan'),
+    path('nmap/ports/', NmapPortSearchView.as_view(), name='nmap-port-search'),
+    path('nmap/hosts/', NmapHostSearchView.as_view(), name='nmap-host-search'),
+    path('nmap/scans/<int:scan_id>/hosts/', NmapScanHostsView.as_view(), name='nmap-scan-hosts'),
+    path('search/', ScanSearchView.as_view(), name='scan-search'),
+    path('diff/<int:a>/<int:b>/', ScanDiffView.as_view(), name='scan-diff'),
+    path('diff/<int:b>/', ScanDiffView.as_view(), name='scan-diff-previous'),
     path('download-cef/<int:scan_id>/', download_cef_output, name='download_cef_output'),
+    path('export/', ScanExportView.as_view(), name='scan-export'),
     path('api/custom-scan/', MultiScanView.as_view(), name='custom-scan'),
+    path('jobs/<uuid:job_id>/', ScanJobDetailView.as_view(), name='scan-job-detail'),
+    path('jobs/<uuid:job_id>/result/', ScanJobResultView.as_view(), name='scan-job-result'),
+    path('jobs/<uuid:job_id>/targets/', ScanJobTargetsView.as_view(), name='scan-job-targets'),
+    path('bulk/', BulkScanView.as_view(), name='bulk-scan'),
+    path('schedules/', ScheduledScanListView.as_view(), name='scheduled-scan-list'),
+    path('schedules/<int:schedule_id>/', ScheduledScanDetailView.as_view(), name='scheduled-scan-detail'),
+    path('scheduler/stats/', ScanSchedulerStatsView.as_view(), name='scan-scheduler-stats'),
+]
+
+# asyncio variants of every scan endpoint, served without a thread per scan under ASGI
+urlpatterns += [
+    path(f'aio/{pattern.pattern}', make_async_scan_view(pattern.callback.view_class).as_view(), name=f'aio-{pattern.name}')
+    for pattern in list(urlpatterns)
+    if hasattr(getattr(pattern.callback, 'view_class', None), 'scanner_config')
+] + [
+    path('aio/api/custom-scan/', AsyncMultiScanView.as_view(), name='aio-custom-scan'),
 ]
@@ -1,14 +1,38 @@
 import shlex
 import subprocess
-import requests
-from time import time
-from django.http import HttpResponse, Http404
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+from django.http import HttpResponse, Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
-from .models import ScanResult
-from .serializers import ScanResultSerializer
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from .models import ScanResult, ScanJob, ScanHost, ScanPort, ScheduledScan
+from .serializers import (
+    ScanResultSerializer, ScanJobSerializer, ScanJobTargetSerializer, ScanHostSerializer, ScheduledScanSerializer
+)
+from .services import execute_scan, save_scan_result
+from .registry import get_registry, get_scanner
+from .jobs import enqueue_scan, enqueue_sharded_scan, cancel_job, job_progress
+from .sharding import TARGET_RE, ShardError, can_shard, make_shards
+from .bulk import enqueue_bulk_scan
+from .schedules import next_run
+from .streaming import STREAM_FORMATS, ScanProcessStream, get_stream_format, format_event, merge_streams
+from .scheduler import SchedulerTimeout, get_scheduler, scan_slot, user_key_for
+from .nmap_results import NMAP_SCANNER, diff_ports, xml_report
+from .deltas import diff_lines
+from .search import SearchError, search_scans
+from .export import EXPORT_FORMATS, cef_record, export_queryset, export_records, parse_date_bound
+from .python_pool import pool_stats
+from .processes import CancelToken
 from users.models import Subscription
+from core.http_client import http_stats
+from core.ratelimit import ratelimit, use_guest_scan
 import logging
 import concurrent.futures
 
@@ -24,131 +48,202 @@ def is_command_safe(args):
             return False
     return True
 
-def get_public_ip():
-    try:
-        res = requests.get("https://api.ipify.org?format=json", timeout=5)
-        res.raise_for_status()
-        return res.json().get("ip")
-    except requests.RequestException:
-        return None
+def is_truthy(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
 
-def get_ip_geoinfo(ip):
-    try:
-        res = requests.get(f"https://ipwho.is/{ip}", timeout=5)
-        res.raise_for_status()
-        return res.json() if res.json().get("success") else {}
-    except Exception:
-        return {}
+def streaming_response(fmt, events):
+    response = StreamingHttpResponse(events, content_type=STREAM_FORMATS[fmt])
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def make_scan_view(name, timeout=180):
+    # name is the scanner in scanner.registry, which knows its binary and default arguments
 
-def make_scan_view(command_name, default_args=None, timeout=180, use_bash_c=False):
     class GenericScanView(APIView):
         permission_classes = [AllowAny]
+        scanner_config = {
+            "name": name,
+            "timeout": timeout,
+        }
 
-        def post(self, request):
+        @staticmethod
+        def get_scan_args(request):
+            """
+            Returns (args, None) or (None, error Response).
+            """
             command_line = request.data.get("command")
             target = request.data.get("target")
 
             if not command_line and not target:
-                return Response({"error": "Provide either 'command' or 'target'."}, status=400)
+                return None, Response({"error": "Provide either 'command' or 'target'."}, status=400)
             if command_line and target:
-                return Response({"error": "Provide only one of 'command' or 'target', not both."}, status=400)
-
+                return None, Response({"error": "Provide only one of 'command' or 'target', not both."}, status=400)
+
+            if command_line:
+                args = shlex.split(command_line)
+            else:
+                args = [target]
+
+            args = get_scanner(name).scan_args(args)
+
+            if not is_command_safe(args):
+                return None, Response({"error": "Unsafe command detected"}, status=400)
+            return args, None
+
+        @staticmethod
+        def get_shards(request, args):
+            """
+            Returns (list of shard argument lists, None) or (None, error Response).
+            """
+            if not can_shard(name):
+                return None, Response({"error": f"{name} scans cannot be sharded"}, status=400)
             try:
-                if command_line:
-                    args = shlex.split(command_line)
-                else:
-                    args = [target]
-
-                if use_bash_c:
-                    args = [' '.join((default_args or []) + args)]
-                else:
-                    args = (default_args or []) + args
-
-                if not is_command_safe(args):
-                    return Response({"error": "Unsafe command detected"}, status=400)
-
-                user = request.user if request.user.is_authenticated else None
-
-                if user:
-                    subscription = Subscription.objects.filter(user=user).first()
-                    if not subscription:
-                        return Response({"error": "No subscription found"}, status=403)
-
-                    subscription.expire_if_needed()
-
-                    if not subscription.is_active():
-                        return Response({"error": "Subscription expired."}, status=403)
-
-                    if subscription.attempts_left <= 0:
-                        return Response({"error": "No attempts left. Please upgrade your plan."}, status=403)
-
-                    subscription.use_attempt()
-                else:
-                    attempts_left = request.session.get("guest_attempts", 3)
-                    if attempts_left <= 0:
-                        return Response({"error": "Guest scan limit exceeded. Please register."}, status=403)
-                    request.session["guest_attempts"] = attempts_left - 1
-                    request.session.modified = True
-
-                start_time = time()
-                cmd = ['wsl', command_name] + args
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
-                duration = round(time() - start_time, 2)
-
-                ip_address = get_public_ip() or "8.8.8.8"
-                geo = get_ip_geoinfo(ip_address)
-
-                ScanResult.objects.create(
-                    user=user,
-                    scanner=command_name,
-                    command=' '.join(args),
-                    output=result.stdout,
-                    ip_address=ip_address,
-                    country=geo.get("country"),
-                    country_code=geo.get("country_code"),
-                    city=geo.get("city"),
-                    region=geo.get("region"),
-                    region_code=geo.get("region_code"),
-                    continent_code=geo.get("continent_code"),
-                    timezone=geo.get("timezone", {}).get("id"),
-                    utc_offset=geo.get("utc_offset"),
-                    latitude=geo.get("latitude"),
-                    longitude=geo.get("longitude"),
-                    org=geo.get("org"),
-                    asn=geo.get("asn"),
-                )
+                shard_size = int(request.data.get("shard_size") or settings.SCAN_SHARD_SIZE.get(name, 256))
+            except (TypeError, ValueError):
+                return None, Response({"error": "shard_size must be a number"}, status=400)
+            if shard_size < 1:
+                return None, Response({"error": "shard_size must be at least 1"}, status=400)
+            try:
+                return make_shards(name, args, shard_size, settings.SCAN_MAX_SHARDS), None
+            except ShardError as e:
+                return None, Response({"error": str(e)}, status=400)
+
+        @staticmethod
+        def charge_attempt(request):
+            """
+            Checks the subscription (or guest quota) and uses one attempt.
+            Returns (user, None) or (None, error Response).
+            """
+            user = request.user if request.user.is_authenticated else None
+
+            if user:
+                subscription = Subscription.objects.filter(user=user).first()
+                if not subscription:
+                    return None, Response({"error": "No subscription found"}, status=403)
+
+                subscription.expire_if_needed()
+
+                if not subscription.is_active():
+                    return None, Response({"error": "Subscription expired."}, status=403)
+
+                if subscription.attempts_left <= 0:
+                    return None, Response({"error": "No attempts left. Please upgrade your plan."}, status=403)
+
+                subscription.use_attempt()
+            else:
+                allowed, _, _ = use_guest_scan(request)
+                if not allowed:
+                    return None, Response({"error": "Guest scan limit exceeded. Please register."}, status=403)
+            return user, None
+
+        @ratelimit('scan', key='user_or_ip', algorithm='token_bucket')
+        def post(self, request):
+            try:
+                args, error = self.get_scan_args(request)
+                if error:
+                    return error
+
+                shards = None
+                if is_truthy(request.data.get("shard")):
+                    shards, error = self.get_shards(request, args)
+                    if error:
+                        return error
+
+                user, error = self.charge_attempt(request)
+                if error:
+                    return error
+
+                if shards is not None:
+                    # The shards run in parallel on the scan workers, progress is on the status URL
+                    job = enqueue_sharded_scan(user, name, args, shards, timeout)
+                    return Response({
+                        "job_id": str(job.pk),
+                        "status": job.status,
+                        "shards": job.shard_count,
+                        "status_url": reverse('scan-job-detail', args=[job.pk]),
+                        "result_url": reverse('scan-job-result', args=[job.pk]),
+                    }, status=202)
+
+                if is_truthy(request.data.get("async")):
+                    job = enqueue_scan(user, name, args, timeout)
+                    return Response({
+                        "job_id": str(job.pk),
+                        "status": job.status,
+                        "status_url": reverse('scan-job-detail', args=[job.pk]),
+                        "result_url": reverse('scan-job-result', args=[job.pk]),
+                    }, status=202)
+
+                stream_format = get_stream_format(request)
+                if stream_format:
+                    return streaming_response(stream_format, self.stream_scan(stream_format, user, args, user_key_for(user, request)))
+
+                result, cached = execute_scan(name, args, timeout, user, user_key_for(user, request))
 
                 return Response({
-                    "output": result.stdout,
-                    "error_output": result.stderr,
-                    "duration_sec": duration
+                    "output": result["output"],
+                    "error_output": result["error_output"],
+                    "duration_sec": result["duration_sec"],
+                    "cached": cached,
                 })
 
             except subprocess.TimeoutExpired:
-                return Response({"error": f"{command_name} scan timed out"}, status=408)
+                return Response({"error": f"{name} scan timed out"}, status=408)
+            except SchedulerTimeout as e:
+                return Response({"error": str(e)}, status=503)
             except Exception as e:
                 return Response({"error": str(e)}, status=500)
 
+        def stream_scan(self, fmt, user, args, user_key):
+            # Always a fresh process: the result cache and the interpreter pool only hand back
+            # whole outputs, a stream relays the lines as they are printed
+            with xml_report(name, args) as (run_args, import_report):
+                stream = ScanProcessStream(get_scanner(name).argv(run_args), timeout, slot=scan_slot(name, user_key))
+                try:
+                    yield format_event(fmt, "queued", {"scanner": name})
+                    stream.start()
+                    yield format_event(fmt, "start", {"scanner": name})
+                    for line in stream.lines():
+                        yield format_event(fmt, "line", {"data": line.rstrip("\n")})
+                    output, error_output = stream.finish()
+                    if stream.timed_out:
+                        yield format_event(fmt, "error", {"error": f"{name} scan timed out"})
+                        return
+                    scan = save_scan_result(user, name, args, output, usage=stream.usage)
+                    import_report(scan)
+                    yield format_event(fmt, "done", {
+                        "scan_id": scan.id,
+                        "error_output": error_output,
+                        "duration_sec": stream.duration,
+                    })
+                except Exception as e:
+                    logger.error(f"Error streaming {name}: {e}")
+                    yield format_event(fmt, "error", {"error": str(e)})
+                finally:
+                    stream.close()
+
     return GenericScanView
 
 NmapScanView = make_scan_view("nmap", timeout=120)
 ZmapScanView = make_scan_view("zmap", timeout=120)
-PingView = make_scan_view("ping", default_args=["-c", "4"], timeout=30)
+PingView = make_scan_view("ping", timeout=30)
 NiktoScanView = make_scan_view("nikto", timeout=180)
 TracerouteView = make_scan_view("traceroute", timeout=60)
 WhatwebScanView = make_scan_view("whatweb", timeout=120)
 WPScanView = make_scan_view("wpscan", timeout=180)
 DNSReconScanView = make_scan_view("dnsrecon", timeout=120)
-XSStrikeScanView = make_scan_view("/home/armen/tools/XSStrike/venv/bin/python", default_args=["/home/armen/tools/XSStrike/xsstrike.py"], timeout=180)
-DNScanView = make_scan_view("python3", default_args=["/home/armen/tools/dnscan/dnscan.py"], timeout=120)
+XSStrikeScanView = make_scan_view("xssstrike", timeout=180)
+DNScanView = make_scan_view("dnsscan", timeout=120)
 SQLMapScanView = make_scan_view("sqlmap", timeout=180)
-CommixScanView = make_scan_view("/snap/bin/commix", timeout=180)
-JoomlaVSSCanView = make_scan_view("ruby", default_args=["/home/armen/tools/joomlavs/joomlavs.rb", "-u"], timeout=180)
-GitDumperScanView = make_scan_view("/home/armen/tools/XSStrike/venv/bin/python", default_args=["/home/armen/tools/git-dumper/git_dumper.py"], timeout=180)
-SchemathesisScanView = make_scan_view("/bin/bash", default_args=["-c", "/root/.local/bin/schemathesis"], timeout=180, use_bash_c=True)
+CommixScanView = make_scan_view("commix", timeout=180)
+JoomlaVSSCanView = make_scan_view("joomlavss", timeout=180)
+GitDumperScanView = make_scan_view("gitdumper", timeout=180)
+SchemathesisScanView = make_scan_view("schemathesis", timeout=180)
 LynxScanView = make_scan_view("lynx", timeout=60)
-NucleiScanView = make_scan_view("nuclei", default_args=["-severity", "medium,high,critical"], timeout=180)
-TestSSLView = make_scan_view("wsl", default_args=["/home/armen/testssl.sh/testssl.sh"], timeout=180)
+NucleiScanView = make_scan_view("nuclei", timeout=180)
+TestSSLView = make_scan_view("testssl", timeout=180)
 
 def download_cef_output(request, scan_id):
     try:
@@ -156,25 +251,413 @@ def download_cef_output(request, scan_id):
     except ScanResult.DoesNotExist:
         raise Http404("Scan not found")
 
-    safe_msg = scan.output[:1000].replace('\n', ' ')[:1000]
-    cef = (
-        f"CEF:0|WebScanner|{scan.scanner}|1.0|100|Scan Event|Low|"
-        f"src={scan.ip_address or 'unknown'} "
-        f"suser={(scan.user.username if scan.user else 'guest')} "
-        f"request={scan.command} "
-        f"msg={safe_msg}"
-    )
+    cef = cef_record(scan)
 
     filename = f"scan_{scan.id}_{scan.scanner}.cef"
     response = HttpResponse(cef, content_type='text/plain')
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
+
+class ScanExportView(APIView):
+    """
+    Streams scan history as CEF, JSON Lines or syslog records, oldest first, e.g.
+    ?as=jsonl&scanner=nmap&since=2026-01-01&after_id=1234 (not ?format=, which DRF reserves).
+    Every record carries the scan id; pass the last one received as after_id to resume. Staff
+    export everyone's scans (or one user's with ?user=<id>), other users only their own.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        fmt = params.get('as', 'cef')
+        if fmt not in EXPORT_FORMATS:
+            return Response({"error": f"as must be one of: {', '.join(EXPORT_FORMATS)}"}, status=400)
+        bounds = {}
+        for name in ('since', 'until'):
+            if params.get(name):
+                bounds[name] = parse_date_bound(params[name], end=name == 'until')
+                if bounds[name] is None:
+                    return Response({"error": f"{name} must be a date or datetime (ISO 8601)"}, status=400)
+        try:
+            after_id = int(params.get('after_id', 0))
+            limit = int(params['limit']) if params.get('limit') else None
+            user_id = int(params['user']) if params.get('user') else None
+        except ValueError:
+            return Response({"error": "after_id, limit and user must be numbers"}, status=400)
+
+        if not request.user.is_staff:
+            user_id = request.user.pk
+        scans = export_queryset(scanner=params.get('scanner'), after_id=after_id, **bounds)
+        if user_id is not None:
+            scans = scans.filter(user_id=user_id)
+
+        response = StreamingHttpResponse(
+            (line for _, line in export_records(fmt, scans, limit=limit)), content_type=EXPORT_FORMATS[fmt]
+        )
+        response['Content-Disposition'] = f'attachment; filename="scans_after_{after_id}.{fmt}"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+def get_job_for_request(request, job_id):
+    job = get_object_or_404(ScanJob.objects.select_related('result'), pk=job_id)
+    if job.user_id and (not request.user.is_authenticated or request.user.pk != job.user_id):
+        raise Http404("Job not found")
+    return job
+
+class ScanJobDetailView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, job_id):
+        job = get_job_for_request(request, job_id)
+        return Response(ScanJobSerializer(job).data)
+
+    def delete(self, request, job_id):
+        job = get_job_for_request(request, job_id)
+        if not cancel_job(job):
+            job.refresh_from_db()
+            return Response({"error": "Job already finished", "status": job.status}, status=409)
+        job.refresh_from_db()
+        return Response(ScanJobSerializer(job).data, status=202)
+
+class ScanJobResultView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, job_id):
+        job = get_job_for_request(request, job_id)
+        if not job.is_finished:
+            return Response({"job_id": str(job.pk), "status": job.status}, status=202)
+        if job.status == ScanJob.STATUS_CANCELLED:
+            return Response({"job_id": str(job.pk), "status": job.status, "error": job.error}, status=410)
+        if job.status == ScanJob.STATUS_FAILED:
+            status_code = 408 if "timed out" in job.error else 500
+            return Response({"job_id": str(job.pk), "status": job.status, "error": job.error}, status=status_code)
+        if job.target_count:
+            # A bulk job has one result per target
+            return Response({
+                "job_id": str(job.pk),
+                "status": job.status,
+                "error": job.error,
+                "duration_sec": job.duration_sec,
+                "progress": job_progress(job),
+                "targets_url": reverse('scan-job-targets', args=[job.pk]),
+            })
+
+        return Response({
+            "job_id": str(job.pk),
+            "status": job.status,
+            "scan_id": job.result_id,
+            "output": job.result.output if job.result else "",
+            "error_output": job.error_output,
+            "duration_sec": job.duration_sec,
+        })
+
+
+class ScanJobTargetPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+class ScanJobTargetsView(APIView):
+    """
+    Per-target results of a bulk job, ?status=failed to list only one status.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, job_id):
+        job = get_job_for_request(request, job_id)
+        targets = (job.targets
+                   .select_related('result')
+                   .only('index', 'target', 'status', 'error', 'error_output', 'duration_sec', 'result_id',
+                         'result__output_preview', 'result__output_size')
+                   .order_by('index'))
+        if request.query_params.get('status'):
+            targets = targets.filter(status=request.query_params['status'])
+        paginator = ScanJobTargetPagination()
+        page = paginator.paginate_queryset(targets, request, view=self)
+        return paginator.get_paginated_response(ScanJobTargetSerializer(page, many=True).data)
+
+class BulkScanView(APIView):
+    """
+    Runs one scanner against a list of targets as a single job:
+    {"scanner": "nmap", "targets": ["a.com", "10.0.0.1"], "command": "-p 22,80"}
+    Every target uses one attempt, all of them are charged up front.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @staticmethod
+    def get_targets(data):
+        targets = data.get("targets")
+        if isinstance(targets, str):
+            targets = targets.split()
+        if not isinstance(targets, list) or not targets:
+            return None, Response({"error": "Provide 'targets' as a non-empty list."}, status=400)
+        targets = [str(target).strip() for target in targets if str(target).strip()]
+        if len(targets) > settings.SCAN_BULK_MAX_TARGETS:
+            return None, Response({"error": f"At most {settings.SCAN_BULK_MAX_TARGETS} targets per request"}, status=400)
+        invalid = [target for target in targets if len(target) > 255 or not TARGET_RE.match(target)]
+        if invalid:
+            return None, Response({"error": "Invalid targets", "targets": invalid[:20]}, status=400)
+        return targets, None
+
+    def post(self, request):
+        name = request.data.get("scanner")
+        if not name or name not in get_registry():
+            return Response({"error": "Unknown scanner"}, status=400)
+        targets, error = self.get_targets(request.data)
+        if error:
+            return error
+        try:
+            options = shlex.split(request.data.get("command") or '')
+        except ValueError as e:
+            return Response({"error": f"Invalid command: {e}"}, status=400)
+        if not is_command_safe(options + targets):
+            return Response({"error": "Unsafe command detected"}, status=400)
+
+        subscription = Subscription.objects.filter(user=request.user).first()
+        if not subscription:
+            return Response({"error": "No subscription found"}, status=403)
+        subscription.expire_if_needed()
+        if not subscription.is_active():
+            return Response({"error": "Subscription expired."}, status=403)
+        # The attempts are given back if the job cannot be queued
+        with transaction.atomic():
+            if not subscription.use_attempts(len(targets)):
+                return Response({
+                    "error": f"Not enough attempts left: {len(targets)} needed, {subscription.attempts_left} left."
+                }, status=403)
+            job = enqueue_bulk_scan(request.user, name, options, targets, settings.SCAN_BULK_TIMEOUT)
+        return Response({
+            "job_id": str(job.pk),
+            "status": job.status,
+            "targets": job.target_count,
+            "status_url": reverse('scan-job-detail', args=[job.pk]),
+            "result_url": reverse('scan-job-result', args=[job.pk]),
+            "targets_url": reverse('scan-job-targets', args=[job.pk]),
+        }, status=202)
+
+
+class ScheduledScanListView(APIView):
+    """
+    The user's scheduled scans. POST {"scanner": "nmap", "command": "-F a.com", "cron": "0 3 * * *"};
+    cron times are UTC and every run uses one attempt.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        schedules = ScheduledScan.objects.filter(user=request.user)
+        return Response(ScheduledScanSerializer(schedules, many=True).data)
+
+    def post(self, request):
+        if ScheduledScan.objects.filter(user=request.user).count() >= settings.SCAN_SCHEDULE_MAX_PER_USER:
+            return Response({"error": f"At most {settings.SCAN_SCHEDULE_MAX_PER_USER} scheduled scans per user"}, status=400)
+        serializer = ScheduledScanSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        if not is_command_safe(serializer.validated_data['args']):
+            return Response({"error": "Unsafe command detected"}, status=400)
+        schedule = serializer.save(user=request.user)
+        schedule.next_run_at = next_run(schedule, timezone.now())
+        schedule.save(update_fields=['next_run_at'])
+        return Response(ScheduledScanSerializer(schedule).data, status=201)
+
+class ScheduledScanDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, schedule_id):
+        schedule = get_object_or_404(ScheduledScan, pk=schedule_id, user=request.user)
+        return Response(ScheduledScanSerializer(schedule).data)
+
+    def patch(self, request, schedule_id):
+        schedule = get_object_or_404(ScheduledScan, pk=schedule_id, user=request.user)
+        was_enabled = schedule.enabled
+        serializer = ScheduledScanSerializer(schedule, data=request.data, partial=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        if 'args' in serializer.validated_data and not is_command_safe(serializer.validated_data['args']):
+            return Response({"error": "Unsafe command detected"}, status=400)
+        schedule = serializer.save()
+        if 'cron' in serializer.validated_data or (schedule.enabled and not was_enabled):
+            schedule.next_run_at = next_run(schedule, timezone.now())
+            schedule.save(update_fields=['next_run_at'])
+        return Response(ScheduledScanSerializer(schedule).data)
+
+    def delete(self, request, schedule_id):
+        schedule = get_object_or_404(ScheduledScan, pk=schedule_id, user=request.user)
+        schedule.delete()
+        return Response(status=204)
+
+
+NMAP_QUERY_MAX_LIMIT = 1000
+
+def nmap_port_filter(params, prefix=''):
+    """
+    Builds the port/state/service/protocol filter of the nmap query endpoints.
+    prefix is the path from the queried model to ScanPort. Returns (Q, None) or (None, error Response).
+    """
+    condition = Q()
+    if params.get('port'):
+        try:
+            ports = [int(port) for port in params['port'].split(',')]
+        except ValueError:
+            return None, Response({"error": "port must be a number or a comma separated list of numbers"}, status=400)
+        condition &= Q(**{f'{prefix}port__in': ports})
+    if params.get('state'):
+        condition &= Q(**{f'{prefix}state': params['state']})
+    if params.get('protocol'):
+        condition &= Q(**{f'{prefix}protocol': params['protocol']})
+    if params.get('service'):
+        condition &= Q(**{f'{prefix}service__name': params['service']})
+    return condition, None
+
+def query_limit(params):
+    try:
+        return max(1, min(int(params.get('limit', 100)), NMAP_QUERY_MAX_LIMIT))
+    except ValueError:
+        return 100
+
+class NmapPortSearchView(APIView):
+    """
+    Ports found by the user's nmap scans, e.g. ?port=3389&state=open or ?service=ssh
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        condition, error = nmap_port_filter(request.query_params)
+        if error:
+            return error
+
+        ports = ScanPort.objects.filter(condition, host__scan__user=request.user)
+        if request.query_params.get('address'):
+            ports = ports.filter(host__address=request.query_params['address'])
+
+        rows = (ports
+                .order_by('-host__scan__created_at', 'host__address', 'port')
+                .values('port', 'protocol', 'state', 'reason',
+                        address=F('host__address'),
+                        hostname=F('host__hostname'),
+                        service_name=F('service__name'),
+                        product=F('service__product'),
+                        version=F('service__version'),
+                        scan_id=F('host__scan_id'),
+                        scanned_at=F('host__scan__created_at'))
+                [:query_limit(request.query_params)])
+        return Response(list(rows))
+
+class NmapHostSearchView(APIView):
+    """
+    Distinct targets with at least one matching port, e.g. ?port=3389&state=open
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        condition, error = nmap_port_filter(request.query_params, prefix='ports__')
+        if error:
+            return error
+
+        hosts = (ScanHost.objects
+                 .filter(condition, scan__user=request.user)
+                 .values('address')
+                 .annotate(last_seen=Max('scan__created_at'), scans=Count('scan', distinct=True))
+                 .order_by('-last_seen')
+                 [:query_limit(request.query_params)])
+        return Response(list(hosts))
+
+class NmapScanHostsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, scan_id):
+        scan = get_object_or_404(ScanResult.objects.only('id'), pk=scan_id, user=request.user)
+        hosts = ScanHost.objects.filter(scan=scan).prefetch_related('ports__service')
+        return Response(ScanHostSerializer(hosts, many=True).data)
+
+class ScanDiffView(APIView):
+    """
+    What changed between two scans of the user: lines added and removed in the output, and for
+    nmap the ports that were opened or closed. Without `a`, b is compared with the scan before it
+    in its chain (same scanner and command).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, b, a=None):
+        new = get_object_or_404(ScanResult.objects.select_related('previous'), pk=b, user=request.user)
+        if a is None:
+            if new.previous_id is None:
+                return Response({"error": "This scan has no earlier scan to compare with"}, status=404)
+            old = new.previous
+        else:
+            old = get_object_or_404(ScanResult, pk=a, user=request.user)
+
+        data = {
+            "a": old.pk,
+            "b": new.pk,
+            "same_chain": bool(old.chain_key) and old.chain_key == new.chain_key,
+            **diff_lines(old.output, new.output),
+        }
+        if old.scanner == NMAP_SCANNER and new.scanner == NMAP_SCANNER:
+            data["ports"] = diff_ports(old.pk, new.pk)
+        return Response(data)
+
+SEARCH_MAX_LIMIT = 100
+
+class ScanSearchView(APIView):
+    """
+    Full-text search over the outputs of the user's scans, best matches first, e.g.
+    ?q=CVE-2021-44228 or ?q="mail.example.com" ssh&scanner=nmap&since=2026-01-01&folder=3.
+    Terms must all match, a trailing * matches a prefix. Matches in the snippet are marked with [ ].
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        bounds = {}
+        for name in ('since', 'until'):
+            if params.get(name):
+                bounds[name] = parse_date_bound(params[name], end=name == 'until')
+                if bounds[name] is None:
+                    return Response({"error": f"{name} must be a date or datetime (ISO 8601)"}, status=400)
+        try:
+            folder = int(params['folder']) if params.get('folder') else None
+            limit = max(1, min(int(params.get('limit', 20)), SEARCH_MAX_LIMIT))
+            offset = max(0, int(params.get('offset', 0)))
+        except ValueError:
+            return Response({"error": "folder, limit and offset must be numbers"}, status=400)
+
+        try:
+            matches = search_scans(
+                params.get('q', ''), request.user, scanner=params.get('scanner'), folder=folder,
+                limit=limit, offset=offset, **bounds,
+            )
+        except SearchError as e:
+            return Response({"error": str(e)}, status=400)
+
+        scans = (ScanResult.objects
+                 .only('id', 'scanner', 'command', 'folder_id', 'created_at')
+                 .in_bulk([pk for pk, _, _ in matches]))
+        results = [
+            {
+                "id": pk,
+                "scanner": scans[pk].scanner,
+                "command": scans[pk].command,
+                "folder": scans[pk].folder_id,
+                "created_at": scans[pk].created_at,
+                "rank": rank,
+                "snippet": snippet,
+            }
+            for pk, rank, snippet in matches if pk in scans
+        ]
+        return Response({
+            "results": results,
+            "next_offset": offset + limit if len(matches) == limit else None,
+        })
+
 logger = logging.getLogger(__name__)
 
 class MultiScanView(APIView):
     permission_classes = [AllowAny]
 
+    @ratelimit('scan', key='user_or_ip', algorithm='token_bucket')
     def post(self, request):
         # Получаем данные из запроса
         command = request.data.get('command')
@@ -187,6 +670,11 @@ class MultiScanView(APIView):
         if isinstance(scanners, str):
             scanners = [scanners]  # если передан только один сканер, преобразуем его в список
 
+        try:
+            args = shlex.split(command)
+        except ValueError as e:
+            return Response({"error": f"Invalid command: {e}"}, status=400)
+
         # Проверка подписки или попыток
         user = request.user if request.user.is_authenticated else None
         if user:
@@ -194,12 +682,18 @@ class MultiScanView(APIView):
             if not subscription or not subscription.is_active():
                 return Response({"error": "No active subscription found."}, status=403)
 
+        stream_format = get_stream_format(request)
+        if stream_format:
+            return streaming_response(stream_format, self.stream_scans(stream_format, scanners, args, user, user_key_for(user, request)))
+
+        user_key = user_key_for(user, request)
         results = []
         try:
-            # Используем потоковый подход для параллельной обработки сканов
-            with concurrent.futures.ThreadPoolExecutor() as executor:
+            # Потоки в основном ждут свою очередь в общем планировщике, число процессов ограничивает он
+            workers = min(len(scanners), settings.SCAN_MULTI_MAX_WORKERS)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
                 future_to_scanner = {
-                    executor.submit(self.run_scan, scanner, command): scanner for scanner in scanners
+                    executor.submit(self.run_scan, scanner, args, user, user_key): scanner for scanner in scanners
                 }
                 for future in concurrent.futures.as_completed(future_to_scanner):
                     scanner = future_to_scanner[future]
@@ -216,54 +710,90 @@ class MultiScanView(APIView):
             logger.error(f"Error during scanning: {str(e)}")
             return Response({"error": str(e)}, status=500)
 
-    def run_scan(self, scanner, command):
+    def run_scan(self, scanner, args, user=None, user_key="guest"):
         """
         Запускает команду для каждого сканера и возвращает результат.
         """
         try:
-            cmd = self.get_command_for_scanner(scanner, command)
-            if not cmd:
+            scan_args = self.get_scan_args(scanner, args)
+            if scan_args is None:
                 return {"scanner": scanner, "error": "Unsupported scanner"}
 
-            # Выполняем команду с ограничением по времени
-            process = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate(timeout=120)
+            # Как у одиночных сканов: планировщик, кэш результатов и сохранение через scanner.services
+            result, cached = execute_scan(scanner, scan_args, 120, user, user_key)
 
-            # Сохранение результата в базе данных
-            ScanResult.objects.create(
-                scanner=scanner,
-                command=command,
-                output=stdout.decode(),
-            )
-
-            return {"scanner": scanner, "output": stdout.decode(), "error_output": stderr.decode()}
+            return {"scanner": scanner, "output": result["output"], "error_output": result["error_output"], "cached": cached}
 
         except subprocess.TimeoutExpired:
             return {"scanner": scanner, "error": f"{scanner} scan timed out"}
+        except SchedulerTimeout as e:
+            return {"scanner": scanner, "error": str(e)}
         except Exception as e:
             return {"scanner": scanner, "error": f"Error running {scanner}: {str(e)}"}
 
-    def get_command_for_scanner(self, scanner, command):
+    def stream_scans(self, fmt, scanners, args, user=None, user_key="guest"):
         """
-        Method to get the command for each scanner.
+        Runs all scanners at once and relays their output lines as they are printed.
+        Each scanner starts as soon as the scheduler gives it a slot. Like stream_scan, this
+        bypasses the result cache and the interpreter pool.
         """
-        commands = {
-            "nmap": f"wsl /usr/bin/nmap {command}",
-            "zmap": f"wsl /usr/bin/zmap {command}",
-            "ping": f"wsl ping -c 4 {command}",
-            "nikto": f"wsl /usr/bin/nikto {command}",
-            "traceroute": f"wsl /usr/bin/traceroute {command}",
-            "whatweb": f"wsl /usr/bin/whatweb {command}",
-            "wpscan": f"wsl /usr/bin/wpscan {command}",
-            "joomlavss": f"wsl ruby /home/armen/tools/joomlavs/joomlavs.rb -u {command}",
-            "dnsrecon": f"wsl /usr/bin/dnsrecon {command}",
-            "dnsscan": f"wsl python3 /home/armen/tools/dnscan/dnscan.py {command}",
-            "xssstrike": f"wsl python3 /home/armen/tools/XSStrike/xsstrike.py {command}",
-            "nuclei": f"wsl /usr/bin/nuclei {command}",
-            "testssl": f"wsl /home/armen/testssl.sh/testssl.sh {command}",
-            "gitdumper": f"wsl python3 /home/armen/tools/git-dumper/git_dumper.py {command}",
-            "schemathesis": f"wsl /bin/bash -c /root/.local/bin/schemathesis {command}",
-            "lynx": f"wsl lynx {command}",
-        }
-        return commands.get(scanner)
+        streams = {}
+        scan_args = {}
+        importers = {}
+        reports = ExitStack()
+        try:
+            for scanner in dict.fromkeys(scanners):
+                scan_args[scanner] = self.get_scan_args(scanner, args)
+                if scan_args[scanner] is None:
+                    yield format_event(fmt, "error", {"scanner": scanner, "error": "Unsupported scanner"})
+                    continue
+                run_args, importers[scanner] = reports.enter_context(xml_report(scanner, scan_args[scanner]))
+                cancel = CancelToken()
+                streams[scanner] = ScanProcessStream(
+                    get_scanner(scanner).argv(run_args), 120, slot=scan_slot(scanner, user_key, cancel), cancel=cancel
+                )
+                yield format_event(fmt, "queued", {"scanner": scanner})
+
+            for scanner, line in merge_streams(streams):
+                if line is not None:
+                    yield format_event(fmt, "line", {"scanner": scanner, "data": line.rstrip("\n")})
+                    continue
+
+                stream = streams[scanner]
+                if stream.error:
+                    yield format_event(fmt, "error", {"scanner": scanner, "error": f"Error running {scanner}: {str(stream.error)}"})
+                    continue
+                output, error_output = stream.finish()
+                if stream.timed_out:
+                    yield format_event(fmt, "error", {"scanner": scanner, "error": f"{scanner} scan timed out"})
+                    continue
+                scan = save_scan_result(user, scanner, scan_args[scanner], output, usage=stream.usage)
+                importers[scanner](scan)
+                yield format_event(fmt, "done", {
+                    "scanner": scanner,
+                    "scan_id": scan.id,
+                    "error_output": error_output,
+                    "duration_sec": stream.duration,
+                })
+        finally:
+            for stream in streams.values():
+                stream.close()
+            reports.close()
+
+    @staticmethod
+    def get_scan_args(scanner, args):
+        """
+        args with the scanner's default arguments from scanner.registry, None for unknown scanners.
+        """
+        spec = get_registry().get(scanner)
+        if spec is None:
+            return None
+        return spec.scan_args(args)
+
+
+
+class ScanSchedulerStatsView(APIView):
+    permission_classes = [IsAdminUser]
 
+    def get(self, request):
+        return Response({**get_scheduler().stats(), "python_pools": pool_stats(), "http": http_stats()})
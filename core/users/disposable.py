@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import concurrent.futures
+from time import monotonic
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from core.http_client import http_get
+
+logger = logging.getLogger(__name__)
+
+# Disposable email detection for registration, without an external call in the request path.
+# The domains in DISPOSABLE_EMAIL_DOMAINS_FILE (one per line, # comments) are loaded into a
+# set, or into a Bloom filter once the list has more than DISPOSABLE_EMAIL_BLOOM_THRESHOLD
+# entries. An address matches when its domain or any parent domain is listed, so
+# x.mailinator.com is caught by mailinator.com. The file is checked for changes every
+# DISPOSABLE_EMAIL_RELOAD_INTERVAL seconds and reloaded in the background (see the
+# update_disposable_domains command). With DISPOSABLE_EMAIL_REMOTE_CHECK, domains missing from
+# the list are also asked about at open.kickbox.com in the background; the answers are cached
+# per domain and used from the next registration on.
+
+CACHE_KEY_PREFIX = "disposable-domain"
+BLOOM_ERROR_RATE = 0.001
+
+_lock = threading.Lock()
+_first_load_lock = threading.Lock()
+_domains = None
+_loaded_mtime = None
+_checked_at = None
+_reloading = False
+_pending = set()
+# Reloads and remote checks only wait on the disk or the network
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='disposable')
+
+
+class BloomFilter:
+    """
+    A set membership test in about 1.8 bytes per domain at a 0.1% false positive rate,
+    for lists too large to keep as a set of strings. Never misses a listed domain.
+    """
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, value):
+        # Double hashing: the k positions are h1 + i * h2
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(value))
+
+    def __len__(self):
+        return self.count
+
+
+def read_domains(path):
+    domains = set()
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            domain = line.split('#', 1)[0].strip().lower().rstrip('.')
+            if domain:
+                domains.add(domain)
+    return domains
+
+def load_domains(path, bloom_threshold):
+    """
+    The domains of a list file as a set, or as a BloomFilter when there are more than bloom_threshold.
+    """
+    domains = read_domains(path)
+    if bloom_threshold and len(domains) > bloom_threshold:
+        bloom = BloomFilter(len(domains))
+        for domain in domains:
+            bloom.add(domain)
+        return bloom
+    return frozenset(domains)
+
+def candidate_domains(domain):
+    """
+    The domain and its parents, without the bare top-level domain: a.b.example.com,
+    b.example.com, example.com.
+    """
+    labels = domain.split('.')
+    return ['.'.join(labels[i:]) for i in range(max(len(labels) - 1, 1))]
+
+def _load():
+    global _domains, _loaded_mtime, _reloading
+    path = settings.DISPOSABLE_EMAIL_DOMAINS_FILE
+    try:
+        mtime = os.path.getmtime(path)
+        if mtime != _loaded_mtime:
+            domains = load_domains(path, settings.DISPOSABLE_EMAIL_BLOOM_THRESHOLD)
+            with _lock:
+                _domains, _loaded_mtime = domains, mtime
+            logger.info("Loaded %s disposable domains from %s", len(domains), path)
+    except OSError as e:
+        # Keeps the last list that could be read
+        logger.warning("Could not read the disposable domain list %s: %s", path, e)
+    finally:
+        with _lock:
+            _reloading = False
+            if _domains is None:
+                _domains = frozenset()
+
+def get_domains():
+    """
+    The loaded list. The first call reads the file; later calls start a background reload
+    when DISPOSABLE_EMAIL_RELOAD_INTERVAL has passed, and return the current list meanwhile.
+    """
+    global _checked_at, _reloading
+    if _domains is None:
+        with _first_load_lock:
+            if _domains is None:
+                _checked_at = monotonic()
+                _load()
+        return _domains
+    with _lock:
+        due = not _reloading and monotonic() - _checked_at > settings.DISPOSABLE_EMAIL_RELOAD_INTERVAL
+        if due:
+            _reloading = True
+            _checked_at = monotonic()
+    if due:
+        _executor.submit(_load)
+    return _domains
+
+def remote_check(domain):
+    try:
+        res = http_get(f"https://open.kickbox.com/v1/disposable/{domain}")
+        res.raise_for_status()
+        disposable = bool(res.json().get("disposable", False))
+        cache.set(f"{CACHE_KEY_PREFIX}:{domain}", disposable, settings.DISPOSABLE_EMAIL_REMOTE_TTL)
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("Remote disposable check for %s failed: %s", domain, e)
+    finally:
+        with _lock:
+            _pending.discard(domain)
+
+def remote_answer(domain):
+    """
+    The cached remote answer for a domain, or None after starting a background check.
+    """
+    disposable = cache.get(f"{CACHE_KEY_PREFIX}:{domain}")
+    if disposable is None:
+        with _lock:
+            start = domain not in _pending
+            _pending.add(domain)
+        if start:
+            _executor.submit(remote_check, domain)
+    return disposable
+
+def is_disposable_email(email):
+    domain = email.rpartition('@')[2].strip().lower().rstrip('.')
+    if not domain:
+        return False
+    domains = get_domains()
+    if any(candidate in domains for candidate in candidate_domains(domain)):
+        return True
+    if settings.DISPOSABLE_EMAIL_REMOTE_CHECK:
+        return bool(remote_answer(domain))
+    return False
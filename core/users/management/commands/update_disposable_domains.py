@@ -0,0 +1,52 @@
+import os
+import tempfile
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.http_client import http_get
+from users.disposable import read_domains
+
+
+class Command(BaseCommand):
+    help = (
+        "Replaces the disposable email domain list (DISPOSABLE_EMAIL_DOMAINS_FILE) with one "
+        "downloaded from --url or copied from --file. Running servers pick it up within "
+        "DISPOSABLE_EMAIL_RELOAD_INTERVAL seconds; run it from cron to keep the list current."
+    )
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--url', help="A list with one domain per line")
+        source.add_argument('--file')
+        parser.add_argument('--min-domains', type=int, default=100,
+                            help="Refuse lists shorter than this, e.g. an error page")
+
+    def handle(self, *args, **options):
+        target = settings.DISPOSABLE_EMAIL_DOMAINS_FILE
+        if options['url']:
+            try:
+                res = http_get(options['url'])
+                res.raise_for_status()
+            except requests.RequestException as e:
+                raise CommandError(f"Download failed: {e}")
+            text = res.text
+        else:
+            try:
+                with open(options['file'], encoding='utf-8') as file:
+                    text = file.read()
+            except OSError as e:
+                raise CommandError(str(e))
+
+        # Written next to the target and renamed over it, so a reload never sees half a file
+        fd, path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                file.write(text)
+            count = len(read_domains(path))
+            if count < options['min_domains']:
+                raise CommandError(f"Only {count} domain(s) in the new list, keeping the current one")
+            os.replace(path, target)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        self.stdout.write(f"Wrote {count} domain(s) to {target}")
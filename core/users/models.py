@@ -262,6 +262,16 @@ class Subscription(models.Model):
             return True
         return False
 
+    def use_attempts(self, count):
+        # All or nothing in one UPDATE, for bulk scans
+        updated = (Subscription.objects
+                   .filter(pk=self.pk, attempts_left__gte=count)
+                   .update(attempts_left=F('attempts_left') - count))
+        if updated:
+            self.refresh_from_db(fields=['attempts_left'])
+            return True
+        return False
+
     # ---- Tool usage checks ----
     def _get_limit_for_tool(self, tool: ToolPage):
         # prefer monthly, fall back to yearly
@@ -4,7 +4,7 @@ from django.contrib.auth.password_validation import validate_password
 from .models import (
     Plan, Subscription, ScanFolder, PlanToolAccess, ToolPage
 )
-import requests
+from .disposable import is_disposable_email
 
 class RegisterSerializer(serializers.ModelSerializer):
     password2 = serializers.CharField(write_only=True)
@@ -17,21 +17,11 @@ class RegisterSerializer(serializers.ModelSerializer):
         if User.objects.filter(email=value).exists():
             raise serializers.ValidationError("A user with this email already exists.")
 
-        if self.is_temp_email(value):
+        if is_disposable_email(value):
             raise serializers.ValidationError("Temporary email addresses are not allowed.")
 
         return value
 
-    def is_temp_email(self, email):
-        try:
-            res = requests.get(f"https://open.kickbox.com/v1/disposable/{email}", timeout=5)
-            res.raise_for_status()
-            result = res.json()
-            return result.get("disposable", False)
-        except Exception as e:
-            print("⚠️ Failed to verify email:", e)
-            raise serializers.ValidationError("Could not validate email address. Try again later.")
-
     def validate(self, data):
         if data["password"] != data["password2"]:
             raise serializers.ValidationError("Passwords do not match.")
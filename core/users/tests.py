@@ -1,3 +1,80 @@
-from django.test import TestCase
+import os
+import tempfile
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from scanner.models import ScanResult
+from . import disposable
+from .disposable import BloomFilter, candidate_domains, load_domains
+from .models import ScanFolder
 
-# Create your tests here.
+
+class DisposableEmailTests(SimpleTestCase):
+    def domain_file(self, text):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as file:
+            file.write(text)
+        self.addCleanup(os.unlink, file.name)
+        return file.name
+
+    def test_bloom_filter_never_misses_and_rarely_matches_others(self):
+        listed = [f'listed{i}.example' for i in range(5000)]
+        bloom = BloomFilter(len(listed))
+        for domain in listed:
+            bloom.add(domain)
+        self.assertEqual(len(bloom), 5000)
+        self.assertTrue(all(domain in bloom for domain in listed))
+        false_positives = sum(f'other{i}.example' in bloom for i in range(20000))
+        self.assertLess(false_positives, 20000 * 0.005)
+
+    def test_large_lists_are_loaded_into_a_bloom_filter(self):
+        path = self.domain_file('# comment\nMailinator.com.\nguerrillamail.com  # inline\n\n')
+        self.assertEqual(load_domains(path, 10), frozenset({'mailinator.com', 'guerrillamail.com'}))
+        bloom = load_domains(path, 1)
+        self.assertIsInstance(bloom, BloomFilter)
+        self.assertIn('mailinator.com', bloom)
+
+    def test_candidate_domains(self):
+        self.assertEqual(candidate_domains('a.b.example.com'), ['a.b.example.com', 'b.example.com', 'example.com'])
+        self.assertEqual(candidate_domains('localhost'), ['localhost'])
+
+    def test_subdomains_of_listed_domains_match(self):
+        path = self.domain_file('mailinator.com\n')
+        with override_settings(DISPOSABLE_EMAIL_DOMAINS_FILE=path, DISPOSABLE_EMAIL_REMOTE_CHECK=False), \
+                mock.patch.multiple(disposable, _domains=None, _loaded_mtime=None):
+            self.assertTrue(disposable.is_disposable_email('x@MAILINATOR.com'))
+            self.assertTrue(disposable.is_disposable_email('x@inbox.mailinator.com'))
+            self.assertFalse(disposable.is_disposable_email('x@notmailinator.com'))
+            self.assertFalse(disposable.is_disposable_email('x@com'))
+
+
+class ScanFolderMoveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='owner')
+        self.other = User.objects.create(username='other')
+        self.scan = ScanResult.objects.create(user=self.user, scanner='nmap', command='nmap a.com', output='22/tcp open')
+        self.folder = ScanFolder.objects.create(user=self.user, name='prod')
+
+    def patch(self, scan, data, user=None):
+        token, _ = Token.objects.get_or_create(user=user or self.user)
+        return self.client.patch(f'/api/users/scans/{scan.pk}/', data, content_type='application/json',
+                                 HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_scan_is_moved_to_a_folder_and_back_out(self):
+        response = self.patch(self.scan, {'folder': self.folder.pk})
+        self.assertEqual(response.json(), {'id': self.scan.pk, 'folder': self.folder.pk})
+        self.assertEqual(ScanResult.objects.get(pk=self.scan.pk).folder, self.folder)
+        self.assertEqual(self.patch(self.scan, {'folder': None}).status_code, 200)
+        self.assertIsNone(ScanResult.objects.get(pk=self.scan.pk).folder_id)
+
+    def test_scans_and_folders_of_another_user_are_not_found(self):
+        other_folder = ScanFolder.objects.create(user=self.other, name='theirs')
+        self.assertEqual(self.patch(self.scan, {'folder': other_folder.pk}).status_code, 404)
+        self.assertEqual(self.patch(self.scan, {'folder': self.folder.pk}, user=self.other).status_code, 404)
+        self.assertIsNone(ScanResult.objects.get(pk=self.scan.pk).folder_id)
+
+    def test_invalid_requests_are_rejected(self):
+        self.assertEqual(self.patch(self.scan, {}).status_code, 400)
+        self.assertEqual(self.patch(self.scan, {'folder': 'prod'}).status_code, 400)
+        response = self.client.patch(f'/api/users/scans/{self.scan.pk}/', {'folder': None}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
@@ -9,6 +9,7 @@ from .views import (
     UserSubscriptionView,
     PlanListView,
     UserScanResultsView,
+    UserScanResultDetailView,
     ChangePlanView,
     ScanFolderViewSet,
     ActivateUserView,
@@ -34,6 +35,7 @@ urlpatterns = [
     path('plans/', PlanListView.as_view(), name='plans-list'),
 
     path('scans/', UserScanResultsView.as_view(), name='user-scans'),
+    path('scans/<int:pk>/', UserScanResultDetailView.as_view(), name='user-scan-detail'),
     path('change-plan/', ChangePlanView.as_view(), name='change-plan'),
     path('change-password/', ChangePasswordView.as_view(), name='change-password'),
 
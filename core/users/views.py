@@ -16,10 +16,9 @@ from django.contrib.sites.shortcuts import get_current_site
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+from django.db import transaction
+from main.outbox import queue_email, render_email
 from django.contrib.auth import update_session_auth_hash
-import requests
 
 from allauth.socialaccount.providers.google.views import GoogleOAuth2Adapter
 from allauth.socialaccount.providers.github.views import GitHubOAuth2Adapter
@@ -28,6 +27,9 @@ from dj_rest_auth.registration.views import SocialLoginView
 from allauth.socialaccount.providers.oauth2.client import OAuth2Client
 
 from scanner.models import ScanResult
+from scanner.enrichment import egress_fields, enrich_scans
+from scanner.registry import get_scanner
+from core.ratelimit import ratelimit, use_guest_scan
 
 
 class RegisterView(APIView):
@@ -36,28 +38,27 @@ class RegisterView(APIView):
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
-            user.is_active = False
-            user.save()
-
-            uid = urlsafe_base64_encode(force_bytes(user.pk))
-            token = default_token_generator.make_token(user)
-            domain = get_current_site(request).domain
-            activation_link = f"http://{domain}/api/users/activate/{uid}/{token}/"
-
-            subject = 'Confirm your email address'
-            from_email = 'noreply@yourdomain.com'
-            to_email = user.email
-
-            html_content = render_to_string('emails/activation_email.html', {
-                'activation_link': activation_link,
-                'username': user.username,
-            })
-            text_content = f'Click to activate your account: {activation_link}'
-
-            email = EmailMultiAlternatives(subject, text_content, from_email, [to_email])
-            email.attach_alternative(html_content, "text/html")
-            email.send()
+            with transaction.atomic():
+                user = serializer.save()
+                user.is_active = False
+                user.save()
+
+                uid = urlsafe_base64_encode(force_bytes(user.pk))
+                token = default_token_generator.make_token(user)
+                domain = get_current_site(request).domain
+                activation_link = f"http://{domain}/api/users/activate/{uid}/{token}/"
+
+                html_content = render_email('emails/activation_email.html', {
+                    'activation_link': activation_link,
+                    'username': user.username,
+                })
+                queue_email(
+                    'Confirm your email address',
+                    f'Click to activate your account: {activation_link}',
+                    [user.email],
+                    from_email='noreply@yourdomain.com',
+                    html_body=html_content,
+                )
 
             return Response({"message": "Registration successful. Check your email."}, status=201)
 
@@ -176,44 +177,9 @@ class PaypalWebhookView(APIView):
         return Response({"message": "Subscription updated", "created": created}, status=status.HTTP_200_OK)
 
 
-def get_public_ip():
-    try:
-        response = requests.get("https://api.ipify.org?format=json", timeout=5)
-        response.raise_for_status()
-        return response.json().get("ip")
-    except requests.RequestException as e:
-        print(f"❌ Error fetching public IP: {e}")
-        return None
-
-
-def get_ip_geoinfo(ip):
-    try:
-        print(f"🌐 Fetching geo info for IP: {ip}")
-        res = requests.get(f"https://ipwho.is/{ip}", timeout=5)
-        res.raise_for_status()
-        data = res.json()
-        if data.get("success"):
-            return data
-        else:
-            print(f"⚠️ ipwho.is failed: {data.get('message')}")
-            return {}
-    except Exception as e:
-        print("🌐 GeoIP fetch error:", e)
-        return {}
-
-
 class ScannerProxyView(APIView):
     permission_classes = [AllowAny]
 
-    @staticmethod
-    def get_client_ip(request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0].strip()
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
-
     def run_nmap_scan(self, request):
         import shlex, subprocess
 
@@ -231,7 +197,7 @@ class ScannerProxyView(APIView):
             args = shlex.split(command_line) if command_line else [target]
             if not is_command_safe(args):
                 return {"error": "Unsafe command detected"}, 400
-            cmd = ['wsl', 'nmap'] + args
+            cmd = get_scanner('nmap').argv(args)
             result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
             return {
                 "output": result.stdout,
@@ -242,6 +208,7 @@ class ScannerProxyView(APIView):
         except Exception as e:
             return {"error": str(e)}, 500
 
+    @ratelimit('scan', key='user_or_ip', algorithm='token_bucket')
     def post(self, request, slug):
         user = request.user if request.user.is_authenticated else None
 
@@ -255,11 +222,9 @@ class ScannerProxyView(APIView):
             except Subscription.DoesNotExist:
                 return Response({"error": "No active subscription found."}, status=403)
         else:
-            attempts_left = request.session.get("guest_attempts", 3)
-            if attempts_left <= 0:
+            allowed, attempts_left, _ = use_guest_scan(request)
+            if not allowed:
                 return Response({"error": "Guest limit exceeded. Please login or register."}, status=403)
-            request.session["guest_attempts"] = attempts_left - 1
-            request.session.modified = True
 
         if slug == "nmap":
             data, status_code = self.run_nmap_scan(request)
@@ -267,50 +232,17 @@ class ScannerProxyView(APIView):
         else:
             return Response({"error": f"Scanner '{slug}' not supported"}, status=400)
 
-        ip_address = get_public_ip()
-        if not ip_address:
-            ip_address = '8.8.8.8'
-        print(f"🌐 Real public IP: {ip_address}")
-
-        geo_info = get_ip_geoinfo(ip_address)
-
         try:
             scan = ScanResult.objects.create(
                 user=user,
                 scanner=slug,
                 command=request.data.get('command', '') or '',
                 output=output or '[no output]',
-                ip_address=ip_address,
                 mac_address=None,
-
-                country=geo_info.get("country"),
-                country_name=geo_info.get("country_name"),
-                country_code=geo_info.get("country_code"),
-                country_code_iso3=geo_info.get("country_code_iso3"),
-                country_capital=geo_info.get("country_capital"),
-                country_tld=geo_info.get("country_tld"),
-                country_calling_code=geo_info.get("country_calling_code"),
-                country_area=geo_info.get("country_area"),
-                country_population=geo_info.get("country_population"),
-
-                city=geo_info.get("city"),
-                region=geo_info.get("region"),
-                region_code=geo_info.get("region_code"),
-                continent_code=geo_info.get("continent_code"),
-
-                timezone=geo_info.get("timezone", {}).get("id"),
-                utc_offset=geo_info.get("utc_offset") or geo_info.get("timezone", {}).get("utc"),
-
-                currency=geo_info.get("currency"),
-                currency_name=geo_info.get("currency_name"),
-                languages=geo_info.get("languages"),
-
-                latitude=geo_info.get("latitude"),
-                longitude=geo_info.get("longitude"),
-
-                org=geo_info.get("org") or geo_info.get("connection", {}).get("org"),
-                asn=geo_info.get("asn") or geo_info.get("connection", {}).get("asn"),
+                # the server's IP and geo data, filled in after the response when not cached yet
+                **egress_fields(),
             )
+            enrich_scans([scan])
 
             print(f"✅ ScanResult saved: {scan.id}")
         except Exception as e:
@@ -344,16 +276,50 @@ class UserScanResultsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        scans = ScanResult.objects.filter(user=request.user).order_by('-created_at')
-        data = [
-            {
-                "id": s.id,
-                "scanner": s.scanner,
-                "output": s.output,
-                "created_at": s.created_at,
-            } for s in scans
-        ]
-        return Response(data)
+        # Output is compressed and can be large, the list only returns metadata (see UserScanResultDetailView)
+        scans = (ScanResult.objects
+                 .filter(user=request.user)
+                 .order_by('-created_at')
+                 .values('id', 'scanner', 'folder', 'output_size', 'output_preview', 'created_at'))
+        return Response(list(scans))
+
+
+class UserScanResultDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            scan = ScanResult.objects.get(pk=pk, user=request.user)
+        except ScanResult.DoesNotExist:
+            return Response({"detail": "Scan not found."}, status=404)
+        return Response({
+            "id": scan.id,
+            "scanner": scan.scanner,
+            "command": scan.command,
+            "output": scan.output,
+            "folder": scan.folder_id,
+            "created_at": scan.created_at,
+        })
+
+    def patch(self, request, pk):
+        # Moves the scan into one of the user's folders, {"folder": null} takes it out
+        if 'folder' not in request.data:
+            return Response({"detail": "folder is required."}, status=400)
+        try:
+            scan = ScanResult.objects.only('id', 'user_id', 'folder_id').get(pk=pk, user=request.user)
+        except ScanResult.DoesNotExist:
+            return Response({"detail": "Scan not found."}, status=404)
+        folder_id = request.data['folder']
+        if folder_id is not None:
+            try:
+                folder_id = int(folder_id)
+            except (TypeError, ValueError):
+                return Response({"detail": "folder must be a folder id or null."}, status=400)
+            if not ScanFolder.objects.filter(pk=folder_id, user=request.user).exists():
+                return Response({"detail": "Folder not found."}, status=404)
+        scan.folder_id = folder_id
+        scan.save(update_fields=['folder'])
+        return Response({"id": scan.id, "folder": scan.folder_id})
 
 class ScanFolderViewSet(viewsets.ModelViewSet):
     serializer_class = ScanFolderSerializer
@@ -393,19 +359,17 @@ class PasswordResetRequestView(APIView):
             token = default_token_generator.make_token(user)
             reset_link = f"http://localhost:3000/reset-password/{uid}/{token}/"
 
-            html_content = render_to_string("emails/password_reset_email.html", {
+            html_content = render_email("emails/password_reset_email.html", {
                 "reset_link": reset_link,
                 "username": user.username,
             })
-
-            email_message = EmailMultiAlternatives(
-                subject="Password Reset",
-                body="Use HTML version",
+            queue_email(
+                "Password Reset",
+                "Use HTML version",
+                [user.email],
                 from_email="armsoftdeveloper@gmail.com",
-                to=[user.email]
+                html_body=html_content,
             )
-            email_message.attach_alternative(html_content, "text/html")
-            email_message.send()
 
             return Response({"message": "Email sent."})
         except User.DoesNotExist: